@@ -0,0 +1,6 @@
+"""
+CodePilot agent support module.
+
+Model-side infrastructure for the agent loop in main.py, kept separate
+from the sandboxed tools in the functions module.
+"""
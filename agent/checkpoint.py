@@ -0,0 +1,138 @@
+"""
+Session checkpoints for the agent loop.
+
+After every iteration the conversation, the read-only tool result cache
+and the session's telemetry are written to a gzip-compressed JSON file, so
+a session that hit its iteration budget or whose process died can be
+resumed without repeating the model and tool calls it already paid for.
+"""
+
+import os
+import re
+import gzip
+import json
+import time
+import uuid
+from typing import List, Optional
+
+from .config import CHECKPOINT_DIR
+
+_SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+# Session still looping, finished with a final answer, stopped at the cap, or
+# ended by an error (resumable like the others)
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_MAX_ITERATIONS = "max_iterations"
+STATUS_FAILED = "failed"
+
+
+def new_session_id() -> str:
+    """Generate an id for a new session (sortable by start time)."""
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def checkpoint_path(session_id: str, directory: Optional[str] = None) -> str:
+    """Return the checkpoint file of ``session_id``.
+
+    Raises:
+        ValueError: If the id could escape the checkpoint directory.
+    """
+    if not _SESSION_ID_PATTERN.match(session_id):
+        raise ValueError(f"invalid session id {session_id!r}")
+    return os.path.join(directory or CHECKPOINT_DIR, f"{session_id}.json.gz")
+
+
+def dump_messages(messages: list) -> List[dict]:
+    """Convert google.genai Content messages into JSON-compatible dicts."""
+    return [message.model_dump(mode="json", exclude_none=True) for message in messages]
+
+
+def load_messages(data: List[dict]) -> list:
+    """Rebuild google.genai Content messages from ``dump_messages`` output."""
+    from google.genai import types
+
+    return [types.Content.model_validate(item) for item in data]
+
+
+class SessionCheckpoint:
+    """Serializable state of one agent session."""
+
+    def __init__(
+        self,
+        session_id: str,
+        prompt: str,
+        working_directory: str,
+        iteration: int = 0,
+        status: str = STATUS_RUNNING,
+        output: Optional[str] = None,
+        messages: Optional[List[dict]] = None,
+        tool_cache: Optional[List[list]] = None,
+        telemetry: Optional[dict] = None,
+        created_at: Optional[float] = None,
+        updated_at: Optional[float] = None,
+        overlay: Optional[str] = None,
+    ) -> None:
+        """Initialize the checkpoint.
+
+        Args:
+            session_id: Name of the session (see ``new_session_id``).
+            prompt: The prompt the session was started with.
+            working_directory: The session's sandbox root.
+            iteration: Model turns completed so far, across all runs.
+            status: One of the ``STATUS_*`` constants.
+            output: The final response text once the session completed.
+            messages: Conversation as returned by ``dump_messages``.
+            tool_cache: Tool result cache as returned by ``ToolResultCache.to_list``.
+            telemetry: The session's accumulated telemetry counters.
+            created_at: When the session started (epoch seconds).
+            updated_at: When the checkpoint was last written (epoch seconds).
+            overlay: What to do with the session's overlay workspace on
+                completion (``merge``, ``discard`` or ``keep``), or None if
+                the tools work on the working directory itself.
+        """
+        self.session_id = session_id
+        self.prompt = prompt
+        self.working_directory = working_directory
+        self.iteration = iteration
+        self.status = status
+        self.output = output
+        self.messages = messages or []
+        self.tool_cache = tool_cache or []
+        self.telemetry = telemetry or {}
+        self.created_at = created_at or time.time()
+        self.updated_at = updated_at or self.created_at
+        self.overlay = overlay
+
+    def to_dict(self) -> dict:
+        """Return the checkpoint as a JSON-compatible dict."""
+        return dict(vars(self))
+
+    def save(self, directory: Optional[str] = None) -> str:
+        """Atomically write the checkpoint and return its path."""
+        path = checkpoint_path(self.session_id, directory)
+        self.updated_at = time.time()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(self.to_dict(), f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, session_id: str, directory: Optional[str] = None) -> "SessionCheckpoint":
+        """Read the checkpoint of ``session_id``.
+
+        Raises:
+            FileNotFoundError: If the session has no checkpoint.
+            ValueError: If the id is invalid or the file is corrupt.
+        """
+        path = checkpoint_path(session_id, directory)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, EOFError, ValueError) as exc:
+            if isinstance(exc, FileNotFoundError):
+                raise
+            raise ValueError(f"corrupt checkpoint {path}: {exc}") from exc
+        return cls(**data)
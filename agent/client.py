@@ -0,0 +1,308 @@
+"""
+Resilient model client.
+
+Wraps the Gemini API client with exponential backoff and jitter for
+transient failures, honours server-provided retry delays, optionally sends
+a hedged duplicate request once a call runs past the observed p95 latency,
+and shares one pooled HTTP client per API key across sessions. Latencies
+are tracked per model for the whole process, so the p95 that hedging needs
+builds up across sessions (and the jobs a fleet worker runs).
+"""
+
+import re
+import time
+import random
+import logging
+import threading
+from functools import partial
+from collections import deque
+from email.utils import parsedate_to_datetime
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+import httpx
+from google import genai
+from google.genai import errors, types
+
+from .config import (
+    MODEL_BASE_URL,
+    MODEL_MAX_CONNECTIONS,
+    MODEL_MAX_RETRIES,
+    MODEL_BACKOFF_BASE_SECONDS,
+    MODEL_BACKOFF_MAX_SECONDS,
+    MODEL_MAX_RETRY_AFTER_SECONDS,
+    MODEL_HEDGE_MIN_SAMPLES,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+_clients: Dict[Tuple[str, Optional[str]], genai.Client] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key: str, base_url: Optional[str] = MODEL_BASE_URL) -> genai.Client:
+    """Return the shared API client for ``api_key``, creating it on first use.
+
+    Reusing one client keeps its HTTP connection pool warm across sessions
+    in the same process.
+
+    Args:
+        api_key: The Gemini API key.
+        base_url: Optional endpoint override.
+
+    Returns:
+        The shared client.
+    """
+    key = (api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            http_options = types.HttpOptions(
+                base_url=base_url,
+                client_args={
+                    "limits": httpx.Limits(
+                        max_connections=MODEL_MAX_CONNECTIONS,
+                        max_keepalive_connections=MODEL_MAX_CONNECTIONS,
+                    )
+                },
+            )
+            client = genai.Client(api_key=api_key, http_options=http_options)
+            _clients[key] = client
+        return client
+
+
+def _retry_after_seconds(exc: errors.APIError) -> Optional[float]:
+    """Extract the server-requested retry delay from an API error, if any.
+
+    Looks at the Retry-After header (seconds or HTTP date) and at the
+    google.rpc.RetryInfo detail Gemini includes in 429 bodies.
+    """
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    value = headers.get("retry-after") if hasattr(headers, "get") else None
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    details = exc.details if isinstance(exc.details, dict) else {}
+    for detail in details.get("error", details).get("details", []) or []:
+        if isinstance(detail, dict) and detail.get("@type", "").endswith("RetryInfo"):
+            match = re.fullmatch(r"([\d.]+)s", str(detail.get("retryDelay", "")))
+            if match:
+                return float(match.group(1))
+    return None
+
+
+def is_retryable(exc: Exception) -> bool:
+    """Check whether a failed model call is worth retrying."""
+    if isinstance(exc, errors.APIError):
+        return exc.code in RETRYABLE_STATUS_CODES
+    return isinstance(exc, httpx.TransportError)
+
+
+class LatencyTracker:
+    """Sliding window of call latencies used to decide when to hedge."""
+
+    def __init__(self, window: int = 200) -> None:
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        """Add one latency sample."""
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Return the latency at ``fraction`` (0-1), or None without samples."""
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+_latencies: Dict[str, LatencyTracker] = {}
+_latencies_lock = threading.Lock()
+
+
+def latency_tracker(model: str) -> LatencyTracker:
+    """Return the process-wide latency history of ``model``."""
+    with _latencies_lock:
+        tracker = _latencies.get(model)
+        if tracker is None:
+            tracker = _latencies[model] = LatencyTracker()
+        return tracker
+
+
+class ResilientModelClient:
+    """Model client with retries, rate-limit awareness and optional hedging."""
+
+    def __init__(
+        self,
+        client: genai.Client,
+        max_retries: int = MODEL_MAX_RETRIES,
+        backoff_base: float = MODEL_BACKOFF_BASE_SECONDS,
+        backoff_max: float = MODEL_BACKOFF_MAX_SECONDS,
+        hedge: bool = False,
+        sleep: Callable[[float], None] = time.sleep,
+        rate_limiter=None,
+    ) -> None:
+        """Initialize the client.
+
+        Args:
+            client: The underlying Gemini API client.
+            max_retries: Retries after the first attempt.
+            backoff_base: Initial backoff in seconds, doubled per attempt.
+            backoff_max: Upper bound for a single backoff.
+            hedge: Send a duplicate request when a call exceeds the model's
+                p95 latency; call ``close()`` when done with the client.
+            sleep: Sleep function, replaceable in tests.
+            rate_limiter: Optional object whose ``acquire()`` is called before
+                every attempt (including hedged duplicates), e.g. a
+                scheduler's SessionLimiter. If it has them, ``release()`` is
+                called when an attempt fails, ``record_discarded()`` when a
+                hedged duplicate's response goes unused, and
+                ``pause(seconds)`` on 429 responses.
+        """
+        self.client = client
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self._sleep = sleep
+        self.rate_limiter = rate_limiter
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for ``attempt`` (0-based)."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def call_with_retries(self, fn: Callable[[], T], admit: bool = True) -> T:
+        """Run ``fn``, retrying transient failures with backoff.
+
+        Args:
+            fn: The API call to make.
+            admit: Pass each attempt through the rate limiter; False when
+                ``fn`` admits its own calls.
+
+        Returns:
+            Whatever ``fn`` returns.
+
+        Raises:
+            Exception: The last error once retries are exhausted, or any
+                non-retryable error immediately.
+        """
+        attempt = 0
+        while True:
+            try:
+                return self._admitted(fn) if admit else fn()
+            except Exception as exc:
+                if attempt >= self.max_retries or not is_retryable(exc):
+                    raise
+                delay = self._backoff(attempt)
+                if isinstance(exc, errors.APIError):
+                    retry_after = _retry_after_seconds(exc)
+                    if retry_after is not None:
+                        if retry_after > MODEL_MAX_RETRY_AFTER_SECONDS:
+                            raise
+                        delay = retry_after + random.uniform(0, self.backoff_base)
+                if getattr(exc, "code", None) == 429 and hasattr(self.rate_limiter, "pause"):
+                    # Hold back every session sharing the quota, not just this one
+                    self.rate_limiter.pause(delay)
+                attempt += 1
+                logger.warning(
+                    "Model call failed (%s); retry %s/%s in %.2fs",
+                    exc,
+                    attempt,
+                    self.max_retries,
+                    delay,
+                )
+                self._sleep(delay)
+
+    def _admitted(self, fn: Callable[[], T]) -> T:
+        """Run ``fn`` once the rate limiter admits it, refunding it if it fails."""
+        if self.rate_limiter is None:
+            return fn()
+        self.rate_limiter.acquire()
+        succeeded = False
+        try:
+            result = fn()
+            succeeded = True
+            return result
+        finally:
+            if not succeeded and hasattr(self.rate_limiter, "release"):
+                self.rate_limiter.release()
+
+    @staticmethod
+    def _timed(fn: Callable[[], T], latency: LatencyTracker) -> T:
+        start = time.monotonic()
+        result = fn()
+        latency.record(time.monotonic() - start)
+        return result
+
+    def _hedged(self, fn: Callable[[], T], latency: LatencyTracker) -> T:
+        """Run ``fn`` and race a duplicate against it once it passes p95.
+
+        Both calls are admitted by the rate limiter; a call that fails is
+        refunded, and the loser is charged if it returns after the winner.
+        """
+        call = partial(self._admitted, partial(self._timed, fn, latency))
+        threshold = latency.percentile(0.95)
+        if threshold is None or len(latency) < MODEL_HEDGE_MIN_SAMPLES:
+            return call()
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hedge")
+        pending = {self._executor.submit(call)}
+        done, pending = wait(pending, timeout=threshold)
+        if not done:
+            logger.info("Model call exceeded p95 (%.2fs); sending hedged request", threshold)
+            # The duplicate is admitted and charged like any other call
+            pending.add(self._executor.submit(call))
+
+        error: Optional[BaseException] = None
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    for loser in (done | pending) - {future}:
+                        loser.add_done_callback(self._settle_discarded)
+                    return future.result()
+                error = future.exception()
+            if not pending:
+                raise error
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+    def _settle_discarded(self, future) -> None:
+        """Charge a losing hedged call whose response arrived after the winner's.
+
+        A loser that fails was already refunded by ``_admitted``.
+        """
+        if future.exception() is None and hasattr(self.rate_limiter, "record_discarded"):
+            self.rate_limiter.record_discarded()
+
+    def generate_content(self, **kwargs) -> types.GenerateContentResponse:
+        """Call ``models.generate_content`` with retries (and hedging if enabled)."""
+        def call() -> types.GenerateContentResponse:
+            return self.client.models.generate_content(**kwargs)
+
+        latency = latency_tracker(kwargs.get("model", ""))
+        if self.hedge:
+            return self.call_with_retries(lambda: self._hedged(call, latency), admit=False)
+        return self.call_with_retries(lambda: self._timed(call, latency))
+
+    def close(self) -> None:
+        """Shut down the hedging threads; calls still running finish first."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
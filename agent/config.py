@@ -0,0 +1,68 @@
+import os
+
+# Directory for state shared across sessions (cache handles, checkpoints, ...)
+STATE_DIR = os.environ.get("CODEPILOT_STATE_DIR") or os.path.join(
+    os.path.expanduser("~"), ".cache", "codepilot"
+)
+
+# Where session checkpoints are written after every agent-loop iteration
+CHECKPOINT_DIR = os.path.join(STATE_DIR, "sessions")
+
+# Model turns per run of the agent loop (a resumed session gets a fresh budget)
+MAX_ITERATIONS = 10
+
+# Lifetime of a cached prompt prefix on the model API
+PROMPT_CACHE_TTL_SECONDS = 3600
+
+# How long a failed cache creation is remembered before it is retried
+PROMPT_CACHE_NEGATIVE_TTL_SECONDS = 600
+
+# Override the model API endpoint (e.g. a local fake server for testing)
+MODEL_BASE_URL = os.environ.get("CODEPILOT_MODEL_BASE_URL")
+
+# Pooled HTTP connections kept open per API client
+MODEL_MAX_CONNECTIONS = 10
+
+# Retry policy for transient model API failures (429, 5xx, network errors)
+MODEL_MAX_RETRIES = 5
+MODEL_BACKOFF_BASE_SECONDS = 0.5
+MODEL_BACKOFF_MAX_SECONDS = 30
+
+# Longest server-requested Retry-After that is honoured before giving up
+MODEL_MAX_RETRY_AFTER_SECONDS = 120
+
+# Latency samples needed before hedged requests are sent at the p95 mark
+MODEL_HEDGE_MIN_SAMPLES = 20
+
+# Models used by the router: cheap/fast by default, strong on escalation
+FAST_MODEL = "models/gemini-2.0-flash-001"
+STRONG_MODEL = "models/gemini-2.5-pro"
+
+# Consecutive failed tool calls that escalate the next turn to the strong model
+ROUTING_ERROR_THRESHOLD = 2
+
+# USD per million (input, output) tokens, used for routing cost budgets
+MODEL_PRICES_PER_MILLION = {
+    "models/gemini-2.0-flash-001": (0.10, 0.40),
+    "models/gemini-2.5-pro": (1.25, 10.00),
+}
+
+# Shared admission state of the model-call scheduler, used by every process
+# that sets global request/token limits
+SCHEDULER_STATE_PATH = os.path.join(STATE_DIR, "scheduler.json")
+
+# Tokens reserved for a session's first call, before real counts are known
+SCHEDULER_DEFAULT_TOKEN_ESTIMATE = 4000
+
+# How often queued calls re-check their turn, and how long a waiter may go
+# without checking before it is considered dead and dropped from the queue
+SCHEDULER_POLL_SECONDS = 0.05
+SCHEDULER_STALE_WAITER_SECONDS = 30
+
+# Line format of the default (text) log output
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# High-frequency log events kept one in N times (warnings and errors are
+# never sampled). Events are named by a record's ``event`` field, else by
+# its logger; the agent tags ``tool_call`` and ``tool_result`` records.
+LOG_SAMPLE_EVERY = {"httpx": 10, "google_genai.models": 10}
@@ -0,0 +1,34 @@
+"""
+Exclusive locks on open files, shared by every process on the machine.
+
+The scheduler's state file and the prompt cache index are read, changed
+and written back by concurrent sessions; holding one of these locks
+around the read-modify-write keeps their updates from interleaving.
+"""
+
+import os
+
+if os.name == "nt":
+    import msvcrt
+
+    def lock_file(f) -> None:
+        """Block until this process holds the exclusive lock on ``f``."""
+        # msvcrt locks a byte range from the current position
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+    def unlock_file(f) -> None:
+        """Release the lock taken by ``lock_file``."""
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+else:
+    import fcntl
+
+    def lock_file(f) -> None:
+        """Block until this process holds the exclusive lock on ``f``."""
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def unlock_file(f) -> None:
+        """Release the lock taken by ``lock_file``."""
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
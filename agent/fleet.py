@@ -0,0 +1,199 @@
+"""
+Parallel agent runner over a fleet of workspaces.
+
+Runs a list of (workspace, prompt) jobs across a process pool, each with
+its own sandbox root. All workers admit model calls through one shared
+scheduler, reuse the same cached prompt prefix, and report per-job
+telemetry that is aggregated into a single results report.
+"""
+
+import os
+import json
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+from .config import SCHEDULER_STATE_PATH
+from .logs import configure_logging, flush_logging, logging_settings
+from .scheduler import ModelScheduler
+
+logger = logging.getLogger(__name__)
+
+# Set in each worker process by _init_worker
+_worker_scheduler: Optional[ModelScheduler] = None
+_worker_session_limits: dict = {}
+
+
+def load_jobs(path: str) -> List[Dict[str, str]]:
+    """Load jobs from a JSON list or a JSON-lines file.
+
+    Each job needs ``workspace`` and ``prompt``; ``id`` defaults to the
+    job's position in the file.
+
+    Args:
+        path: Path to the jobs file.
+
+    Returns:
+        The validated jobs.
+
+    Raises:
+        ValueError: If a job is missing a field or its workspace does not exist.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    stripped = text.lstrip()
+    if stripped.startswith("["):
+        raw_jobs = json.loads(stripped)
+    else:
+        raw_jobs = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    jobs = []
+    for index, job in enumerate(raw_jobs):
+        if not job.get("workspace") or not job.get("prompt"):
+            raise ValueError(f"job {index} needs both 'workspace' and 'prompt'")
+        workspace = os.path.abspath(job["workspace"])
+        if not os.path.isdir(workspace):
+            raise ValueError(f"job {index}: workspace {job['workspace']!r} is not a directory")
+        job_id = str(job.get("id", index))
+        jobs.append({"id": job_id, "workspace": workspace, "prompt": job["prompt"]})
+    return jobs
+
+
+def _init_worker(
+    scheduler: Optional[ModelScheduler], session_limits: dict, log_settings: Optional[dict]
+) -> None:
+    global _worker_scheduler, _worker_session_limits
+    if log_settings is not None:
+        # A forked worker inherits the queue handler but not its writer thread
+        configure_logging(**log_settings)
+    _worker_scheduler = scheduler
+    _worker_session_limits = session_limits
+
+
+def _run_job(
+    session_fn: Callable[..., str], job: Dict[str, str], api_key: str, options: dict
+) -> dict:
+    """Run one job in a worker process and return its result record."""
+    telemetry: dict = {}
+    started = time.monotonic()
+    record = {"id": job["id"], "workspace": job["workspace"]}
+    limiter = None
+    if _worker_scheduler is not None:
+        limiter = _worker_scheduler.session(f"job-{job['id']}", **_worker_session_limits)
+    try:
+        output = session_fn(
+            job["prompt"],
+            api_key,
+            working_directory=job["workspace"],
+            rate_limiter=limiter,
+            telemetry=telemetry,
+            **options,
+        )
+        record.update(status="ok", output=output)
+    except Exception as exc:  # noqa: BLE001 - one job failing must not stop the fleet
+        record.update(status="error", error=str(exc))
+    finally:
+        # Workers exit through os._exit, skipping the atexit flush of the log
+        # writer, so each job's records are written before its result returns
+        flush_logging()
+    record["duration_seconds"] = round(time.monotonic() - started, 3)
+    record.update(telemetry)
+    return record
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(results: List[dict], wall_seconds: float) -> dict:
+    """Aggregate per-job records into fleet-level telemetry."""
+    durations = [r["duration_seconds"] for r in results]
+    return {
+        "jobs": len(results),
+        "succeeded": sum(r["status"] == "ok" for r in results),
+        "failed": sum(r["status"] != "ok" for r in results),
+        "wall_seconds": round(wall_seconds, 3),
+        "job_seconds_p50": _percentile(durations, 0.5),
+        "job_seconds_p95": _percentile(durations, 0.95),
+        "iterations": sum(r.get("iterations", 0) for r in results),
+        "tool_calls": sum(r.get("tool_calls", 0) for r in results),
+        "prompt_tokens": sum(r.get("prompt_tokens", 0) for r in results),
+        "response_tokens": sum(r.get("response_tokens", 0) for r in results),
+        "queued_seconds": round(
+            sum(r.get("scheduler", {}).get("queued_seconds", 0) for r in results), 3
+        ),
+    }
+
+
+def run_fleet(
+    jobs: List[Dict[str, str]],
+    session_fn: Callable[..., str],
+    api_key: str,
+    workers: Optional[int] = None,
+    requests_per_minute: Optional[float] = None,
+    options: Optional[dict] = None,
+    tokens_per_minute: Optional[float] = None,
+    session_limits: Optional[dict] = None,
+) -> dict:
+    """Run every job across a process pool.
+
+    Args:
+        jobs: Jobs as returned by ``load_jobs``.
+        session_fn: The agent session function (``generate_gemini_response``);
+            it must accept ``working_directory``, ``rate_limiter`` and
+            ``telemetry`` keyword arguments.
+        api_key: The Gemini API key.
+        workers: Pool size; defaults to the CPU count.
+        requests_per_minute: Global model-call budget shared by all workers.
+        options: Extra keyword arguments for every session.
+        tokens_per_minute: Global token budget shared by all workers.
+        session_limits: Per-job limits (``ModelScheduler.session`` keyword
+            arguments, e.g. ``token_budget``).
+
+    Returns:
+        ``{"summary": {...}, "results": [...]}`` with results in job order.
+    """
+    options = dict(options or {})
+    session_limits = dict(session_limits or {})
+    scheduler = None
+    if requests_per_minute or tokens_per_minute or session_limits:
+        # File-backed so that every worker (and other local runs) share one queue
+        scheduler = ModelScheduler(
+            requests_per_minute, tokens_per_minute, state_path=SCHEDULER_STATE_PATH
+        )
+    started = time.monotonic()
+    results: Dict[int, dict] = {}
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(scheduler, session_limits, logging_settings()),
+    ) as pool:
+        futures = {
+            pool.submit(_run_job, session_fn, job, api_key, options): index
+            for index, job in enumerate(jobs)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            job = jobs[index]
+            try:
+                record = future.result()
+            except Exception as exc:  # the worker process itself died
+                record = {
+                    "id": job["id"],
+                    "workspace": job["workspace"],
+                    "status": "error",
+                    "error": str(exc),
+                    "duration_seconds": 0.0,
+                }
+            results[index] = record
+            logger.info(
+                "Job %s finished: %s (%d/%d)", job["id"], record["status"], len(results), len(jobs)
+            )
+
+    ordered = [results[index] for index in range(len(jobs))]
+    return {"summary": summarize(ordered, time.monotonic() - started), "results": ordered}
@@ -0,0 +1,163 @@
+"""
+Off-thread, structured logging for the CLI.
+
+The agent loop logs every model turn and tool call. ``configure_logging``
+routes all records through an in-process queue to a listener thread that
+formats and writes them, so the loop only pays for creating a record.
+Records keep their %-style arguments until the listener formats them, and
+high-frequency events can be sampled. Output is the classic text format or
+one JSON object per line, including any fields passed with ``extra=``.
+"""
+
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, TextIO
+from .config import LOG_FORMAT, LOG_SAMPLE_EVERY
+
+# Attributes every LogRecord has; anything else was passed with ``extra=``
+_RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+_settings: Optional[dict] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single-line JSON objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES:
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps one in N records of each high-frequency event.
+
+    Records at WARNING and above always pass. Kept records of a sampled
+    event get a ``sampled`` field holding N, so that counts can be
+    reweighted.
+    """
+
+    def __init__(self, every: Dict[str, int]) -> None:
+        """Initialize the filter.
+
+        Args:
+            every: Maps an event (a record's ``event`` field, else its logger
+                name) to N; events not listed are never sampled.
+        """
+        super().__init__()
+        self.every = {event: n for event, n in every.items() if n > 1}
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.every:
+            return True
+        event = getattr(record, "event", record.name)
+        every = self.every.get(event)
+        if every is None:
+            return True
+        with self._lock:
+            seen = self._seen.get(event, 0)
+            self._seen[event] = seen + 1
+        if seen % every:
+            return False
+        record.sampled = every
+        return True
+
+
+class _InProcessQueueHandler(QueueHandler):
+    """Enqueues records as they are, leaving all formatting to the listener.
+
+    The stock handler formats each record on the logging thread so that it
+    can be pickled; this queue never leaves the process, so the record's
+    arguments are formatted later instead. Arguments must therefore not be
+    mutated after logging.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def configure_logging(
+    level: int = logging.INFO,
+    json_format: bool = False,
+    sample_every: Optional[Dict[str, int]] = None,
+    stream: Optional[TextIO] = None,
+) -> QueueListener:
+    """Send all log records through a queue to a background writer.
+
+    Replaces the root logger's handlers; calling it again replaces the
+    previous configuration. The listener is stopped, flushing queued
+    records, when the interpreter exits normally; see ``flush_logging``.
+
+    Args:
+        level: Root logger level.
+        json_format: Write JSON lines instead of the text format.
+        sample_every: Sampling rates per event (see SamplingFilter);
+            defaults to ``LOG_SAMPLE_EVERY``.
+        stream: Where to write; defaults to stderr.
+
+    Returns:
+        The running QueueListener.
+    """
+    global _listener, _settings
+    stop_logging()
+    sample_every = LOG_SAMPLE_EVERY if sample_every is None else sample_every
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT))
+
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = _InProcessQueueHandler(records)
+    handler.addFilter(SamplingFilter(sample_every))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+    _listener = QueueListener(records, output)
+    _listener.start()
+    if _settings is None:
+        atexit.register(stop_logging)
+    _settings = {"level": level, "json_format": json_format, "sample_every": dict(sample_every)}
+    return _listener
+
+
+def stop_logging() -> None:
+    """Stop the background writer after it has written all queued records."""
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
+
+
+def flush_logging() -> None:
+    """Write every queued record now, then keep writing in the background.
+
+    For processes that may exit without running atexit handlers, such as
+    process-pool workers, which leave through ``os._exit``.
+    """
+    if _listener is not None:
+        _listener.stop()
+        _listener.start()
+
+
+def logging_settings() -> Optional[dict]:
+    """Return the arguments of the last ``configure_logging`` call (for child processes)."""
+    return dict(_settings) if _settings is not None else None
@@ -0,0 +1,221 @@
+"""
+Context caching for the stable prompt prefix.
+
+The system prompt, tool declarations and any pinned repository files are
+identical on every turn of a session (and across sessions), so they are
+uploaded once as cached content and referenced by handle afterwards.
+Handles are tracked in a small JSON index so later sessions can reuse them
+until their TTL runs out; the index is shared by concurrent sessions, so
+updates to it are made under a file lock.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+from google import genai
+from google.genai import errors, types
+
+from .config import (
+    STATE_DIR,
+    PROMPT_CACHE_TTL_SECONDS,
+    PROMPT_CACHE_NEGATIVE_TTL_SECONDS,
+)
+from .filelock import lock_file, unlock_file
+
+logger = logging.getLogger(__name__)
+
+# Handles this close to expiry are refreshed before use
+_REFRESH_MARGIN_SECONDS = 60
+
+
+def is_cache_miss(exc: BaseException) -> bool:
+    """Check whether a request failed because its cached content is gone.
+
+    The API rejects a request naming an expired or deleted cache with a
+    client error about the cached content; any other failure (quota,
+    server errors, budgets) says nothing about the handle.
+    """
+    if not isinstance(exc, errors.ClientError) or exc.code not in (400, 403, 404):
+        return False
+    message = f"{exc.message or ''} {exc}".lower().replace("_", "").replace(" ", "")
+    return "cachedcontent" in message
+
+
+class PromptPrefix:
+    """The part of every request that does not change between turns."""
+
+    def __init__(
+        self,
+        system_prompt: str,
+        tools: List[types.Tool],
+        pinned_files: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """Initialize the prefix.
+
+        Args:
+            system_prompt: The system instruction.
+            tools: Tool declarations offered to the model.
+            pinned_files: Mapping of relative path to file content that
+                should be part of the cached context.
+        """
+        self.system_prompt = system_prompt
+        self.tools = tools
+        self.pinned_files = pinned_files or {}
+
+    @property
+    def contents(self) -> List[types.Content]:
+        """Pinned files as leading conversation contents."""
+        if not self.pinned_files:
+            return []
+        parts = [
+            types.Part(text=f'Pinned file "{path}":\n{content}')
+            for path, content in sorted(self.pinned_files.items())
+        ]
+        return [types.Content(role="user", parts=parts)]
+
+    def cache_key(self, model: str) -> str:
+        """Return a digest identifying this prefix for ``model``."""
+        digest = hashlib.sha256()
+        digest.update(model.encode("utf-8"))
+        digest.update(self.system_prompt.encode("utf-8"))
+        for tool in self.tools:
+            digest.update(tool.model_dump_json(exclude_none=True).encode("utf-8"))
+        for path, content in sorted(self.pinned_files.items()):
+            digest.update(path.encode("utf-8"))
+            digest.update(content.encode("utf-8"))
+        return digest.hexdigest()
+
+    def generate_config(self, cache_name: Optional[str]) -> types.GenerateContentConfig:
+        """Build the request config, referencing the cache when there is one."""
+        if cache_name:
+            return types.GenerateContentConfig(cached_content=cache_name)
+        return types.GenerateContentConfig(
+            system_instruction=self.system_prompt,
+            tools=self.tools,
+        )
+
+    def request_contents(
+        self, cache_name: Optional[str], messages: List[types.Content]
+    ) -> List[types.Content]:
+        """Return the contents to send; pinned files are inlined when uncached."""
+        if cache_name:
+            return messages
+        return self.contents + messages
+
+
+class PromptCache:
+    """Creates, reuses and refreshes cached-content handles for prompt prefixes."""
+
+    def __init__(
+        self,
+        client: genai.Client,
+        ttl_seconds: int = PROMPT_CACHE_TTL_SECONDS,
+        index_path: Optional[str] = None,
+    ) -> None:
+        """Initialize the cache manager.
+
+        Args:
+            client: The Gemini API client.
+            ttl_seconds: Lifetime requested for new or refreshed handles.
+            index_path: JSON file tracking handles across sessions.
+        """
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.index_path = index_path or os.path.join(STATE_DIR, "prompt_cache.json")
+
+    def _load_index(self) -> Dict[str, dict]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _store(self, key: str, entry: dict) -> None:
+        """Persist one index entry, dropping expired ones on the way.
+
+        The read-modify-write happens under an exclusive lock on a sidecar
+        file, and the new index replaces the old one atomically, so
+        concurrent sessions neither lose entries nor read a partial file.
+        """
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        with open(f"{self.index_path}.lock", "a+b") as lock:
+            lock_file(lock)
+            try:
+                now = time.time()
+                index = {
+                    k: v for k, v in self._load_index().items() if v.get("expire_time", 0) > now
+                }
+                index[key] = entry
+                tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(index, f)
+                os.replace(tmp_path, self.index_path)
+            finally:
+                unlock_file(lock)
+
+    @staticmethod
+    def _expire_time(cached: types.CachedContent, fallback: float) -> float:
+        expire_time = getattr(cached, "expire_time", None)
+        return expire_time.timestamp() if expire_time else fallback
+
+    def get_or_create(self, model: str, prefix: PromptPrefix) -> Optional[str]:
+        """Return a cache handle for ``prefix``, creating one if needed.
+
+        Args:
+            model: The model the handle is created for.
+            prefix: The stable prompt prefix.
+
+        Returns:
+            The cached-content name, or None when caching is unavailable
+            (for example when the prefix is below the API's minimum size).
+        """
+        key = prefix.cache_key(model)
+        entry = self._load_index().get(key)
+        now = time.time()
+
+        if entry and entry.get("expire_time", 0) > now:
+            name = entry.get("name")
+            if not name:
+                return None
+            if entry["expire_time"] - now > _REFRESH_MARGIN_SECONDS:
+                return name
+            try:
+                cached = self.client.caches.update(
+                    name=name,
+                    config=types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s"),
+                )
+                expire_time = self._expire_time(cached, now + self.ttl_seconds)
+                self._store(key, {"name": name, "model": model, "expire_time": expire_time})
+                return name
+            except Exception as exc:
+                logger.debug("Failed to refresh prompt cache %s: %s", name, exc)
+
+        try:
+            cached = self.client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    display_name=f"codepilot-{key[:12]}",
+                    system_instruction=prefix.system_prompt,
+                    tools=prefix.tools,
+                    contents=prefix.contents or None,
+                    ttl=f"{self.ttl_seconds}s",
+                ),
+            )
+        except Exception as exc:
+            logger.debug("Prompt caching unavailable: %s", exc)
+            retry_at = now + PROMPT_CACHE_NEGATIVE_TTL_SECONDS
+            self._store(key, {"name": None, "expire_time": retry_at})
+            return None
+
+        expire_time = self._expire_time(cached, now + self.ttl_seconds)
+        self._store(key, {"name": cached.name, "model": model, "expire_time": expire_time})
+        logger.info("Created prompt cache %s", cached.name)
+        return cached.name
+
+    def invalidate(self, model: str, prefix: PromptPrefix) -> None:
+        """Forget the handle for ``prefix`` (e.g. after the API rejected it)."""
+        self._store(prefix.cache_key(model), {"name": None, "expire_time": 0})
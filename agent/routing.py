@@ -0,0 +1,139 @@
+"""
+Per-turn model routing.
+
+Most turns of the agent loop are simple tool dispatch and go to the fast,
+cheap model. The router escalates to the strong model when tool calls keep
+failing, and stays on the fast model whenever the session's cost or
+latency budget would not allow the escalation.
+"""
+
+import logging
+from typing import Dict, List, Optional
+
+from functions.registry import is_failure
+
+from .config import (
+    FAST_MODEL,
+    STRONG_MODEL,
+    ROUTING_ERROR_THRESHOLD,
+    MODEL_PRICES_PER_MILLION,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_cost(
+    model: str, prompt_tokens: Optional[int], response_tokens: Optional[int]
+) -> float:
+    """Estimate the USD cost of one call from its token counts."""
+    input_price, output_price = MODEL_PRICES_PER_MILLION.get(model, (0.0, 0.0))
+    return ((prompt_tokens or 0) * input_price + (response_tokens or 0) * output_price) / 1e6
+
+
+class ModelRouter:
+    """Picks the model for each turn of the agent loop."""
+
+    def __init__(
+        self,
+        fast_model: str = FAST_MODEL,
+        strong_model: Optional[str] = STRONG_MODEL,
+        error_threshold: int = ROUTING_ERROR_THRESHOLD,
+        cost_budget: Optional[float] = None,
+        latency_budget: Optional[float] = None,
+    ) -> None:
+        """Initialize the router.
+
+        Args:
+            fast_model: Model for ordinary tool-dispatch turns.
+            strong_model: Model to escalate to, or None to never escalate.
+            error_threshold: Consecutive failed tool calls that trigger escalation.
+            cost_budget: Session budget in USD; escalation stops once the
+                estimated spend reaches it.
+            latency_budget: Seconds a turn may take; a model whose average
+                latency exceeds it is not escalated to.
+        """
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.error_threshold = error_threshold
+        self.cost_budget = cost_budget
+        self.latency_budget = latency_budget
+        self.error_streak = 0
+        self.spent = 0.0
+        self._latencies: Dict[str, List[float]] = {}
+
+    def _average_latency(self, model: str) -> Optional[float]:
+        samples = self._latencies.get(model)
+        return sum(samples) / len(samples) if samples else None
+
+    def choose(self, turn: int) -> str:
+        """Return the model to use for ``turn`` and log why.
+
+        Args:
+            turn: The 1-based iteration number of the agent loop.
+
+        Returns:
+            The model name.
+        """
+        if not self.strong_model or self.strong_model == self.fast_model:
+            return self.fast_model
+
+        if self.error_streak < self.error_threshold:
+            logger.debug("Routing turn %s to %s (tool dispatch)", turn, self.fast_model)
+            return self.fast_model
+
+        reason = f"{self.error_streak} consecutive tool errors"
+        if self.cost_budget is not None and self.spent >= self.cost_budget:
+            logger.info(
+                "Routing turn %s to %s: %s, but cost budget $%.4f is spent ($%.4f)",
+                turn,
+                self.fast_model,
+                reason,
+                self.cost_budget,
+                self.spent,
+            )
+            return self.fast_model
+        strong_latency = self._average_latency(self.strong_model)
+        if (
+            self.latency_budget is not None
+            and strong_latency is not None
+            and strong_latency > self.latency_budget
+        ):
+            logger.info(
+                "Routing turn %s to %s: %s, but %s averages %.2fs over the %.2fs budget",
+                turn,
+                self.fast_model,
+                reason,
+                self.strong_model,
+                strong_latency,
+                self.latency_budget,
+            )
+            return self.fast_model
+
+        logger.info("Routing turn %s to %s (%s)", turn, self.strong_model, reason)
+        return self.strong_model
+
+    def record_response(
+        self,
+        model: str,
+        latency: float,
+        prompt_tokens: Optional[int],
+        response_tokens: Optional[int],
+    ) -> None:
+        """Account for a completed model call.
+
+        Args:
+            model: The model that served the call.
+            latency: Wall-clock seconds the call took.
+            prompt_tokens: Prompt token count, if reported.
+            response_tokens: Response token count, if reported.
+        """
+        self._latencies.setdefault(model, []).append(latency)
+        self.spent += estimate_cost(model, prompt_tokens, response_tokens)
+
+    def record_tool_result(self, function_name: str, result: str) -> None:
+        """Update the failure streak with the outcome of a tool call."""
+        if is_failure(result):
+            self.error_streak += 1
+            logger.debug("Tool %s failed; error streak %s", function_name, self.error_streak)
+        else:
+            self.error_streak = 0
@@ -0,0 +1,423 @@
+"""
+Admission scheduler for model calls.
+
+Model calls are admitted against requests-per-minute and tokens-per-minute
+token buckets, both globally and per session, so that concurrent sessions
+queue for quota instead of running into cascading 429s. Queued calls are
+served by priority, then fair share (the session that used the fewest
+tokens recently goes first), then arrival order. Global state lives in
+memory for a single process or in a lock-protected state file shared by
+every process on the machine.
+
+Token usage is not known until a response arrives, so each call reserves
+an estimate (the session's previous call) that is settled with the real
+counts from ``extract_response_token_counts`` afterwards. Reservations
+count against a session's total token budget, so a call is refused up
+front rather than allowed to overrun it.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from .config import (
+    SCHEDULER_DEFAULT_TOKEN_ESTIMATE,
+    SCHEDULER_POLL_SECONDS,
+    SCHEDULER_STALE_WAITER_SECONDS,
+)
+from .filelock import lock_file, unlock_file
+
+logger = logging.getLogger(__name__)
+
+# Half-life of the recent usage that fair sharing compares, in seconds
+_USAGE_HALF_LIFE_SECONDS = 60.0
+
+
+class TokenBudgetExceeded(RuntimeError):
+    """Raised when a session has used up its total token budget."""
+
+
+def _refill(state: dict, name: str, per_minute: Optional[float], now: float) -> Optional[dict]:
+    """Bring the bucket ``state[name]`` up to date and return it (None if unlimited)."""
+    if not per_minute:
+        return None
+    bucket = state.setdefault(name, {"level": per_minute, "updated": now})
+    elapsed = max(0.0, now - bucket["updated"])
+    bucket["level"] = min(per_minute, bucket["level"] + elapsed * per_minute / 60.0)
+    bucket["updated"] = now
+    return bucket
+
+
+def _seconds_until(bucket: Optional[dict], per_minute: Optional[float], amount: float) -> float:
+    """Seconds until ``bucket`` holds ``amount`` (0 if it already does)."""
+    if bucket is None or bucket["level"] >= amount:
+        return 0.0
+    return (amount - bucket["level"]) * 60.0 / per_minute
+
+
+class _MemoryState:
+    """Scheduler state shared by the threads of one process."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._state: dict = {}
+
+    @contextmanager
+    def transaction(self) -> Iterator[dict]:
+        with self._lock:
+            yield self._state
+
+
+class _FileState:
+    """Scheduler state in a JSON file shared by every process on the machine."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # Locks cannot be pickled; each process gets its own
+        return {"path": self.path}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["path"])
+
+    @contextmanager
+    def transaction(self) -> Iterator[dict]:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            with os.fdopen(fd, "r+b") as f:
+                lock_file(f)
+                try:
+                    raw = f.read()
+                    try:
+                        state = json.loads(raw) if raw else {}
+                    except ValueError:
+                        state = {}
+                    yield state
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state, separators=(",", ":")).encode("utf-8"))
+                    f.flush()
+                finally:
+                    unlock_file(f)
+
+
+class ModelScheduler:
+    """Global request/token budgets and the queue of calls waiting for them."""
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        state_path: Optional[str] = None,
+        poll_seconds: float = SCHEDULER_POLL_SECONDS,
+        stale_seconds: float = SCHEDULER_STALE_WAITER_SECONDS,
+    ) -> None:
+        """Initialize the scheduler.
+
+        Args:
+            requests_per_minute: Model calls admitted per minute overall.
+            tokens_per_minute: Prompt plus response tokens admitted per minute.
+            state_path: Share the budgets and queue with other processes
+                through this file; in-process only when omitted.
+            poll_seconds: How often queued calls re-check their turn.
+            stale_seconds: Waiters silent for longer are dropped as dead.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.poll_seconds = poll_seconds
+        self.stale_seconds = stale_seconds
+        self._state = _FileState(state_path) if state_path else _MemoryState()
+
+    def session(
+        self,
+        session_id: str,
+        priority: int = 0,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        token_budget: Optional[int] = None,
+    ) -> "SessionLimiter":
+        """Create the limiter one session passes to its model client.
+
+        Args:
+            session_id: Identifies the session for fair sharing.
+            priority: Queue priority; lower values are admitted first.
+            requests_per_minute: The session's own request limit.
+            tokens_per_minute: The session's own token limit.
+            token_budget: Total tokens the session may use.
+        """
+        return SessionLimiter(
+            self, session_id, priority, requests_per_minute, tokens_per_minute, token_budget
+        )
+
+    def _usage(self, state: dict, session_id: str, now: float) -> float:
+        """Return the decayed recent token usage of a session."""
+        entry = state.get("usage", {}).get(session_id)
+        if entry is None:
+            return 0.0
+        tokens, updated = entry
+        return tokens * 0.5 ** ((now - updated) / _USAGE_HALF_LIFE_SECONDS)
+
+    def _add_usage(self, state: dict, session_id: str, tokens: float, now: float) -> None:
+        usage = state.setdefault("usage", {})
+        usage[session_id] = [max(0.0, self._usage(state, session_id, now) + tokens), now]
+        # Forget sessions whose usage has decayed away
+        for key in [k for k, (_, t) in usage.items() if now - t > 10 * _USAGE_HALF_LIFE_SECONDS]:
+            del usage[key]
+
+    def admit(self, ticket: str, session_id: str, priority: int, tokens: float) -> float:
+        """Try to admit one call, joining the queue if it has to wait.
+
+        Args:
+            ticket: Unique id of the waiting call.
+            session_id: The calling session.
+            priority: Queue priority; lower values go first.
+            tokens: Tokens to reserve for the call.
+
+        Returns:
+            0 if the call was admitted, otherwise seconds to wait before
+            trying again.
+        """
+        now = time.time()
+        with self._state.transaction() as state:
+            waiting: Dict[str, dict] = state.setdefault("waiting", {})
+            for key in [k for k, w in waiting.items() if now - w["seen"] > self.stale_seconds]:
+                del waiting[key]
+            if ticket not in waiting:
+                state["seq"] = state.get("seq", 0) + 1
+                waiting[ticket] = {"session": session_id, "priority": priority, "seq": state["seq"]}
+            waiting[ticket]["seen"] = now
+
+            head = min(
+                waiting,
+                key=lambda k: (
+                    waiting[k]["priority"],
+                    self._usage(state, waiting[k]["session"], now),
+                    waiting[k]["seq"],
+                ),
+            )
+            if head != ticket:
+                return self.poll_seconds
+
+            paused = state.get("paused_until", 0) - now
+            requests = _refill(state, "requests", self.requests_per_minute, now)
+            token_bucket = _refill(state, "tokens", self.tokens_per_minute, now)
+            if self.tokens_per_minute:
+                tokens = min(tokens, self.tokens_per_minute)
+            delay = max(
+                paused,
+                _seconds_until(requests, self.requests_per_minute, 1),
+                _seconds_until(token_bucket, self.tokens_per_minute, tokens),
+            )
+            if delay > 0:
+                return min(delay, max(self.poll_seconds, 1.0))
+
+            if requests is not None:
+                requests["level"] -= 1
+            if token_bucket is not None:
+                token_bucket["level"] -= tokens
+            self._add_usage(state, session_id, tokens, now)
+            del waiting[ticket]
+            return 0.0
+
+    def leave(self, ticket: str) -> None:
+        """Remove a call that gave up waiting from the queue."""
+        with self._state.transaction() as state:
+            state.get("waiting", {}).pop(ticket, None)
+
+    def charge(self, session_id: str, tokens: float) -> None:
+        """Settle a reservation: charge extra tokens, or refund with a negative count."""
+        if not tokens:
+            return
+        now = time.time()
+        with self._state.transaction() as state:
+            bucket = _refill(state, "tokens", self.tokens_per_minute, now)
+            if bucket is not None:
+                bucket["level"] = min(self.tokens_per_minute, bucket["level"] - tokens)
+            self._add_usage(state, session_id, tokens, now)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every admission after the API reported a rate limit."""
+        with self._state.transaction() as state:
+            state["paused_until"] = max(state.get("paused_until", 0), time.time() + seconds)
+
+
+class SessionLimiter:
+    """Per-session limits in front of a ModelScheduler.
+
+    Passed to ResilientModelClient as its ``rate_limiter``: ``acquire()``
+    reserves the estimated tokens of a call before every attempt,
+    ``release()`` refunds the reservation of an attempt that failed, and
+    ``record()`` settles a call with its real token counts once the
+    response arrives. Several calls (e.g. a hedged duplicate) may hold
+    reservations at once.
+    """
+
+    def __init__(
+        self,
+        scheduler: ModelScheduler,
+        session_id: str,
+        priority: int = 0,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        token_budget: Optional[int] = None,
+    ) -> None:
+        """Initialize the limiter (see ``ModelScheduler.session``)."""
+        self.scheduler = scheduler
+        self.session_id = session_id
+        self.priority = priority
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.token_budget = token_budget
+        self.used_tokens = 0
+        self.requests = 0
+        self.waited_seconds = 0.0
+        self._buckets: dict = {}
+        self._reservations: List[float] = []
+        self._last_call_tokens: Optional[int] = None
+        self._tickets = 0
+        self._lock = threading.Lock()
+
+    def _estimate(self) -> float:
+        if self._last_call_tokens is None:
+            return SCHEDULER_DEFAULT_TOKEN_ESTIMATE
+        # The conversation only grows between calls
+        return self._last_call_tokens * 1.1
+
+    def acquire(self) -> None:
+        """Block until the session may make its next model call, and reserve its tokens.
+
+        Raises:
+            TokenBudgetExceeded: If the call's estimated tokens do not fit in
+                what is left of the session's token budget.
+        """
+        with self._lock:
+            estimate = self._estimate()
+            if self.tokens_per_minute:
+                estimate = min(estimate, self.tokens_per_minute)
+            reserved = sum(self._reservations)
+            if (
+                self.token_budget is not None
+                and self.used_tokens + reserved + estimate > self.token_budget
+            ):
+                raise TokenBudgetExceeded(
+                    f"session {self.session_id} used {self.used_tokens} of its "
+                    f"{self.token_budget} token budget ({reserved:.0f} reserved); the next "
+                    f"call needs about {estimate:.0f}"
+                )
+            # Held against the budget while this call waits for quota
+            self._reservations.append(estimate)
+            self._tickets += 1
+            ticket = f"{self.session_id}:{os.getpid()}:{threading.get_ident()}:{self._tickets}"
+        started = time.monotonic()
+
+        try:
+            # The session's own limits first, then the shared queue
+            while True:
+                with self._lock:
+                    now = time.time()
+                    requests = _refill(self._buckets, "requests", self.requests_per_minute, now)
+                    tokens = _refill(self._buckets, "tokens", self.tokens_per_minute, now)
+                    delay = max(
+                        _seconds_until(requests, self.requests_per_minute, 1),
+                        _seconds_until(tokens, self.tokens_per_minute, estimate),
+                    )
+                    if delay <= 0:
+                        if requests is not None:
+                            requests["level"] -= 1
+                        if tokens is not None:
+                            tokens["level"] -= estimate
+                        break
+                time.sleep(delay)
+
+            logged = False
+            try:
+                while True:
+                    delay = self.scheduler.admit(ticket, self.session_id, self.priority, estimate)
+                    if delay <= 0:
+                        break
+                    if not logged and time.monotonic() - started > 1:
+                        logger.info("Session %s queued for model quota", self.session_id)
+                        logged = True
+                    time.sleep(delay)
+            except BaseException:
+                self.scheduler.leave(ticket)
+                self._refund_local(estimate)
+                raise
+        except BaseException:
+            with self._lock:
+                self._reservations.remove(estimate)
+            raise
+
+        with self._lock:
+            self.requests += 1
+            self.waited_seconds += time.monotonic() - started
+
+    def _refund_local(self, estimate: float) -> None:
+        """Return a reservation to the session's own buckets (not yet globally admitted)."""
+        with self._lock:
+            requests = self._buckets.get("requests")
+            if requests is not None:
+                requests["level"] = min(self.requests_per_minute, requests["level"] + 1)
+            tokens = self._buckets.get("tokens")
+            if tokens is not None:
+                tokens["level"] = min(self.tokens_per_minute, tokens["level"] + estimate)
+
+    def release(self) -> None:
+        """Refund the reservation of a call that failed without a response."""
+        self._settle(0.0)
+
+    def record(self, prompt_tokens: Optional[int], response_tokens: Optional[int]) -> None:
+        """Settle a call with its real token counts."""
+        if prompt_tokens is None and response_tokens is None:
+            # No usage reported: keep the estimate as the charge
+            self.record_discarded()
+            return
+        actual = (prompt_tokens or 0) + (response_tokens or 0)
+        with self._lock:
+            self._last_call_tokens = int(actual)
+        self._settle(actual)
+
+    def record_discarded(self) -> None:
+        """Settle a call whose response was not used (a losing hedged duplicate).
+
+        Its tokens were still spent but are unknown, so the reservation is
+        charged as it is.
+        """
+        self._settle(None)
+
+    def pause(self, seconds: float) -> None:
+        """Forward a server-requested backoff to every session."""
+        self.scheduler.pause(seconds)
+
+    def _settle(self, actual: Optional[float]) -> None:
+        """Settle the oldest reservation at ``actual`` tokens (None: as reserved)."""
+        with self._lock:
+            if self._reservations:
+                reserved = self._reservations.pop(0)
+            else:
+                # A call made without acquire(): charge what it reports
+                reserved = actual or 0.0
+            if actual is None:
+                actual = reserved
+            self.used_tokens += int(actual)
+            delta = actual - reserved
+            tokens = self._buckets.get("tokens")
+            if tokens is not None:
+                tokens["level"] = min(self.tokens_per_minute, tokens["level"] - delta)
+        self.scheduler.charge(self.session_id, delta)
+
+    def metrics(self) -> dict:
+        """Return the session's request, token and queueing totals."""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "tokens": self.used_tokens,
+                "queued_seconds": round(self.waited_seconds, 3),
+            }
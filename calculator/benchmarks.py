@@ -0,0 +1,236 @@
+"""
+Microbenchmarks for the calculator engine.
+
+Generates expressions of controlled length and operator mix, times the
+tokenize, parse and eval stages separately (plus end-to-end evaluation and
+JSON rendering), and compares the results against a stored baseline.
+
+Usage (from the calculator directory, like main.py and tests.py):
+    python benchmarks.py
+    python benchmarks.py --sizes 10 1000 --mix additive --save-baseline
+"""
+
+import os
+import sys
+import json
+import random
+import timeit
+import argparse
+import platform
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pkg.calculator import Calculator
+from pkg.render import format_json_output
+
+DEFAULT_SIZES = [10, 100, 1_000, 10_000, 100_000, 1_000_000]
+OPERATOR_MIXES: Dict[str, str] = {
+    "balanced": "+-*/",
+    "additive": "+-",
+    "multiplicative": "*/",
+}
+STAGES = ["tokenize", "parse", "eval", "evaluate", "render"]
+# Stages whose cost scales with the token count (render formats one number)
+TOKEN_STAGES = {"tokenize", "parse", "eval", "evaluate"}
+DEFAULT_BASELINE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json"
+)
+
+
+def generate_expression(n_tokens: int, operators: str, seed: int = 0) -> str:
+    """Build a valid space-separated expression with about ``n_tokens`` tokens.
+
+    Operands alternate with operators, so the token count is rounded down to
+    the nearest odd number. Operands are 1-9 to avoid division by zero.
+
+    Args:
+        n_tokens: Target number of tokens (at least 1).
+        operators: The operator characters to draw from.
+        seed: Seed for the random generator, for reproducible inputs.
+
+    Returns:
+        The generated expression.
+    """
+    rng = random.Random(seed)
+    n_operands = max(1, (n_tokens + 1) // 2)
+    parts = [str(rng.randint(1, 9))]
+    for _ in range(n_operands - 1):
+        parts.append(rng.choice(operators))
+        parts.append(str(rng.randint(1, 9)))
+    return " ".join(parts)
+
+
+def _time_call(fn: Callable[[], object], repeat: int) -> float:
+    """Return the best per-call time in seconds over ``repeat`` autoranged runs."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def _peak_traced_bytes(fn: Callable[[], object]) -> int:
+    """Return the peak traced memory, in bytes, of a single call of ``fn``.
+
+    This is the high-water mark of memory held during the call as seen by
+    tracemalloc, not a count of allocations.
+    """
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return max(0, peak - baseline)
+
+
+def run_case(
+    calculator: Calculator, size: int, mix: str, repeat: int
+) -> Dict[str, Dict[str, float]]:
+    """Benchmark every stage for one expression size and operator mix.
+
+    Args:
+        calculator: The calculator instance under test.
+        size: Target token count of the generated expression.
+        mix: Key into ``OPERATOR_MIXES``.
+        repeat: Number of timing repeats; the best one is kept.
+
+    Returns:
+        A mapping of stage name to ``ops_per_sec``, ``peak_traced_bytes`` and,
+        for the stages that process the tokens, ``tokens_per_sec``.
+    """
+    expression = generate_expression(size, OPERATOR_MIXES[mix])
+    tokens = calculator.tokenize(expression)
+    postfix = calculator.to_postfix(tokens)
+    result = calculator.evaluate_postfix(postfix)
+
+    stage_fns: Dict[str, Callable[[], object]] = {
+        "tokenize": lambda: calculator.tokenize(expression),
+        "parse": lambda: calculator.to_postfix(tokens),
+        "eval": lambda: calculator.evaluate_postfix(postfix),
+        "evaluate": lambda: calculator.evaluate(expression),
+        "render": lambda: format_json_output(expression, result),
+    }
+
+    results: Dict[str, Dict[str, float]] = {}
+    for stage in STAGES:
+        fn = stage_fns[stage]
+        seconds = _time_call(fn, repeat)
+        results[stage] = {"ops_per_sec": 1.0 / seconds, "peak_traced_bytes": _peak_traced_bytes(fn)}
+        if stage in TOKEN_STAGES:
+            results[stage]["tokens_per_sec"] = len(tokens) / seconds
+    return results
+
+
+def run_benchmarks(
+    sizes: List[int], mixes: List[str], repeat: int = 3
+) -> Dict[str, Dict[str, float]]:
+    """Run every (mix, size) case and flatten results keyed by ``mix/size/stage``."""
+    calculator = Calculator()
+    flat: Dict[str, Dict[str, float]] = {}
+    for mix in mixes:
+        for size in sizes:
+            for stage, metrics in run_case(calculator, size, mix, repeat).items():
+                flat[f"{mix}/{size}/{stage}"] = metrics
+    return flat
+
+
+def compare_to_baseline(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float,
+) -> List[Tuple[str, float, bool]]:
+    """Compare throughput against a baseline.
+
+    Args:
+        results: Current benchmark results.
+        baseline: Previously saved results.
+        tolerance: Allowed fractional slowdown before a case counts as a regression.
+
+    Returns:
+        ``(key, speedup, regressed)`` for every key present in both, where
+        ``speedup`` is current ops/sec divided by baseline ops/sec.
+    """
+    rows = []
+    for key, metrics in results.items():
+        previous = baseline.get(key)
+        if not previous or not previous.get("ops_per_sec"):
+            continue
+        speedup = metrics["ops_per_sec"] / previous["ops_per_sec"]
+        rows.append((key, speedup, speedup < 1.0 - tolerance))
+    return rows
+
+
+def _load_baseline(path: str) -> Optional[Dict[str, Dict[str, float]]]:
+    """Load saved results from ``path``, or None if there is no baseline."""
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("results", {})
+
+
+def _save_baseline(path: str, results: Dict[str, Dict[str, float]]) -> None:
+    """Write results to ``path`` together with the interpreter they came from."""
+    data = {"python": platform.python_version(), "results": results}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def main() -> None:
+    """Run the benchmark CLI."""
+    parser = argparse.ArgumentParser(description="Calculator microbenchmarks")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Token counts to generate"
+    )
+    parser.add_argument(
+        "--mix",
+        choices=sorted(OPERATOR_MIXES),
+        action="append",
+        help="Operator mix (repeatable, default: all)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Timing repeats per stage (best is kept)"
+    )
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Store these results as the new baseline"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed fractional slowdown before flagging a regression",
+    )
+    args = parser.parse_args()
+
+    mixes = args.mix or sorted(OPERATOR_MIXES)
+    results = run_benchmarks(args.sizes, mixes, args.repeat)
+
+    print(f"{'case':<32} {'ops/sec':>14} {'tokens/sec':>14} {'peak traced':>12}")
+    for key, metrics in results.items():
+        tokens_per_sec = metrics.get("tokens_per_sec")
+        tokens_column = f"{tokens_per_sec:>14,.0f}" if tokens_per_sec is not None else f"{'-':>14}"
+        print(
+            f"{key:<32} {metrics['ops_per_sec']:>14,.1f} "
+            f"{tokens_column} {metrics['peak_traced_bytes']:>11,}B"
+        )
+
+    baseline = _load_baseline(args.baseline)
+    regressions = 0
+    if baseline:
+        print(f"\nComparison with baseline {args.baseline}:")
+        for key, speedup, regressed in compare_to_baseline(results, baseline, args.tolerance):
+            marker = "  REGRESSION" if regressed else ""
+            regressions += regressed
+            print(f"{key:<32} {speedup:>6.2f}x{marker}")
+
+    if args.save_baseline:
+        _save_baseline(args.baseline, results)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if regressions and not args.save_baseline:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,13 +10,14 @@ import logging
 from pkg.calculator import Calculator
 from pkg.render import format_json_output
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
 def main() -> None:
     """Run the calculator CLI."""
+    # Configured here rather than on import, so importing this module does
+    # not reconfigure the importer's logging
+    logging.basicConfig(level=logging.INFO)
     calculator = Calculator()
     if len(sys.argv) <= 1:
         print("Calculator App")
@@ -5,7 +5,7 @@ Implements a shunting-yard algorithm for handling operator precedence
 and evaluating mathematical expressions.
 """
 
-from typing import Callable, Optional, Dict
+from typing import Callable, Dict, List, Optional, Union
 
 
 class Calculator:
@@ -40,66 +40,78 @@ class Calculator:
         """
         if not expression or expression.isspace():
             return None
-        tokens = expression.strip().split()
-        return self._evaluate_infix(tokens)
+        return self.evaluate_postfix(self.to_postfix(self.tokenize(expression)))
+
+    def tokenize(self, expression: str) -> List[str]:
+        """Split an expression into its space-separated tokens.
+
+        Args:
+            expression: A space-separated mathematical expression.
+
+        Returns:
+            The list of tokens (empty for a blank expression).
+        """
+        return expression.split()
+
+    def to_postfix(self, tokens: List[str]) -> List[Union[float, str]]:
+        """Convert infix tokens to postfix (RPN) using the shunting-yard algorithm.
+
+        Numbers are converted to floats; operators are kept as strings. This
+        is the parse stage of ``evaluate``.
 
-    def _evaluate_infix(self, tokens: list) -> float:
-        """Evaluate using the shunting-yard algorithm.
-        
         Args:
             tokens: List of tokenized expression elements.
-            
+
         Returns:
-            The computed result.
-            
+            The expression in postfix order.
+
         Raises:
-            ValueError: If the expression structure is invalid.
+            ValueError: If a token is neither a number nor an operator.
         """
-        values: list = []
-        operators: list = []
+        output: List[Union[float, str]] = []
+        operators: List[str] = []
 
         for token in tokens:
             if token in self.operators:
-                while (
-                    operators
-                    and operators[-1] in self.operators
-                    and self.precedence[operators[-1]] >= self.precedence[token]
-                ):
-                    self._apply_operator(operators, values)
+                while operators and self.precedence[operators[-1]] >= self.precedence[token]:
+                    output.append(operators.pop())
                 operators.append(token)
             else:
                 try:
-                    values.append(float(token))
+                    output.append(float(token))
                 except ValueError:
                     raise ValueError(f"invalid token: {token}")
 
         while operators:
-            self._apply_operator(operators, values)
+            output.append(operators.pop())
+        return output
 
-        if len(values) != 1:
-            raise ValueError("invalid expression")
+    def evaluate_postfix(self, postfix: List[Union[float, str]]) -> float:
+        """Evaluate a postfix expression produced by ``to_postfix``.
 
-        return values[0]
+        This is the eval stage of ``evaluate``.
 
-    def _apply_operator(self, operators: list, values: list) -> None:
-        """Apply the most recent operator to the values stack.
-        
         Args:
-            operators: Stack of operators.
-            values: Stack of numeric values.
-            
-        Raises:
-            ValueError: If there are insufficient operands.
-        """
-        if not operators:
-            return
+            postfix: Numbers and operators in postfix order.
 
-        operator = operators.pop()
-        if len(values) < 2:
-            raise ValueError(f"not enough operands for operator {operator}")
+        Returns:
+            The computed result.
 
-        b = values.pop()
-        a = values.pop()
-        values.append(self.operators[operator](a, b))
+        Raises:
+            ValueError: If the expression structure is invalid.
+        """
+        values: List[float] = []
+        for item in postfix:
+            if isinstance(item, str):
+                if len(values) < 2:
+                    raise ValueError(f"not enough operands for operator {item}")
+                b = values.pop()
+                a = values.pop()
+                values.append(self.operators[item](a, b))
+            else:
+                values.append(item)
 
+        if len(values) != 1:
+            raise ValueError("invalid expression")
 
+        return values[0]
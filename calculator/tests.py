@@ -42,6 +42,16 @@ class TestCalculator(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.calculator.evaluate("+ 3")
 
+    def test_postfix_matches_evaluate(self):
+        expression = "2 * 3 - 8 / 2 + 5"
+        postfix = self.calculator.to_postfix(self.calculator.tokenize(expression))
+        self.assertEqual(postfix, [2.0, 3.0, "*", 8.0, 2.0, "/", "-", 5.0, "+"])
+        self.assertEqual(self.calculator.evaluate_postfix(postfix), 7)
+
+    def test_postfix_not_enough_operands(self):
+        with self.assertRaises(ValueError):
+            self.calculator.evaluate_postfix(self.calculator.to_postfix(["+", "3"]))
+
 
 if __name__ == "__main__":
     unittest.main()
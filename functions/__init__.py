@@ -2,20 +2,34 @@
 CodePilot functions module.
 
 Provides secure file and code execution operations for the AI agent.
+Importing this package registers the built-in tools with the registry,
+which also provides their function declarations (``registry.declaration``
+and ``registry.declarations``); these need the google.genai SDK and are
+only built when first requested.
 """
 
-from .get_files_info import get_files_info, schema_get_files_info
-from .get_file_content import get_file_content, schema_get_file_content
-from .write_file import write_file, schema_write_file
-from .run_python_file import run_python_file, schema_run_python_file
+from .registry import ToolContext, ToolRegistry, is_failure, register_tool, registry
+from .sandbox import Sandbox
+from .get_files_info import get_files_info
+from .get_file_content import get_file_content
+from .write_file import write_file
+from .run_python_file import run_python_file
+from .read_blob import read_blob
+from .find_symbol import find_symbol
+from .outline_file import outline_file
 
 __all__ = [
     "get_files_info",
-    "schema_get_files_info",
     "get_file_content",
-    "schema_get_file_content",
     "write_file",
-    "schema_write_file",
     "run_python_file",
-    "schema_run_python_file",
+    "read_blob",
+    "find_symbol",
+    "outline_file",
+    "Sandbox",
+    "ToolContext",
+    "ToolRegistry",
+    "register_tool",
+    "registry",
+    "is_failure",
 ]
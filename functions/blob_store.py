@@ -0,0 +1,216 @@
+"""
+Content-addressed blob store for large and binary tool payloads.
+
+Blobs are named by the SHA-256 of their bytes, so storing the same output
+twice costs nothing and a reference stays valid for as long as the blob
+exists. Tools hand the model a reference plus a preview instead of the
+bytes themselves; the model fetches ranges with the read_blob tool only
+when it needs them.
+
+Each workspace (or overlay session) has its own namespace in the store, so
+a reference only resolves for the sandbox whose tools created it. Storing
+or reading a blob marks it as used; blobs unused for ``BLOB_MAX_AGE_SECONDS``
+are deleted, and the least recently used ones go first once the store
+exceeds ``BLOB_MAX_BYTES``.
+"""
+
+import os
+import re
+import time
+import hashlib
+import logging
+import tempfile
+from typing import Dict, Optional, Tuple, Union
+from .config import BLOB_DIR, BLOB_GC_INTERVAL_SECONDS, BLOB_MAX_AGE_SECONDS, BLOB_MAX_BYTES
+from .sandbox import Sandbox
+
+logger = logging.getLogger(__name__)
+
+_REF_PATTERN = re.compile(r"^sha256:([0-9a-f]{64})$")
+_CHUNK_BYTES = 1024 * 1024
+
+# Last collection per store root in this process (time.monotonic())
+_last_collected: Dict[str, float] = {}
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    """Blobs stored as ``<root>/<scope>/<first two hex digits>/<digest>``."""
+
+    def __init__(self, root: Optional[str] = None, scope: str = "shared") -> None:
+        """Initialize the store.
+
+        Args:
+            root: Directory holding the blobs; defaults to ``BLOB_DIR``.
+            scope: Namespace of the references; see ``for_sandbox``.
+        """
+        self.root = root or BLOB_DIR
+        self.scope = scope
+
+    @classmethod
+    def for_sandbox(
+        cls, working_directory: Union[str, Sandbox], root: Optional[str] = None
+    ) -> "BlobStore":
+        """Return the store namespace of a workspace (or of an overlay session)."""
+        key = Sandbox.of(working_directory).key
+        return cls(root, hashlib.sha1(key.encode("utf-8")).hexdigest()[:16])
+
+    def path(self, ref: str) -> str:
+        """Return the file of the blob ``ref``.
+
+        Raises:
+            ValueError: If ``ref`` is not a ``sha256:<hex>`` reference.
+        """
+        match = _REF_PATTERN.match(ref)
+        if not match:
+            raise ValueError(f"invalid blob reference {ref!r}")
+        digest = match.group(1)
+        return os.path.join(self.root, self.scope, digest[:2], digest)
+
+    def put(self, data: bytes) -> str:
+        """Store ``data`` and return its reference."""
+        ref = f"sha256:{hashlib.sha256(data).hexdigest()}"
+        path = self.path(ref)
+        if not self._touch(path):
+            self._write(path, data)
+        return ref
+
+    def put_file(self, source: str) -> Tuple[str, int]:
+        """Store a copy of the file ``source``, streaming it in chunks.
+
+        The file is hashed first and only copied if the blob is missing.
+
+        Returns:
+            The blob reference and its size in bytes.
+        """
+        ref = f"sha256:{_file_digest(source)}"
+        path = self.path(ref)
+        if self._touch(path):
+            return ref, os.path.getsize(path)
+
+        scope_dir = os.path.join(self.root, self.scope)
+        os.makedirs(scope_dir, exist_ok=True)
+        # Hashed again while copying, in case the file changed in between
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=scope_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out, open(source, "rb") as f:
+                while chunk := f.read(_CHUNK_BYTES):
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            ref = f"sha256:{digest.hexdigest()}"
+            path = self.path(ref)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._maybe_collect()
+        return ref, size
+
+    def read(self, ref: str, offset: int = 0, length: int = -1) -> bytes:
+        """Read ``length`` bytes of a blob starting at ``offset`` (all by default).
+
+        Raises:
+            FileNotFoundError: If the blob does not exist.
+        """
+        with open(self.path(ref), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def size(self, ref: str) -> int:
+        """Return the size of a blob in bytes, marking it as used.
+
+        Raises:
+            FileNotFoundError: If the blob does not exist.
+        """
+        path = self.path(ref)
+        if not self._touch(path):
+            raise FileNotFoundError(path)
+        return os.path.getsize(path)
+
+    def collect(
+        self, max_bytes: int = BLOB_MAX_BYTES, max_age_seconds: float = BLOB_MAX_AGE_SECONDS
+    ) -> int:
+        """Delete unused blobs of every scope.
+
+        Blobs unused for ``max_age_seconds`` go first, then the least
+        recently used ones until the store is no larger than ``max_bytes``.
+
+        Args:
+            max_bytes: Total size the store is trimmed to.
+            max_age_seconds: Blobs unused for longer are deleted.
+
+        Returns:
+            The number of blobs deleted.
+        """
+        blobs = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size, path))
+        blobs.sort()
+        total = sum(size for _, size, _ in blobs)
+        expired_before = time.time() - max_age_seconds
+        deleted = 0
+        for used, size, path in blobs:
+            if used >= expired_before and total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            deleted += 1
+        if deleted:
+            logger.info("Deleted %s blobs from %s", deleted, self.root)
+        return deleted
+
+    def _maybe_collect(self) -> None:
+        """Run ``collect`` at most once per BLOB_GC_INTERVAL_SECONDS per process."""
+        now = time.monotonic()
+        last = _last_collected.get(self.root)
+        if last is not None and now - last < BLOB_GC_INTERVAL_SECONDS:
+            return
+        _last_collected[self.root] = now
+        try:
+            self.collect()
+        except OSError as exc:
+            logger.debug("Blob collection failed: %s", exc)
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        """Mark an existing blob as used; False if it does not exist."""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _write(self, path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self._maybe_collect()
@@ -0,0 +1,404 @@
+"""
+Symbol index of the Python modules in a working directory.
+
+Every module is parsed with ``ast`` into its classes, functions and
+methods (with signatures and line ranges), its imports and the calls it
+makes. The index is persisted per sandbox view (the working directory, or
+a session's overlay of it). Lookups re-check every module's modification
+time and size and re-parse only the ones that changed; large rebuilds are
+spread over a process pool, except inside a worker process. write_file
+updates the entries of the files it writes directly, and those updates are
+saved in batches.
+"""
+
+import os
+import ast
+import json
+import time
+import atexit
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+from .sandbox import Sandbox
+from .config import (
+    CODE_INDEX_DIR,
+    CODE_INDEX_MAX_RESULTS,
+    CODE_INDEX_PARALLEL_MIN_FILES,
+    CODE_INDEX_RESCAN_SECONDS,
+    CODE_INDEX_SAVE_DELAY_SECONDS,
+    CODE_INDEX_SKIP_DIRS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the record layout changes, discarding older indexes
+INDEX_VERSION = 1
+
+_indexes: Dict[str, "CodeIndex"] = {}
+_indexes_lock = threading.Lock()
+
+
+def _module_name(rel_path: str) -> str:
+    """Return the dotted module name of a path relative to the index root."""
+    parts = rel_path[: -len(".py")].replace(os.sep, "/").split("/")
+    if parts[-1] == "__init__":
+        parts.pop()
+    return ".".join(parts)
+
+
+def _signature(node: ast.AST) -> str:
+    """Render the signature of a function or the bases of a class."""
+    if isinstance(node, ast.ClassDef):
+        bases = [ast.unparse(base) for base in node.bases + node.keywords]
+        return f"({', '.join(bases)})" if bases else ""
+    signature = f"({ast.unparse(node.args)})"
+    if node.returns is not None:
+        signature += f" -> {ast.unparse(node.returns)}"
+    return signature
+
+
+class _ModuleVisitor(ast.NodeVisitor):
+    """Collects symbols, imports and call sites of one module."""
+
+    def __init__(self, module: str, is_package: bool) -> None:
+        self.module = module
+        self.is_package = is_package
+        self.symbols: List[dict] = []
+        self.imports: List[str] = []
+        self.calls: List[list] = []
+        self._scope: List[Tuple[str, str]] = []
+
+    def _define(self, node: ast.AST, kind: str) -> None:
+        qualname = ".".join([name for name, _ in self._scope] + [node.name])
+        if kind == "function" and self._scope and self._scope[-1][1] == "class":
+            kind = "method"
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        docstring = ast.get_docstring(node) or ""
+        self.symbols.append(
+            {
+                "name": node.name,
+                "qualname": qualname,
+                "kind": kind,
+                "signature": _signature(node),
+                "start": start,
+                "end": node.end_lineno,
+                "doc": docstring.strip().split("\n", 1)[0],
+            }
+        )
+        self._scope.append((node.name, "class" if kind == "class" else "function"))
+        self.generic_visit(node)
+        self._scope.pop()
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> None:
+        self._define(node, "class")
+
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
+        self._define(node, "function")
+
+    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef) -> None:
+        self._define(node, "function")
+
+    def visit_Import(self, node: ast.Import) -> None:
+        self.imports.extend(alias.name for alias in node.names)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        base = node.module or ""
+        if node.level:
+            # Resolve relative imports against this module's package
+            package = self.module.split(".") if self.module else []
+            if not self.is_package:
+                package = package[:-1]
+            package = package[: len(package) - (node.level - 1)] if node.level > 1 else package
+            base = ".".join(filter(None, package + [base]))
+        if node.module:
+            self.imports.append(base)
+        else:
+            self.imports.extend(f"{base}.{alias.name}".lstrip(".") for alias in node.names)
+
+    def visit_Call(self, node: ast.Call) -> None:
+        func = node.func
+        callee = func.id if isinstance(func, ast.Name) else getattr(func, "attr", None)
+        if callee:
+            caller = ".".join(name for name, _ in self._scope) or "<module>"
+            self.calls.append([callee, caller, node.lineno])
+        self.generic_visit(node)
+
+
+def index_module(full_path: str, rel_path: str) -> dict:
+    """Parse one module into its index record.
+
+    Module level so that it can run in a worker process.
+
+    Args:
+        full_path: Where to read the module.
+        rel_path: Path of the module relative to the index root, which
+            determines its module name.
+
+    Returns:
+        The record: fingerprint, module name, symbols, imports and call
+        sites, or an ``error`` if the module could not be parsed.
+    """
+    module = _module_name(rel_path)
+    record = {"module": module, "symbols": [], "imports": [], "calls": []}
+    try:
+        stat = os.stat(full_path)
+        record["fingerprint"] = [stat.st_mtime_ns, stat.st_size]
+        with open(full_path, "rb") as f:
+            tree = ast.parse(f.read(), filename=rel_path)
+    except (OSError, SyntaxError, ValueError) as exc:
+        record["error"] = str(exc)
+        return record
+    visitor = _ModuleVisitor(module, rel_path.endswith("__init__.py"))
+    visitor.visit(tree)
+    record.update(
+        symbols=visitor.symbols,
+        imports=sorted(set(visitor.imports)),
+        calls=visitor.calls,
+    )
+    return record
+
+
+def _index_many(modules: List[Tuple[str, str]]) -> List[dict]:
+    """Index a batch of ``(full_path, rel_path)`` modules (one pool task)."""
+    return [index_module(full_path, rel_path) for full_path, rel_path in modules]
+
+
+class CodeIndex:
+    """Persisted symbol index of the files one sandbox shows."""
+
+    def __init__(self, sandbox: Sandbox, index_path: Optional[str] = None) -> None:
+        """Initialize the index and load its persisted state, if any.
+
+        Args:
+            sandbox: The sandbox whose files are indexed.
+            index_path: Where to persist the index; defaults to a file in
+                ``CODE_INDEX_DIR`` named after the sandbox's view.
+        """
+        self.sandbox = sandbox
+        self.root = sandbox.root
+        digest = hashlib.sha1(sandbox.key.encode("utf-8")).hexdigest()[:16]
+        self.index_path = index_path or os.path.join(CODE_INDEX_DIR, f"{digest}.json")
+        self.files: Dict[str, dict] = self._load()
+        self._stale = True
+        self._scanned_at = 0.0
+        self._save_timer: Optional[threading.Timer] = None
+        self._lock = threading.RLock()
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != INDEX_VERSION or data.get("root") != self.root:
+            return {}
+        return data.get("files", {})
+
+    def save(self) -> None:
+        """Atomically persist the index, including any batched updates."""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"version": INDEX_VERSION, "root": self.root, "files": self.files},
+                    f,
+                    separators=(",", ":"),
+                )
+            os.replace(tmp_path, self.index_path)
+
+    def flush(self) -> None:
+        """Save batched updates now, if there are any."""
+        with self._lock:
+            if self._save_timer is not None:
+                self.save()
+
+    def _save_later(self) -> None:
+        with self._lock:
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(CODE_INDEX_SAVE_DELAY_SECONDS, self.flush)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def _scan(self) -> Dict[str, Tuple[List[int], str]]:
+        """Return the fingerprint and full path of every Python module."""
+        found = {}
+        for rel_path, full_path in self.sandbox.walk(CODE_INDEX_SKIP_DIRS):
+            if not rel_path.endswith(".py") or any(
+                part.startswith(".") for part in rel_path.split("/")[:-1]
+            ):
+                continue
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                continue
+            found[rel_path] = ([stat.st_mtime_ns, stat.st_size], full_path)
+        return found
+
+    def refresh(self, workers: Optional[int] = None) -> int:
+        """Re-parse new and changed modules and drop deleted ones.
+
+        Args:
+            workers: Process pool size for large updates (default: CPU count;
+                always 1 inside a worker process).
+
+        Returns:
+            The number of modules that were (re)parsed.
+        """
+        with self._lock:
+            found = self._scan()
+            changed = [
+                (full_path, rel_path)
+                for rel_path, (fingerprint, full_path) in found.items()
+                if self.files.get(rel_path, {}).get("fingerprint") != fingerprint
+            ]
+            removed = [rel_path for rel_path in self.files if rel_path not in found]
+            for rel_path in removed:
+                del self.files[rel_path]
+
+            workers = self._pool_size(len(changed), workers)
+            if workers > 1:
+                # Imported here: multiprocessing is slow to import at CLI startup
+                from concurrent.futures import ProcessPoolExecutor
+
+                batch = max(1, len(changed) // (workers * 4))
+                batches = [changed[i:i + batch] for i in range(0, len(changed), batch)]
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    for modules, records in zip(batches, pool.map(_index_many, batches)):
+                        self.files.update(
+                            (rel_path, record) for (_, rel_path), record in zip(modules, records)
+                        )
+            else:
+                for full_path, rel_path in changed:
+                    self.files[rel_path] = index_module(full_path, rel_path)
+
+            if changed or removed:
+                logger.info(
+                    "Code index of %s: %d modules parsed, %d removed",
+                    self.root,
+                    len(changed),
+                    len(removed),
+                )
+                self.save()
+            self._stale = False
+            self._scanned_at = time.monotonic()
+            return len(changed)
+
+    @staticmethod
+    def _pool_size(modules: int, workers: Optional[int]) -> int:
+        """Return how many processes should parse ``modules`` modules (1: this one)."""
+        if modules < CODE_INDEX_PARALLEL_MIN_FILES:
+            return 1
+        from multiprocessing import parent_process
+
+        if parent_process() is not None:
+            # Already a worker (e.g. of a fleet): no pool nested in each worker
+            return 1
+        return workers or os.cpu_count() or 1
+
+    def ensure_fresh(self) -> None:
+        """Refresh the index unless it was checked in the last CODE_INDEX_RESCAN_SECONDS.
+
+        The check compares every module's fingerprint, so files changed by
+        anything (an editor, a script, git) are picked up.
+        """
+        if self._stale or time.monotonic() - self._scanned_at >= CODE_INDEX_RESCAN_SECONDS:
+            self.refresh()
+
+    def mark_stale(self) -> None:
+        """Force a rescan before the next lookup (e.g. after running a script)."""
+        self._stale = True
+
+    def update_file(self, rel_path: str) -> None:
+        """Re-index a single file that was just written.
+
+        The index is saved CODE_INDEX_SAVE_DELAY_SECONDS later, together with
+        any other updates made in the meantime.
+        """
+        rel_path = rel_path.replace(os.sep, "/")
+        if not rel_path.endswith(".py"):
+            return
+        with self._lock:
+            self.files[rel_path] = index_module(self.sandbox.resolve(rel_path), rel_path)
+            self._save_later()
+
+    def find_symbol(self, query: str) -> List[dict]:
+        """Find definitions matching ``query`` and the call sites of each.
+
+        ``query`` is a name (``evaluate``), a qualified name
+        (``Calculator.evaluate``) or a module-qualified name
+        (``pkg.calculator.Calculator.evaluate``). Call sites are matched by
+        the called name, so they can include calls of same-named symbols.
+
+        Returns:
+            Matches with ``path``, ``module``, the symbol's fields and ``callers``.
+        """
+        self.ensure_fresh()
+        suffix = f".{query}"
+        matches = []
+        for rel_path, record in sorted(self.files.items()):
+            for symbol in record["symbols"]:
+                qualname = symbol["qualname"]
+                full_name = f"{record['module']}.{qualname}"
+                if qualname == query or qualname.endswith(suffix) or full_name == query:
+                    matches.append(dict(symbol, path=rel_path, module=record["module"]))
+        matches = matches[:CODE_INDEX_MAX_RESULTS]
+
+        names = {match["name"] for match in matches}
+        call_sites: Dict[str, List[dict]] = {name: [] for name in names}
+        for rel_path, record in sorted(self.files.items()):
+            for callee, caller, line in record["calls"]:
+                if callee in call_sites:
+                    call_sites[callee].append({"path": rel_path, "line": line, "caller": caller})
+        for match in matches:
+            match["callers"] = call_sites[match["name"]][:CODE_INDEX_MAX_RESULTS]
+        return matches
+
+    def outline(self, rel_path: str) -> Optional[dict]:
+        """Return the record of one module plus the modules importing it."""
+        self.ensure_fresh()
+        record = self.files.get(rel_path.replace(os.sep, "/"))
+        if record is None:
+            return None
+        module = record["module"]
+        imported_by = sorted(
+            path
+            for path, other in self.files.items()
+            if any(name == module or name.startswith(f"{module}.") for name in other["imports"])
+        )
+        return dict(record, path=rel_path, imported_by=imported_by)
+
+
+def get_index(sandbox: Sandbox) -> CodeIndex:
+    """Return the process-wide index of ``sandbox``'s view, loading it on first use."""
+    with _indexes_lock:
+        index = _indexes.get(sandbox.key)
+        if index is None:
+            if not _indexes:
+                atexit.register(flush_indexes)
+            index = _indexes[sandbox.key] = CodeIndex(sandbox)
+        return index
+
+
+def flush_indexes() -> None:
+    """Save the batched updates of every loaded index."""
+    for index in list(_indexes.values()):
+        index.flush()
+
+
+def notify_write(sandbox: Sandbox, rel_path: str) -> None:
+    """Update a loaded index after a tool wrote ``rel_path``."""
+    index = _indexes.get(sandbox.key)
+    if index is not None:
+        index.update_file(rel_path)
+
+
+def notify_changed(sandbox: Sandbox) -> None:
+    """Mark a loaded index stale after files may have changed in unknown ways."""
+    index = _indexes.get(sandbox.key)
+    if index is not None:
+        index.mark_stale()
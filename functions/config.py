@@ -1,3 +1,80 @@
+import os
+
 MAX_FILE_CHARS = 10000
 
+# Entry points (relative to the working directory) that run_python_file may
+# execute in-process by calling their main() instead of spawning a new
+# interpreter. Only list read-only scripts that do not depend on the cwd.
+INPROCESS_ENTRY_POINTS = ("calculator/main.py",)
+
+# Seconds an in-process run may take before it is abandoned and reported as
+# timed out; later runs use a subprocess until the abandoned one ends
+INPROCESS_TIMEOUT_SECONDS = 5
+
+# Upper bound on the characters of read-only tool results cached per session
+RESULT_CACHE_MAX_CHARS = 8 * 1024 * 1024
+
+# Directory for tool state kept across sessions (same as the agent's STATE_DIR)
+STATE_DIR = os.environ.get("CODEPILOT_STATE_DIR") or os.path.join(
+    os.path.expanduser("~"), ".cache", "codepilot"
+)
+
+# Content-addressed store for tool payloads too large (or binary) to inline
+BLOB_DIR = os.path.join(STATE_DIR, "blobs")
+
+# Blob store retention: blobs unused for this long are deleted, and the least
+# recently used ones once the store exceeds BLOB_MAX_BYTES; the check runs at
+# most every BLOB_GC_INTERVAL_SECONDS per process, after a blob is written
+BLOB_MAX_AGE_SECONDS = 7 * 24 * 3600
+BLOB_MAX_BYTES = 1024 * 1024 * 1024
+BLOB_GC_INTERVAL_SECONDS = 600
+
+# Tool results longer than this go to the blob store with a preview inline
+MAX_INLINE_RESULT_CHARS = 20000
+
+# Characters from each end of a stored result shown in its preview
+BLOB_PREVIEW_CHARS = 1000
+
+# Leading bytes inspected to decide whether a file is binary
+BINARY_SNIFF_BYTES = 8192
+
+# Persisted symbol indexes, one file per working directory
+CODE_INDEX_DIR = os.path.join(STATE_DIR, "code_index")
+
+# Modules to (re)parse before the code index switches to a process pool
+CODE_INDEX_PARALLEL_MIN_FILES = 64
+
+# Lookups re-check module fingerprints (mtime/size) at most this often, so
+# files edited outside the agent are re-indexed
+CODE_INDEX_RESCAN_SECONDS = 1.0
+
+# Seconds write_file updates are batched before the index is saved
+CODE_INDEX_SAVE_DELAY_SECONDS = 2.0
+
+# Directories never indexed
+CODE_INDEX_SKIP_DIRS = frozenset(
+    {"__pycache__", ".git", ".hg", ".venv", "venv", "env", "node_modules", "build", "dist"}
+)
+
+# Matches (and call sites per match) returned by find_symbol
+CODE_INDEX_MAX_RESULTS = 20
+
+# Speculative reads after get_files_info/get_file_content: files per trigger,
+# largest file considered, characters of unused prefetched results held at
+# once, and background reader threads
+PREFETCH_MAX_FILES = 16
+PREFETCH_MAX_FILE_BYTES = 64 * 1024
+PREFETCH_MAX_CHARS = 2 * 1024 * 1024
+PREFETCH_WORKERS = 2
+
+# Per-session copy-on-write overlay workspaces
+OVERLAY_DIR = os.path.join(STATE_DIR, "overlays")
+
+# Directories not copied into an overlay when a script first runs in it
+OVERLAY_SKIP_DIRS = frozenset({"__pycache__", ".git", ".hg", ".venv", "venv", "node_modules"})
 
+# Largest amount of data a script run may copy into an overlay on a filesystem
+# without reflinks; above it the run is refused rather than copying the tree
+OVERLAY_MAX_COPY_BYTES = int(
+    os.environ.get("CODEPILOT_OVERLAY_MAX_COPY_BYTES") or 256 * 1024 * 1024
+)
@@ -0,0 +1,68 @@
+"""
+Symbol lookup function for the AI agent.
+
+Answers "where is X defined and who calls it" from the workspace's code
+index in one call instead of a chain of full-file reads.
+"""
+
+from typing import Union
+from .code_index import get_index
+from .registry import register_tool
+from .sandbox import Sandbox
+
+
+@register_tool(
+    "find_symbol",
+    description=(
+        "Finds where a Python class, function or method is defined in the working directory "
+        "(signature, file and line range) and the call sites that reference it."
+    ),
+    parameters={
+        "type": "object",
+        "properties": {
+            "name": {
+                "type": "string",
+                "description": (
+                    "Symbol name, optionally qualified, e.g. 'evaluate', "
+                    "'Calculator.to_postfix' or 'pkg.calculator.Calculator'."
+                ),
+            },
+        },
+        "required": ["name"],
+    },
+)
+def find_symbol(working_directory: Union[str, Sandbox], name: str) -> str:
+    """Look up a symbol's definitions and call sites.
+
+    Args:
+        working_directory: The base working directory (or the session's Sandbox).
+        name: The (qualified) symbol name.
+
+    Returns:
+        The matching definitions with their call sites, or an error message.
+    """
+    try:
+        matches = get_index(Sandbox.of(working_directory)).find_symbol(name)
+        if not matches:
+            # A valid answer, not a failed call
+            return f'No definition of "{name}" found'
+
+        lines = []
+        for match in matches:
+            lines.append(
+                f"{match['kind']} {match['qualname']}{match['signature']}"
+                f"  {match['path']}:{match['start']}-{match['end']}"
+            )
+            if match["doc"]:
+                lines.append(f"  {match['doc']}")
+            if match["callers"]:
+                lines.append("  called from:")
+                lines.extend(
+                    f"    {site['path']}:{site['line']} in {site['caller']}"
+                    for site in match["callers"]
+                )
+            else:
+                lines.append("  no call sites found")
+        return "\n".join(lines)
+    except Exception as exc:
+        return f"Error: {exc}"
@@ -1,81 +1,94 @@
 """
 Safe file reading function for the AI agent.
 
-Reads file contents with truncation to prevent payload overflow.
+Reads file contents with truncation to prevent payload overflow. Text is
+returned with the byte range it covers so that large files can be read
+in slices; binary files are summarized and copied to the blob store
+instead of being decoded with replacement characters.
 """
 
 import os
-from typing import Optional
-from .config import MAX_FILE_CHARS
-from google.genai import types
+from typing import Union
+from .blob_store import BlobStore
+from .config import BINARY_SNIFF_BYTES, MAX_FILE_CHARS
+from .payloads import MAX_CHAR_BYTES, BinaryPayload, TextPayload, decode_slice, looks_binary
+from .registry import register_tool
+from .sandbox import Sandbox
 
 
-def _is_within_directory(base: str, target: str) -> bool:
-    """Check if target path is within base directory.
-    
-    Args:
-        base: The base directory path.
-        target: The target path to check.
-        
-    Returns:
-        True if target is within base, False otherwise.
-    """
-    base_abs = os.path.abspath(base)
-    target_abs = os.path.abspath(target)
-    try:
-        common = os.path.commonpath([base_abs, target_abs])
-    except ValueError:
-        return False
-    return common == base_abs
-
-
-def get_file_content(working_directory: str, file_path: str) -> str:
+@register_tool(
+    "get_file_content",
+    description=(
+        "Reads the contents of a file (truncated if too large) within the working directory. "
+        "Large files can be read in slices with offset; binary files are summarized."
+    ),
+    parameters={
+        "type": "object",
+        "properties": {
+            "file_path": {
+                "type": "string",
+                "description": "The path to the file, relative to the working directory.",
+            },
+            "offset": {
+                "type": "integer",
+                "description": "Byte offset to start reading at (the next_offset of a previous read).",
+                "default": 0,
+            },
+            "limit": {
+                "type": "integer",
+                "description": f"Maximum characters to return (at most {MAX_FILE_CHARS}).",
+                "default": MAX_FILE_CHARS,
+            },
+        },
+        "required": ["file_path"],
+    },
+    cached_by="file_path",
+)
+def get_file_content(
+    working_directory: Union[str, Sandbox],
+    file_path: str,
+    offset: int = 0,
+    limit: int = MAX_FILE_CHARS,
+) -> str:
     """Read file contents with optional truncation.
     
     Args:
-        working_directory: The base working directory.
+        working_directory: The base working directory (or the session's Sandbox).
         file_path: The path to the file, relative to working_directory.
+        offset: Byte offset to start reading at; moved forward to the next
+            character boundary if it falls inside a character.
+        limit: Maximum number of characters to return.
         
     Returns:
-        The file contents or error message.
+        A TextPayload with the file contents, a BinaryPayload summarizing a
+        binary file, or an error message.
     """
     try:
-        full_path = os.path.join(working_directory, file_path)
-        if not _is_within_directory(working_directory, full_path):
+        sandbox = Sandbox.of(working_directory)
+        full_path = sandbox.resolve(file_path)
+        if full_path is None:
             return f'Error: Cannot read "{file_path}" as it is outside the permitted working directory'
 
         if not os.path.isfile(full_path):
             return f'Error: File not found or is not a regular file: "{file_path}"'
 
-        with open(full_path, "r", encoding="utf-8", errors="replace") as f:
-            content = f.read()
+        if offset < 0 or limit <= 0:
+            return "Error: offset must not be negative and limit must be positive"
+        limit = min(limit, MAX_FILE_CHARS)
 
-        if len(content) > MAX_FILE_CHARS:
-            truncated = content[:MAX_FILE_CHARS]
-            truncated += f'\n[...File "{file_path}" truncated at {MAX_FILE_CHARS} characters]'
-            return truncated
-        return content
-    except Exception as exc:
-        return f"Error: {exc}"
-
-
-# Function schema for tools API
-schema_get_file_content = types.FunctionDeclaration(
-    name="get_file_content",
-    description=(
-        "Reads the contents of a file (truncated if too large) within the working directory."
-    ),
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "file_path": types.Schema(
-                type=types.Type.STRING,
-                description=(
-                    "The path to the file, relative to the working directory."
-                ),
-            )
-        },
-    ),
-)
+        with open(full_path, "rb") as f:
+            total_bytes = os.fstat(f.fileno()).st_size
+            head = f.read(BINARY_SNIFF_BYTES)
+            if looks_binary(head):
+                blob, size = BlobStore.for_sandbox(sandbox).put_file(full_path)
+                return BinaryPayload(file_path, size, blob, head[:64])
+            if offset > total_bytes:
+                return f'Error: offset {offset} is past the end of "{file_path}" ({total_bytes} bytes)'
 
+            f.seek(offset)
+            data = f.read(limit * MAX_CHAR_BYTES)
 
+        text, offset, byte_end = decode_slice(data, offset, total_bytes, limit)
+        return TextPayload(text, file_path, offset, byte_end, total_bytes)
+    except Exception as exc:
+        return f"Error: {exc}"
@@ -6,27 +6,9 @@ directory traversal attacks.
 """
 
 import os
-from typing import List
-from google.genai import types
-
-
-def _is_within_directory(base: str, target: str) -> bool:
-    """Check if target path is within base directory.
-    
-    Args:
-        base: The base directory path.
-        target: The target path to check.
-        
-    Returns:
-        True if target is within base, False otherwise.
-    """
-    base_abs = os.path.abspath(base)
-    target_abs = os.path.abspath(target)
-    try:
-        common = os.path.commonpath([base_abs, target_abs])
-    except ValueError:
-        return False
-    return common == base_abs
+from typing import List, Union
+from .registry import register_tool
+from .sandbox import Sandbox
 
 
 def _format_entry_line(name: str, path: str) -> str:
@@ -47,52 +29,47 @@ def _format_entry_line(name: str, path: str) -> str:
         return f"- {name}: Error: {exc}"
 
 
-def get_files_info(working_directory: str, directory: str = ".") -> str:
+@register_tool(
+    "get_files_info",
+    description=(
+        "Lists files in the specified directory along with their sizes, constrained to the working directory."
+    ),
+    parameters={
+        "type": "object",
+        "properties": {
+            "directory": {
+                "type": "string",
+                "description": (
+                    "The directory to list files from, relative to the working directory. If not provided, lists files in the working directory itself."
+                ),
+                "default": ".",
+            },
+        },
+    },
+)
+def get_files_info(working_directory: Union[str, Sandbox], directory: str = ".") -> str:
     """List files in the specified directory.
     
     Args:
-        working_directory: The base working directory.
+        working_directory: The base working directory (or the session's Sandbox).
         directory: The directory to list, relative to working_directory.
         
     Returns:
         A formatted string with directory contents or error message.
     """
     try:
-        full_path = os.path.join(working_directory, directory)
-
-        if not _is_within_directory(working_directory, full_path):
+        sandbox = Sandbox.of(working_directory)
+        if sandbox.relative(directory) is None:
             return f'Error: Cannot list "{directory}" as it is outside the permitted working directory'
 
-        if not os.path.isdir(full_path):
+        listing = sandbox.listdir(directory)
+        if listing is None:
             return f'Error: "{directory}" is not a directory'
 
         entries: List[str] = []
-        for name in os.listdir(full_path):
-            entry_path = os.path.join(full_path, name)
+        for name, entry_path in listing.items():
             entries.append(_format_entry_line(name, entry_path))
 
         return "\n".join(entries)
     except Exception as exc:
         return f"Error: {exc}"
-
-
-# Expose the function declaration schema for the LLM tools API
-schema_get_files_info = types.FunctionDeclaration(
-    name="get_files_info",
-    description=(
-        "Lists files in the specified directory along with their sizes, constrained to the working directory."
-    ),
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "directory": types.Schema(
-                type=types.Type.STRING,
-                description=(
-                    "The directory to list files from, relative to the working directory. If not provided, lists files in the working directory itself."
-                ),
-            )
-        },
-    ),
-)
-
-
@@ -0,0 +1,270 @@
+"""
+In-process fast path for running allow-listed Python entry points.
+
+Executes a script's ``main()`` inside a fresh module namespace instead of
+forking a new interpreter, capturing stdout/stderr and the script's log
+records in memory. Anything that cannot be run this way (not allow-listed,
+no ``main``) is reported back so the caller can fall back to a subprocess.
+
+A run that outlives its timeout cannot be stopped. It keeps the run lock and
+the process-wide state it was given until it finishes, and until then every
+script is sent to a subprocess instead.
+"""
+
+import os
+import sys
+import io
+import logging
+import builtins
+import threading
+import traceback
+from typing import List, Optional, Tuple
+
+from .config import INPROCESS_ENTRY_POINTS, INPROCESS_TIMEOUT_SECONDS
+
+# Module name given to the executed script so its `if __name__ == "__main__"`
+# block does not run; main() is called explicitly instead.
+_MODULE_NAME = "__codepilot_inprocess__"
+
+# sys.argv, sys.path and sys.modules are process-wide, so runs are serialized.
+_run_lock = threading.Lock()
+
+# Set while a timed-out run is still executing; it holds _run_lock until it ends
+_abandoned = threading.Event()
+
+
+class InProcessTimeout(Exception):
+    """Raised when an in-process run is still executing after its timeout."""
+
+
+class _ScriptLogFormatter(logging.Formatter):
+    """Formats records as logging.basicConfig does in a fresh interpreter.
+
+    The script's own module logs under ``__main__`` there, so its records
+    are reported under that name rather than the in-process module name.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(logging.BASIC_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        if record.name == _MODULE_NAME:
+            record = logging.makeLogRecord({**vars(record), "name": "__main__"})
+        return super().format(record)
+
+
+class _ThreadFilter(logging.Filter):
+    """Passes only the records of one thread (or, inverted, all the others)."""
+
+    def __init__(self, thread_id: int, keep: bool) -> None:
+        super().__init__()
+        self.thread_id = thread_id
+        self.keep = keep
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return (record.thread == self.thread_id) == self.keep
+
+
+class _ThreadLocalStream:
+    """Stream proxy that sends writes to a per-thread buffer when one is set.
+
+    Installed in place of sys.stdout/sys.stderr so that output produced by
+    the worker thread is captured while every other thread keeps writing
+    to the original stream.
+    """
+
+    def __init__(self, fallback) -> None:
+        self._fallback = fallback
+        self._local = threading.local()
+
+    def set_buffer(self, buffer: Optional[io.StringIO]) -> None:
+        """Capture the calling thread's writes into ``buffer`` (None to stop)."""
+        self._local.buffer = buffer
+
+    def _target(self):
+        buffer = getattr(self._local, "buffer", None)
+        return buffer if buffer is not None else self._fallback
+
+    def write(self, text: str) -> int:
+        return self._target().write(text)
+
+    def flush(self) -> None:
+        self._target().flush()
+
+    def __getattr__(self, name: str):
+        return getattr(self._target(), name)
+
+
+def _install_proxy(name: str) -> _ThreadLocalStream:
+    """Ensure sys.<name> is a thread-local proxy and return it."""
+    current = getattr(sys, name)
+    if isinstance(current, _ThreadLocalStream):
+        return current
+    proxy = _ThreadLocalStream(current)
+    setattr(sys, name, proxy)
+    return proxy
+
+
+def is_inprocess_entry_point(file_path: str) -> bool:
+    """Check whether ``file_path`` is allow-listed for in-process execution."""
+    normalized = os.path.normpath(file_path)
+    return any(normalized == os.path.normpath(entry) for entry in INPROCESS_ENTRY_POINTS)
+
+
+def _exit_code(exc: SystemExit, stderr: io.StringIO) -> int:
+    """Translate a SystemExit into a process exit code, as the interpreter would."""
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code
+    print(exc.code, file=stderr)
+    return 1
+
+
+def run_in_process(
+    working_directory: str,
+    file_path: str,
+    args: List[str],
+    timeout: float = INPROCESS_TIMEOUT_SECONDS,
+) -> Optional[Tuple[str, str, int]]:
+    """Run an allow-listed script's ``main()`` in this interpreter.
+
+    The caller is responsible for the sandbox checks on ``file_path``.
+    Scripts are only run in-process when ``working_directory`` is the
+    current directory.
+
+    Args:
+        working_directory: The base working directory.
+        file_path: The path to the Python file, relative to working_directory.
+        args: Command-line arguments exposed to the script via sys.argv.
+        timeout: Seconds to wait for main() before giving up.
+
+    Returns:
+        ``(stdout, stderr, returncode)``, or None when the script must be run
+        in a subprocess instead.
+
+    Raises:
+        InProcessTimeout: If main() is still running after ``timeout``.
+    """
+    if not is_inprocess_entry_point(file_path) or _abandoned.is_set():
+        return None
+    # main() runs in this process's cwd, so it must be the one the script expects
+    # (an overlay's upper directory, for instance, never is)
+    if os.path.realpath(working_directory) != os.getcwd():
+        return None
+
+    full_path = os.path.abspath(os.path.join(working_directory, file_path))
+    try:
+        with open(full_path, "r", encoding="utf-8") as f:
+            code = compile(f.read(), full_path, "exec")
+    except (OSError, SyntaxError, ValueError):
+        return None
+    # A module-level `main` binding shows up in co_names; skip the run early
+    # rather than executing the module body for nothing.
+    if "main" not in code.co_names:
+        return None
+
+    if not _run_lock.acquire(timeout=timeout):
+        return None
+    release_lock = True
+    try:
+        stdout_proxy = _install_proxy("stdout")
+        stderr_proxy = _install_proxy("stderr")
+        out_buffer = io.StringIO()
+        err_buffer = io.StringIO()
+        outcome = {"returncode": None, "fallback": False}
+        started = threading.Event()
+
+        def _target() -> None:
+            started.wait()
+            stdout_proxy.set_buffer(out_buffer)
+            stderr_proxy.set_buffer(err_buffer)
+            try:
+                namespace = {
+                    "__name__": _MODULE_NAME,
+                    "__file__": full_path,
+                    "__builtins__": builtins,
+                }
+                exec(code, namespace)
+                entry = namespace.get("main")
+                if not callable(entry):
+                    outcome["fallback"] = True
+                    return
+                entry()
+                outcome["returncode"] = 0
+            except SystemExit as exc:
+                outcome["returncode"] = _exit_code(exc, err_buffer)
+            except BaseException:  # noqa: BLE001 - report like the interpreter would
+                traceback.print_exc(file=err_buffer)
+                outcome["returncode"] = 1
+            finally:
+                stdout_proxy.set_buffer(None)
+                stderr_proxy.set_buffer(None)
+
+        worker = threading.Thread(target=_target, name="inprocess-runner", daemon=True)
+        worker.start()
+
+        script_dir = os.path.dirname(full_path)
+        saved_argv = sys.argv
+        saved_path = list(sys.path)
+        saved_modules = set(sys.modules)
+        root_logger = logging.getLogger()
+        saved_handlers = list(root_logger.handlers)
+        saved_level = root_logger.level
+
+        # The script's log records go to its stderr, as they would in a
+        # subprocess, and not to the agent's own log
+        script_records = logging.StreamHandler(err_buffer)
+        script_records.setFormatter(_ScriptLogFormatter())
+        script_records.addFilter(_ThreadFilter(worker.ident, keep=True))
+        agent_records = _ThreadFilter(worker.ident, keep=False)
+        for handler in saved_handlers:
+            handler.addFilter(agent_records)
+        root_logger.addHandler(script_records)
+
+        def _restore() -> None:
+            sys.argv = saved_argv
+            sys.path[:] = saved_path
+            # Drop the script's own modules so the next run sees edits on disk
+            for name in set(sys.modules) - saved_modules:
+                module_file = getattr(sys.modules[name], "__file__", None) or ""
+                if os.path.abspath(module_file).startswith(script_dir + os.sep):
+                    del sys.modules[name]
+            for handler in saved_handlers:
+                handler.removeFilter(agent_records)
+            root_logger.handlers[:] = saved_handlers
+            root_logger.setLevel(saved_level)
+
+        sys.argv = [file_path, *args]
+        sys.path.insert(0, script_dir)
+        started.set()
+        worker.join(timeout)
+        if worker.is_alive():
+            # The state and the lock now belong to the still-running script
+            _abandoned.set()
+            release_lock = False
+            threading.Thread(
+                target=_reap, args=(worker, _restore), name="inprocess-reaper", daemon=True
+            ).start()
+            raise InProcessTimeout(
+                f"Script execution timed out after {timeout} seconds; it is still running, "
+                "so scripts run in a subprocess until it ends"
+            )
+        _restore()
+
+        if outcome["fallback"]:
+            return None
+        return out_buffer.getvalue(), err_buffer.getvalue(), outcome["returncode"]
+    finally:
+        if release_lock:
+            _run_lock.release()
+
+
+def _reap(worker: threading.Thread, restore) -> None:
+    """Wait for an abandoned run to end, then restore the state and release the lock."""
+    worker.join()
+    try:
+        restore()
+    finally:
+        _abandoned.clear()
+        _run_lock.release()
@@ -0,0 +1,68 @@
+"""
+File outline function for the AI agent.
+
+Lists the classes, functions and methods of a Python module with their
+signatures and line ranges, plus its imports and the modules importing
+it, so the agent can read only the lines it needs.
+"""
+
+from typing import Union
+from .code_index import get_index
+from .registry import register_tool
+from .sandbox import Sandbox
+
+
+@register_tool(
+    "outline_file",
+    description=(
+        "Outlines a Python file within the working directory: classes, functions and methods "
+        "with signatures and line ranges, its imports and the files importing it."
+    ),
+    parameters={
+        "type": "object",
+        "properties": {
+            "file_path": {
+                "type": "string",
+                "description": "The path to the Python file, relative to the working directory.",
+            },
+        },
+        "required": ["file_path"],
+    },
+)
+def outline_file(working_directory: Union[str, Sandbox], file_path: str) -> str:
+    """Outline a Python module.
+
+    Args:
+        working_directory: The base working directory (or the session's Sandbox).
+        file_path: The path to the file, relative to working_directory.
+
+    Returns:
+        The outline or an error message.
+    """
+    try:
+        sandbox = Sandbox.of(working_directory)
+        rel_path = sandbox.relative(file_path)
+        if rel_path is None:
+            return f'Error: Cannot read "{file_path}" as it is outside the permitted working directory'
+
+        record = get_index(sandbox).outline(rel_path)
+        if record is None:
+            return f'Error: "{file_path}" is not an indexed Python file'
+        if "error" in record:
+            return f'Error: Cannot parse "{file_path}": {record["error"]}'
+
+        lines = [f"{file_path} (module {record['module'] or '<root>'})"]
+        if record["imports"]:
+            lines.append(f"imports: {', '.join(record['imports'])}")
+        if record["imported_by"]:
+            lines.append(f"imported by: {', '.join(record['imported_by'])}")
+        for symbol in record["symbols"]:
+            depth = symbol["qualname"].count(".")
+            keyword = "class" if symbol["kind"] == "class" else "def"
+            lines.append(
+                f"{'  ' * depth}{keyword} {symbol['name']}{symbol['signature']}"
+                f"  [{symbol['start']}-{symbol['end']}]"
+            )
+        return "\n".join(lines)
+    except Exception as exc:
+        return f"Error: {exc}"
@@ -0,0 +1,391 @@
+"""
+Copy-on-write overlay workspaces.
+
+An overlay gives a session its own view of the working directory without
+copying it up front. Creating one only makes an empty upper directory, so
+it takes the same few milliseconds for any repository size. Writes land in
+the upper directory; reads, listings and the code index see the upper
+files over the untouched working directory. The first script run
+materializes the merged tree in the upper directory, cloning each
+remaining file with a reflink (shared blocks, copied on write) where the
+filesystem supports it and a plain copy elsewhere, so that scripts can
+freely create, change and delete files. A manifest records what each
+materialized file looked like in both trees (and, before that, what each
+original looked like when the overlay first wrote it), so that merging only
+applies what the session changed and leaves alone files that also changed
+in the working directory. When the session ends the overlay is merged into
+the working directory or discarded.
+
+Directories in ``OVERLAY_SKIP_DIRS`` (``.git``, virtual environments,
+caches) are not materialized: the tools still see them through the
+overlay, but scripts run in the overlay do not, and files written into
+them are not merged back.
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import filecmp
+import logging
+from typing import Container, Dict, Iterator, List, Optional, Tuple
+from .config import OVERLAY_DIR, OVERLAY_MAX_COPY_BYTES, OVERLAY_SKIP_DIRS
+from .sandbox import Sandbox, walk_files
+
+try:
+    import fcntl
+except ImportError:  # Windows: no reflinks, files are copied
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_OVERLAY_ID_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+# Linux ioctl sharing a file's blocks with another (btrfs, XFS, bcachefs, ...)
+_FICLONE = 0x40049409
+
+# Devices on which a reflink failed; files there are copied straight away
+_no_reflink_devices = set()
+
+
+class OverlayTooLarge(Exception):
+    """Raised when materializing an overlay would copy more than allowed."""
+
+
+def _reflink(source: str, target: str) -> bool:
+    """Try to create ``target`` as a reflink of ``source``."""
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+            return True
+        except OSError:
+            return False
+
+
+def clone_file(source: str, target: str) -> bool:
+    """Copy a file, sharing its blocks with the source where possible.
+
+    Symbolic links are recreated rather than followed. Permissions and
+    modification times are preserved.
+
+    Args:
+        source: The file to copy.
+        target: Where to create the copy; its directory must exist.
+
+    Returns:
+        True if the copy is a reflink, False if the data was copied.
+    """
+    if os.path.islink(source):
+        os.symlink(os.readlink(source), target)
+        return False
+    device = os.stat(source).st_dev
+    if fcntl is not None and device not in _no_reflink_devices:
+        if _reflink(source, target):
+            shutil.copystat(source, target)
+            return True
+        _no_reflink_devices.add(device)
+    shutil.copy2(source, target)
+    return False
+
+
+def _fingerprint(path: str) -> List[int]:
+    """Identify a file's current state; ctime changes on every write or utime."""
+    stat = os.lstat(path)
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns]
+
+
+def _in_skipped_dir(rel_path: str) -> bool:
+    return any(part in OVERLAY_SKIP_DIRS for part in rel_path.split("/")[:-1])
+
+
+def _replace_file(source: str, target: str) -> None:
+    """Atomically replace ``target`` with a copy of ``source``."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    if os.path.islink(source):
+        os.symlink(os.readlink(source), tmp_path)
+    else:
+        shutil.copy2(source, tmp_path)
+    os.replace(tmp_path, target)
+
+
+class OverlaySandbox(Sandbox):
+    """A session's copy-on-write view of a working directory.
+
+    ``root`` stays the working directory, so paths are checked and reported
+    exactly as for a plain Sandbox; only the files behind them differ.
+    Files written outside the overlay while it is open stay visible until
+    the overlay has its own copy of them.
+    """
+
+    def __init__(
+        self, working_directory: str, overlay_id: str, directory: Optional[str] = None
+    ) -> None:
+        """Open the overlay ``overlay_id``, creating it if it does not exist.
+
+        Args:
+            working_directory: The directory the overlay is laid over.
+            overlay_id: Name of the overlay, usually the session id.
+            directory: Where overlays are kept; defaults to ``OVERLAY_DIR``.
+
+        Raises:
+            ValueError: If the id is invalid or the overlay exists for a
+                different working directory.
+        """
+        super().__init__(working_directory)
+        if not _OVERLAY_ID_PATTERN.match(overlay_id):
+            raise ValueError(f"invalid overlay id {overlay_id!r}")
+        self.overlay_id = overlay_id
+        self.path = os.path.join(directory or OVERLAY_DIR, overlay_id)
+        self.upper = os.path.join(self.path, "upper")
+        self._state_path = os.path.join(self.path, "overlay.json")
+        self.key = f"{self.root}\0{self.upper}"
+
+        state = self._load()
+        if state.get("lower", self.root) != self.root:
+            raise ValueError(f"overlay {overlay_id} belongs to {state['lower']}")
+        # Every file of the materialized tree, mapped to the fingerprints of
+        # its upper copy (None if the overlay had already written it) and of
+        # the original (None if there was none) when the tree was built
+        self.manifest: Optional[Dict[str, list]] = state.get("manifest")
+        # Before materialization: fingerprint of each original (None if there
+        # was none) when the overlay first wrote the file
+        self.originals: Dict[str, Optional[list]] = state.get("originals", {})
+        if not state:
+            os.makedirs(self.upper, exist_ok=True)
+            self._save()
+
+    def _load(self) -> dict:
+        try:
+            with open(self._state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save(self) -> None:
+        tmp_path = f"{self._state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"lower": self.root, "manifest": self.manifest, "originals": self.originals},
+                f,
+                separators=(",", ":"),
+            )
+        os.replace(tmp_path, self._state_path)
+
+    @property
+    def materialized(self) -> bool:
+        """Whether the upper directory holds the whole merged tree."""
+        return self.manifest is not None
+
+    def _lower_fingerprint(self, rel_path: str) -> Optional[List[int]]:
+        lower_path = os.path.join(self.root, rel_path)
+        return _fingerprint(lower_path) if os.path.lexists(lower_path) else None
+
+    def _upper_path(self, full_path: str) -> str:
+        return os.path.normpath(os.path.join(self.upper, os.path.relpath(full_path, self.root)))
+
+    def _falls_through(self, full_path: str) -> bool:
+        """Whether reads of ``full_path`` may still come from the working directory."""
+        if not self.materialized:
+            return True
+        rel_path = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+        return _in_skipped_dir(f"{rel_path}/")
+
+    def resolve(self, path: str) -> Optional[str]:
+        full_path = self._join(path)
+        if full_path is None:
+            return None
+        upper_path = self._upper_path(full_path)
+        if os.path.lexists(upper_path) or not self._falls_through(full_path):
+            return upper_path
+        return full_path
+
+    def resolve_for_write(self, path: str) -> Optional[str]:
+        full_path = self._join(path)
+        if full_path is None:
+            return None
+        if not self.materialized:
+            rel_path = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+            if rel_path not in self.originals:
+                self.originals[rel_path] = self._lower_fingerprint(rel_path)
+                self._save()
+        return self._upper_path(full_path)
+
+    def listdir(self, path: str) -> Optional[Dict[str, str]]:
+        full_path = self._join(path)
+        if full_path is None:
+            return None
+        falls_through = self._falls_through(full_path)
+        entries = None
+        for layer in (full_path, self._upper_path(full_path)):
+            if not os.path.isdir(layer):
+                continue
+            names = os.listdir(layer)
+            if layer == full_path and not falls_through:
+                # Only the skipped directories are missing from the upper tree
+                names = [name for name in names if name in OVERLAY_SKIP_DIRS]
+            entries = entries or {}
+            # Upper entries shadow lower ones of the same name
+            entries.update((name, os.path.join(layer, name)) for name in names)
+        return entries
+
+    def walk(self, skip_dirs: Container[str] = ()) -> Iterator[Tuple[str, str]]:
+        files = {}
+        if not self.materialized:
+            files.update(walk_files(self.root, skip_dirs))
+        elif not all(name in skip_dirs for name in OVERLAY_SKIP_DIRS):
+            files.update(
+                (rel_path, full_path)
+                for rel_path, full_path in walk_files(self.root, skip_dirs)
+                if _in_skipped_dir(rel_path)
+            )
+        files.update(walk_files(self.upper, skip_dirs))
+        return iter(files.items())
+
+    def execution_root(self) -> str:
+        self.materialize()
+        return self.upper
+
+    def _reflinks_work(self, sources: List[str]) -> bool:
+        """Whether files can be reflinked from the working directory into the overlay."""
+        if fcntl is None or not sources:
+            return False
+        # Probing with the smallest file keeps a failed attempt cheap
+        source = min(sources, key=lambda path: os.lstat(path).st_size)
+        probe_path = os.path.join(self.path, "reflink.probe")
+        try:
+            return clone_file(source, probe_path)
+        finally:
+            if os.path.lexists(probe_path):
+                os.remove(probe_path)
+
+    def materialize(self) -> None:
+        """Fill the upper directory with every file it does not have yet.
+
+        Directories in ``OVERLAY_SKIP_DIRS`` are left out. After this,
+        reads no longer fall through to the working directory, so files a
+        script deletes stay deleted.
+
+        Raises:
+            OverlayTooLarge: If reflinks are unsupported and the files to
+                copy exceed ``OVERLAY_MAX_COPY_BYTES``; nothing is copied.
+        """
+        if self.materialized:
+            return
+        started = time.perf_counter()
+        manifest = {}
+        for rel_path, _ in walk_files(self.upper):
+            if rel_path in self.originals:
+                manifest[rel_path] = [None, self.originals[rel_path]]
+            else:
+                manifest[rel_path] = [None, self._lower_fingerprint(rel_path)]
+        pending = [
+            (rel_path, source)
+            for rel_path, source in walk_files(self.root, OVERLAY_SKIP_DIRS)
+            if rel_path not in manifest
+        ]
+        regular = [source for _, source in pending if not os.path.islink(source)]
+        if not self._reflinks_work(regular):
+            copy_bytes = sum(os.lstat(source).st_size for source in regular)
+            if copy_bytes > OVERLAY_MAX_COPY_BYTES:
+                raise OverlayTooLarge(
+                    f"running a script in the overlay would copy {len(regular)} files "
+                    f"({copy_bytes / 1024 / 1024:.1f} MB) because {self.upper} does not "
+                    f"support reflinks, over the {OVERLAY_MAX_COPY_BYTES / 1024 / 1024:.1f} MB "
+                    "limit (CODEPILOT_OVERLAY_MAX_COPY_BYTES); run the session without --overlay"
+                )
+            if regular:
+                logger.warning(
+                    "Reflinks are unsupported for overlay %s: copying %d files (%d bytes)",
+                    self.overlay_id,
+                    len(regular),
+                    copy_bytes,
+                )
+        cloned = copied = 0
+        for rel_path, source in pending:
+            target = os.path.join(self.upper, rel_path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if clone_file(source, target):
+                cloned += 1
+            else:
+                copied += 1
+            manifest[rel_path] = [_fingerprint(target), _fingerprint(source)]
+        self.manifest = manifest
+        self.originals = {}
+        self._save()
+        logger.info(
+            "Materialized overlay %s: %d files reflinked, %d copied in %.3fs",
+            self.overlay_id,
+            cloned,
+            copied,
+            time.perf_counter() - started,
+        )
+
+    def _changed(self, rel_path: str, upper_path: str) -> bool:
+        """Whether a file of a materialized overlay differs from the original."""
+        upper, _ = self.manifest.get(rel_path, (None, None))
+        if upper is not None and _fingerprint(upper_path) == upper:
+            # Untouched copy: any difference was made in the working directory
+            return False
+        lower_path = os.path.join(self.root, rel_path)
+        if not os.path.lexists(lower_path) or os.path.islink(upper_path):
+            return True
+        return not filecmp.cmp(upper_path, lower_path, shallow=False)
+
+    def _conflicts(self, rel_path: str) -> bool:
+        """Whether the original changed in the working directory during the session."""
+        if self.materialized:
+            # Files missing from the manifest had no original when it was built
+            _, expected = self.manifest.get(rel_path, (None, None))
+        elif rel_path in self.originals:
+            expected = self.originals[rel_path]
+        else:
+            return False
+        return self._lower_fingerprint(rel_path) != expected
+
+    def merge(self) -> List[str]:
+        """Apply the overlay's changes to the working directory and discard it.
+
+        Created and modified files are copied over their originals, and for
+        a materialized overlay, files the session deleted are deleted too.
+        A file that also changed (or appeared) in the working directory
+        during the session is left as it is there, with a warning.
+
+        Returns:
+            Paths (relative to the working directory) that were changed.
+        """
+        changed = []
+        upper_files = dict(walk_files(self.upper, OVERLAY_SKIP_DIRS))
+        for rel_path, upper_path in sorted(upper_files.items()):
+            if self.materialized and not self._changed(rel_path, upper_path):
+                continue
+            if self._conflicts(rel_path):
+                logger.warning(
+                    "Not merging %s: it also changed in %s during the session", rel_path, self.root
+                )
+                continue
+            _replace_file(upper_path, os.path.join(self.root, rel_path))
+            changed.append(rel_path)
+        for rel_path, (_, lower) in sorted((self.manifest or {}).items()):
+            lower_path = os.path.join(self.root, rel_path)
+            if rel_path in upper_files or lower is None or not os.path.lexists(lower_path):
+                continue
+            if _fingerprint(lower_path) != lower:
+                logger.warning(
+                    "Not deleting %s: it changed in %s during the session", rel_path, self.root
+                )
+                continue
+            os.remove(lower_path)
+            changed.append(rel_path)
+        logger.info("Merged overlay %s: %d files changed", self.overlay_id, len(changed))
+        self.discard()
+        return changed
+
+    def discard(self) -> None:
+        """Delete the overlay, leaving the working directory as it is."""
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.manifest = None
+
+    def __repr__(self) -> str:
+        return f"OverlaySandbox({self.root!r}, {self.overlay_id!r})"
@@ -0,0 +1,239 @@
+"""
+Typed tool payloads.
+
+Tools still return strings, so existing callers keep working, but the
+strings can be payload objects that also carry a structured form for the
+model's FunctionResponse: text with the byte range it covers, a summary of
+a binary file instead of replacement characters, or a reference to a blob
+in the local store instead of a large inline copy.
+"""
+
+import codecs
+import mimetypes
+from typing import Tuple
+
+# Longest UTF-8 encoding of one character
+MAX_CHAR_BYTES = 4
+
+
+def looks_binary(sample: bytes) -> bool:
+    """Guess whether data is binary from its first bytes.
+
+    Args:
+        sample: Leading bytes of the data; may end mid-character.
+
+    Returns:
+        True if the sample contains NUL bytes or is not valid UTF-8.
+    """
+    if b"\0" in sample:
+        return True
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return True
+    return False
+
+
+def decode_slice(data: bytes, offset: int, total_bytes: int, limit: int) -> Tuple[str, int, int]:
+    """Decode up to ``limit`` characters of UTF-8 read at byte ``offset``.
+
+    A slice may start or end inside a character: leading continuation bytes
+    are skipped and a character cut off at the end is left for the next
+    slice. Stray invalid bytes are replaced but still counted, so the
+    returned byte range is exact.
+
+    Args:
+        data: Bytes read at ``offset`` (``limit * MAX_CHAR_BYTES`` suffice).
+        offset: Byte offset ``data`` was read at.
+        total_bytes: Size of the whole file or blob.
+        limit: Maximum characters to decode.
+
+    Returns:
+        The text and the byte offsets where it starts and ends.
+    """
+    skipped = 0
+    while skipped < min(len(data), MAX_CHAR_BYTES - 1) and 0x80 <= data[skipped] < 0xC0:
+        skipped += 1
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="surrogateescape")
+    text = decoder.decode(data[skipped:], offset + len(data) >= total_bytes)[:limit]
+    start = offset + skipped
+    try:
+        return text, start, start + len(text.encode("utf-8"))
+    except UnicodeEncodeError:
+        raw = text.encode("utf-8", errors="surrogateescape")
+        return raw.decode("utf-8", errors="replace"), start, start + len(raw)
+
+
+class ToolPayload(str):
+    """A tool result string with a structured payload for the model."""
+
+    kind = "result"
+
+    def __new__(cls, text: str, /, **fields):
+        payload = super().__new__(cls, text)
+        payload.fields = fields
+        return payload
+
+    def __reduce__(self):
+        # Subclass constructors take fields, not the final text
+        return _restore_payload, (type(self), str(self), self.fields)
+
+    def to_response(self) -> dict:
+        """Return the payload as a FunctionResponse ``response`` dict."""
+        return {"type": self.kind, **self.fields}
+
+    def summary(self) -> str:
+        """Describe the payload in one line for logs."""
+        return f"{self.kind} payload ({len(self)} chars)"
+
+
+class TextPayload(ToolPayload):
+    """A decoded slice of a text file and the byte range it came from."""
+
+    kind = "text"
+
+    def __new__(cls, text: str, path: str, byte_offset: int, byte_end: int, total_bytes: int):
+        fields = {
+            "path": path,
+            "text": text,
+            "byte_offset": byte_offset,
+            "byte_end": byte_end,
+            "total_bytes": total_bytes,
+        }
+        if byte_end < total_bytes:
+            fields["next_offset"] = byte_end
+            text += (
+                f'\n[...File "{path}" truncated at byte {byte_end} of {total_bytes}; '
+                f"read more with offset={byte_end}]"
+            )
+        return super().__new__(cls, text, **fields)
+
+    def summary(self) -> str:
+        fields = self.fields
+        return (
+            f'text "{fields["path"]}" bytes {fields["byte_offset"]}-{fields["byte_end"]}'
+            f' of {fields["total_bytes"]}'
+        )
+
+
+class BinaryPayload(ToolPayload):
+    """Summary of a binary file whose bytes were copied to the blob store."""
+
+    kind = "binary"
+
+    def __new__(cls, path: str, size: int, blob: str, head: bytes = b""):
+        mime_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        text = (
+            f'Binary file "{path}" ({size} bytes, {mime_type}) stored as blob {blob}; '
+            f"use read_blob to read its bytes."
+        )
+        return super().__new__(
+            cls,
+            text,
+            path=path,
+            size=size,
+            mime_type=mime_type,
+            blob=blob,
+            head_hex=head.hex(),
+        )
+
+    def summary(self) -> str:
+        fields = self.fields
+        return f'binary "{fields["path"]}" ({fields["size"]} bytes) {fields["blob"]}'
+
+
+class BlobPayload(ToolPayload):
+    """A large result kept in the blob store, with its head and tail inline."""
+
+    kind = "blob"
+
+    def __new__(cls, blob: str, size: int, head: str, tail: str):
+        text = (
+            f"{head}\n[... {size} bytes in total, stored as blob {blob}; "
+            f"use read_blob to read the rest ...]\n{tail}"
+        )
+        return super().__new__(cls, text, blob=blob, size=size, head=head, tail=tail)
+
+    def summary(self) -> str:
+        return f'blob {self.fields["blob"]} ({self.fields["size"]} bytes)'
+
+
+def _restore_payload(cls: type, text: str, fields: dict) -> ToolPayload:
+    payload = str.__new__(cls, text)
+    payload.fields = fields
+    return payload
+
+
+_PAYLOAD_TYPES = {cls.kind: cls for cls in (ToolPayload, TextPayload, BinaryPayload, BlobPayload)}
+
+
+def dump_result(result: str):
+    """Return a JSON-compatible form of a tool result that keeps its payload type."""
+    if isinstance(result, ToolPayload):
+        return {"kind": result.kind, "text": str(result), "fields": result.fields}
+    return result
+
+
+def load_result(value) -> str:
+    """Rebuild a tool result from ``dump_result`` output."""
+    if isinstance(value, dict):
+        cls = _PAYLOAD_TYPES.get(value["kind"], ToolPayload)
+        return _restore_payload(cls, value["text"], value["fields"])
+    return value
+
+
+def to_response(result: str) -> dict:
+    """Return the FunctionResponse ``response`` dict for a tool result."""
+    if isinstance(result, ToolPayload):
+        return result.to_response()
+    return {"result": result}
+
+
+def summarize(result: str, limit: int = 200) -> str:
+    """Describe a tool result for logging without copying large payloads."""
+    if isinstance(result, ToolPayload):
+        return result.summary()
+    if len(result) > limit:
+        return f"{result[:limit]}... ({len(result)} chars)"
+    return result
+
+
+def summarize_args(arguments: dict, limit: int = 200) -> dict:
+    """Cap each tool argument for logging, e.g. the content given to write_file.
+
+    Args:
+        arguments: The tool call's arguments.
+        limit: Longest string (or ``repr`` of other values) kept whole.
+
+    Returns:
+        A new dict with long values shortened and their full length noted.
+    """
+    summary = {}
+    for name, value in arguments.items():
+        if isinstance(value, str):
+            summary[name] = summarize(value, limit)
+            continue
+        text = repr(value)
+        summary[name] = value if len(text) <= limit else summarize(text, limit)
+    return summary
+
+
+def blob_or_inline(result: str, store, max_chars: int, preview_chars: int) -> str:
+    """Move a result longer than ``max_chars`` to the blob store.
+
+    Args:
+        result: The tool result.
+        store: The BlobStore to write to.
+        max_chars: Longest result returned inline.
+        preview_chars: Characters kept inline from each end of a stored result.
+
+    Returns:
+        ``result`` itself, or a BlobPayload referencing the stored bytes.
+    """
+    if len(result) <= max_chars:
+        return result
+    data = result.encode("utf-8")
+    return BlobPayload(
+        store.put(data), len(data), result[:preview_chars], result[-preview_chars:]
+    )
+
@@ -0,0 +1,255 @@
+"""
+Speculative prefetching of likely next reads.
+
+The agent usually lists a directory, then reads files in it, then reads
+the modules those files import, waiting for a model round trip between
+each step. After get_files_info or get_file_content returns, the
+prefetcher reads small sibling files and imported modules on background
+threads into the session's tool result cache, so that the model's next
+read is served from memory. Only text files are prefetched. Unused
+prefetched results are held within a character budget, a newer trigger or
+a workspace change cancels queued reads, and hit/miss counters show
+whether prefetching pays off. ``stop`` ends the reader threads when the
+session is over.
+"""
+
+import os
+import queue
+import posixpath
+import logging
+import threading
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+from .code_index import index_module
+from .payloads import looks_binary
+from .config import (
+    BINARY_SNIFF_BYTES,
+    PREFETCH_MAX_CHARS,
+    PREFETCH_MAX_FILE_BYTES,
+    PREFETCH_MAX_FILES,
+    PREFETCH_WORKERS,
+)
+
+if TYPE_CHECKING:
+    from .registry import ToolContext, ToolRegistry
+
+logger = logging.getLogger(__name__)
+
+# Tool whose results are prefetched
+_READ_TOOL = "get_file_content"
+
+
+class Prefetcher:
+    """Warms a session's tool result cache with files it is likely to read next."""
+
+    def __init__(
+        self,
+        registry: "ToolRegistry",
+        context: "ToolContext",
+        max_files: int = PREFETCH_MAX_FILES,
+        max_file_bytes: int = PREFETCH_MAX_FILE_BYTES,
+        max_chars: int = PREFETCH_MAX_CHARS,
+        workers: int = PREFETCH_WORKERS,
+    ) -> None:
+        """Initialize the prefetcher.
+
+        Args:
+            registry: Registry used to run the read tool.
+            context: The session's tool context; must have a result cache.
+            max_files: Files prefetched per trigger.
+            max_file_bytes: Larger files are never prefetched.
+            max_chars: Characters of prefetched results not yet read by the
+                model that may be held at once.
+            workers: Background reader threads.
+        """
+        self.registry = registry
+        self.context = context
+        self.max_files = max_files
+        self.max_file_bytes = max_file_bytes
+        self.max_chars = max_chars
+        self.workers = workers
+        # Items are (generation, task), or None telling a reader to exit
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._stopped = False
+        self._unused: Dict[str, int] = {}
+        self._unused_chars = 0
+        self.counters = {
+            "triggers": 0,
+            "prefetched": 0,
+            "prefetch_hits": 0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "over_budget": 0,
+            "cancelled": 0,
+        }
+
+    def schedule(self, tool_name: str, arguments: dict, result: str) -> None:
+        """Queue prefetches following a tool call.
+
+        Args:
+            tool_name: The tool that just ran.
+            arguments: Its validated arguments.
+            result: Its result.
+        """
+        if tool_name == "get_files_info":
+            plan = partial(self._directory_candidates, arguments.get("directory") or ".")
+        elif tool_name == _READ_TOOL and not arguments.get("offset"):
+            plan = partial(self._file_candidates, arguments["file_path"])
+        else:
+            return
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            self.counters["triggers"] += 1
+        self._submit(generation, plan)
+
+    def record_lookup(self, key: str, hit: bool) -> None:
+        """Count a result cache lookup made on behalf of the model."""
+        with self._lock:
+            if not hit:
+                self.counters["cache_misses"] += 1
+                return
+            self.counters["cache_hits"] += 1
+            size = self._unused.pop(key, None)
+            if size is not None:
+                self.counters["prefetch_hits"] += 1
+                self._unused_chars -= size
+
+    def cancel(self) -> None:
+        """Drop queued prefetches (e.g. after a tool changed the workspace)."""
+        with self._lock:
+            self._generation += 1
+            self._unused.clear()
+            self._unused_chars = 0
+
+    def stop(self) -> None:
+        """Drop queued prefetches and wait for the reader threads to exit.
+
+        Later triggers are ignored.
+        """
+        with self._lock:
+            self._stopped = True
+            threads, self._threads = self._threads, []
+        self.cancel()
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    def metrics(self) -> dict:
+        """Return the counters plus hit rates."""
+        with self._lock:
+            metrics = dict(self.counters)
+            lookups = metrics["cache_hits"] + metrics["cache_misses"]
+            metrics["cache_hit_rate"] = (
+                round(metrics["cache_hits"] / lookups, 3) if lookups else None
+            )
+            metrics["prefetch_hit_rate"] = (
+                round(metrics["prefetch_hits"] / metrics["prefetched"], 3)
+                if metrics["prefetched"]
+                else None
+            )
+            metrics["unused_chars"] = self._unused_chars
+        return metrics
+
+    def _submit(self, generation: int, task: Callable[[], Optional[List[str]]]) -> None:
+        with self._lock:
+            if self._stopped:
+                return
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name="prefetch", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._queue.put((generation, task))
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            generation, task = item
+            if generation != self._generation:
+                with self._lock:
+                    self.counters["cancelled"] += 1
+                continue
+            try:
+                candidates = task()
+            except Exception as exc:
+                logger.debug("Prefetch failed: %s", exc)
+                continue
+            for rel_path in candidates or []:
+                self._queue.put((generation, partial(self._warm, rel_path)))
+
+    def _warm(self, rel_path: str) -> None:
+        with self._lock:
+            if self._unused_chars >= self.max_chars:
+                self.counters["over_budget"] += 1
+                return
+        warmed = self.registry.warm(_READ_TOOL, {"file_path": rel_path}, self.context)
+        if warmed is None:
+            return
+        key, size = warmed
+        with self._lock:
+            self.counters["prefetched"] += 1
+            if key not in self._unused:
+                self._unused[key] = size
+                self._unused_chars += size
+
+    def _small_files(self, directory: str, exclude: str = "") -> List[str]:
+        """Return small regular text files in ``directory``, Python modules first.
+
+        Args:
+            directory: A directory relative to the working directory.
+            exclude: A relative path to leave out.
+        """
+        entries = []
+        prefix = "" if directory == "." else f"{directory}/"
+        for name, full_path in (self.context.sandbox.listdir(directory) or {}).items():
+            rel_path = f"{prefix}{name}"
+            if rel_path == exclude or name.startswith("."):
+                continue
+            try:
+                if not os.path.isfile(full_path):
+                    continue
+                if not 0 < os.path.getsize(full_path) <= self.max_file_bytes:
+                    continue
+                with open(full_path, "rb") as f:
+                    # Binary reads would be stored in the blob store on disk
+                    if looks_binary(f.read(BINARY_SNIFF_BYTES)):
+                        continue
+            except OSError:
+                continue
+            entries.append(rel_path)
+        entries.sort(key=lambda path: (not path.endswith(".py"), path))
+        return entries
+
+    def _directory_candidates(self, directory: str) -> List[str]:
+        directory = self.context.sandbox.relative(directory)
+        if directory is None:
+            return []
+        return self._small_files(directory)[: self.max_files]
+
+    def _file_candidates(self, file_path: str) -> List[str]:
+        sandbox = self.context.sandbox
+        rel_path = sandbox.relative(file_path)
+        full_path = sandbox.resolve(file_path)
+        if full_path is None or not os.path.isfile(full_path):
+            return []
+        candidates = []
+        directory = posixpath.dirname(rel_path) or "."
+        if rel_path.endswith(".py"):
+            imports = index_module(full_path, rel_path)["imports"]
+            # Imports resolve from the root or, for scripts, from their own directory
+            bases = dict.fromkeys(["", "" if directory == "." else f"{directory}/"])
+            for module in imports:
+                parts = module.replace(".", "/")
+                for base in bases:
+                    for candidate in (f"{base}{parts}.py", f"{base}{parts}/__init__.py"):
+                        candidate_path = sandbox.resolve(candidate)
+                        if candidate_path is not None and os.path.isfile(candidate_path):
+                            candidates.append(candidate)
+        candidates += self._small_files(directory, exclude=rel_path)
+        return list(dict.fromkeys(candidates))[: self.max_files]
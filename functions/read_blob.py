@@ -0,0 +1,97 @@
+"""
+Blob reading function for the AI agent.
+
+Reads a byte range of a payload that another tool stored in the blob store
+(a large program output or a binary file) instead of returning it inline.
+"""
+
+from typing import Union
+from .blob_store import BlobStore
+from .config import BINARY_SNIFF_BYTES, MAX_FILE_CHARS
+from .payloads import MAX_CHAR_BYTES, TextPayload, decode_slice, looks_binary
+from .registry import register_tool
+from .sandbox import Sandbox
+
+# Bytes shown per line of a hex dump
+_HEX_LINE_BYTES = 32
+
+
+def _hex_dump(data: bytes, offset: int) -> str:
+    """Format bytes as ``offset: hex`` lines."""
+    return "\n".join(
+        f"{offset + start:08x}: {data[start:start + _HEX_LINE_BYTES].hex(' ')}"
+        for start in range(0, len(data), _HEX_LINE_BYTES)
+    )
+
+
+@register_tool(
+    "read_blob",
+    description=(
+        "Reads part of a stored tool payload by its blob reference (sha256:...), as text "
+        "or, for binary data, as a hex dump."
+    ),
+    parameters={
+        "type": "object",
+        "properties": {
+            "blob": {
+                "type": "string",
+                "description": "The blob reference returned by another tool.",
+            },
+            "offset": {
+                "type": "integer",
+                "description": "Byte offset to start reading at.",
+                "default": 0,
+            },
+            "limit": {
+                "type": "integer",
+                "description": f"Maximum characters to return (at most {MAX_FILE_CHARS}).",
+                "default": MAX_FILE_CHARS,
+            },
+        },
+        "required": ["blob"],
+    },
+)
+def read_blob(
+    working_directory: Union[str, Sandbox],
+    blob: str,
+    offset: int = 0,
+    limit: int = MAX_FILE_CHARS,
+) -> str:
+    """Read a byte range of a stored blob.
+
+    Args:
+        working_directory: The session's working directory; only blobs
+            stored by its tools can be read.
+        blob: The ``sha256:<hex>`` blob reference.
+        offset: Byte offset to start reading at.
+        limit: Maximum number of characters to return.
+
+    Returns:
+        A TextPayload for text blobs, a hex dump for binary ones, or an
+        error message.
+    """
+    try:
+        if offset < 0 or limit <= 0:
+            return "Error: offset must not be negative and limit must be positive"
+        limit = min(limit, MAX_FILE_CHARS)
+        store = BlobStore.for_sandbox(working_directory)
+        try:
+            total_bytes = store.size(blob)
+        except FileNotFoundError:
+            return f'Error: Blob "{blob}" not found'
+
+        if looks_binary(store.read(blob, 0, BINARY_SNIFF_BYTES)):
+            # Each byte takes about three characters of the dump
+            data = store.read(blob, offset, limit // 3)
+            dump = _hex_dump(data, offset)
+            if offset + len(data) < total_bytes:
+                next_offset = offset + len(data)
+                remaining = total_bytes - next_offset
+                dump += f"\n[...{remaining} more bytes; read more with offset={next_offset}]"
+            return dump
+
+        data = store.read(blob, offset, limit * MAX_CHAR_BYTES)
+        text, offset, byte_end = decode_slice(data, offset, total_bytes, limit)
+        return TextPayload(text, blob, offset, byte_end, total_bytes)
+    except Exception as exc:
+        return f"Error: {exc}"
@@ -0,0 +1,431 @@
+"""
+Tool registry for the AI agent.
+
+Tools register themselves with the ``register_tool`` decorator together
+with a JSON-schema description of their arguments. The registry dispatches
+calls by name in O(1), validates arguments with validators compiled once
+at registration, and builds the Gemini function declarations lazily.
+Third-party tools are picked up from the ``codepilot.tools`` entry-point
+group or from modules named in ``CODEPILOT_TOOL_MODULES``.
+"""
+
+import os
+import logging
+import importlib
+from typing import (
+    TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+)
+
+from .sandbox import Sandbox
+from .result_cache import Fingerprint, ToolResultCache, cache_key, file_fingerprint
+
+if TYPE_CHECKING:
+    from .prefetch import Prefetcher
+
+logger = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP = "codepilot.tools"
+
+_TYPE_CHECKS: Dict[str, Callable[[Any], bool]] = {
+    "string": lambda value: isinstance(value, str),
+    "boolean": lambda value: isinstance(value, bool),
+    "integer": lambda value: (
+        isinstance(value, int) and not isinstance(value, bool)
+    ) or (isinstance(value, float) and value.is_integer()),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "array": lambda value: isinstance(value, (list, tuple)),
+    "object": lambda value: isinstance(value, dict),
+}
+
+
+class ToolArgumentError(ValueError):
+    """Raised when a tool call's arguments do not match its schema."""
+
+
+class ToolFailure(str):
+    """A plain-text tool result reporting that the call failed."""
+
+    failed = True
+
+
+def mark_failed(result: str) -> str:
+    """Flag a tool result as a failed call.
+
+    Payload results keep their type and carry the flag as an attribute.
+    """
+    if type(result) is str:
+        return ToolFailure(result)
+    result.failed = True
+    return result
+
+
+def is_failure(result: str) -> bool:
+    """Check the failure flag set by ``mark_failed`` or by ``dispatch``.
+
+    Tool errors and scripts that exited with a non-zero code are flagged;
+    text that merely looks like an error (file contents, a symbol lookup
+    that found nothing) is not.
+    """
+    return getattr(result, "failed", False)
+
+
+def _compile_validator(schema: dict, path: str) -> Callable[[Any], Any]:
+    """Compile a JSON schema into a function that validates and normalizes a value.
+
+    Supports the subset used for tool parameters: ``type`` (string, boolean,
+    integer, number, array, object), ``items``, ``properties``, ``required``
+    and ``default``.
+
+    Args:
+        schema: The JSON schema.
+        path: Name of the value in error messages.
+
+    Returns:
+        A validator returning the normalized value or raising ToolArgumentError.
+    """
+    kind = schema.get("type", "object")
+    if kind not in _TYPE_CHECKS:
+        raise ValueError(f"unsupported schema type {kind!r} for {path or 'arguments'}")
+    check = _TYPE_CHECKS[kind]
+    label = path or "arguments"
+
+    if kind == "integer":
+        def validate(value: Any) -> Any:
+            if not check(value):
+                raise ToolArgumentError(f"{label} must be an integer")
+            return int(value)
+        return validate
+
+    if kind == "array":
+        item_validator = (
+            _compile_validator(schema["items"], f"{label} items") if "items" in schema else None
+        )
+
+        def validate(value: Any) -> Any:
+            if not check(value):
+                raise ToolArgumentError(f"{label} must be an array")
+            if item_validator is None:
+                return list(value)
+            return [item_validator(item) for item in value]
+        return validate
+
+    if kind == "object":
+        properties = {
+            name: _compile_validator(prop, name if not path else f"{path}.{name}")
+            for name, prop in schema.get("properties", {}).items()
+        }
+        required = tuple(schema.get("required", ()))
+        defaults = {
+            name: prop["default"]
+            for name, prop in schema.get("properties", {}).items()
+            if "default" in prop
+        }
+
+        def validate(value: Any) -> Any:
+            if not check(value):
+                raise ToolArgumentError(f"{label} must be an object")
+            for name in required:
+                if value.get(name) is None:
+                    raise ToolArgumentError(f"{name} is required")
+            result = dict(defaults)
+            for name, item in value.items():
+                validator = properties.get(name)
+                if validator is None:
+                    raise ToolArgumentError(f"unexpected argument '{name}'")
+                if item is not None:
+                    result[name] = validator(item)
+            return result
+        return validate
+
+    def validate(value: Any) -> Any:
+        if not check(value):
+            raise ToolArgumentError(f"{label} must be a {kind}")
+        return value
+    return validate
+
+
+def _to_genai_schema(schema: dict):
+    """Convert a JSON schema into a google.genai Schema."""
+    from google.genai import types
+
+    return types.Schema(
+        type=schema.get("type", "object").upper(),
+        description=schema.get("description"),
+        properties=(
+            {name: _to_genai_schema(prop) for name, prop in schema["properties"].items()}
+            if "properties" in schema
+            else None
+        ),
+        items=_to_genai_schema(schema["items"]) if "items" in schema else None,
+        required=list(schema["required"]) if schema.get("required") else None,
+    )
+
+
+class Tool:
+    """A registered tool: implementation, argument schema and compiled validator."""
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[..., str],
+        description: str,
+        parameters: dict,
+        options: Sequence[str] = (),
+        cached_by: Optional[str] = None,
+        mutates: bool = False,
+    ) -> None:
+        """Initialize the tool.
+
+        Args:
+            name: The name the model calls the tool by.
+            fn: Implementation, called as ``fn(sandbox, **arguments)``.
+            description: Description shown to the model.
+            parameters: JSON schema of the arguments object.
+            options: Session options (see ToolContext) passed through as
+                keyword arguments when set.
+            cached_by: For read-only tools, the argument naming the file the
+                result depends on; results are cached while it is unchanged.
+            mutates: The tool may change the workspace, so cached results are
+                dropped after it runs.
+        """
+        self.name = name
+        self.fn = fn
+        self.description = description
+        self.parameters = parameters
+        self.options = tuple(options)
+        self.cached_by = cached_by
+        self.mutates = mutates
+        self.validate = _compile_validator(parameters, "")
+        self._declaration = None
+
+    @property
+    def declaration(self):
+        """The google.genai FunctionDeclaration, built on first access."""
+        if self._declaration is None:
+            from google.genai import types
+
+            self._declaration = types.FunctionDeclaration(
+                name=self.name,
+                description=self.description,
+                parameters=_to_genai_schema(self.parameters),
+            )
+        return self._declaration
+
+
+class ToolContext:
+    """Per-session state shared by every tool call."""
+
+    def __init__(
+        self,
+        working_directory: Union[str, Sandbox],
+        result_cache: Optional[ToolResultCache] = None,
+        prefetcher: Optional["Prefetcher"] = None,
+        **options: Any,
+    ) -> None:
+        """Initialize the context.
+
+        Args:
+            working_directory: The session's sandbox root.
+            result_cache: Cache for read-only tool results, if enabled.
+            prefetcher: Warms ``result_cache`` with likely next reads after
+                each tool call, if enabled.
+            **options: Session options forwarded to tools that declare them
+                (e.g. ``in_process`` for run_python_file).
+        """
+        self.sandbox = Sandbox.of(working_directory)
+        self.result_cache = result_cache
+        self.prefetcher = prefetcher
+        self.options = options
+
+
+class ToolRegistry:
+    """Name-indexed collection of tools."""
+
+    def __init__(self) -> None:
+        self._tools: Dict[str, Tool] = {}
+        self._plugins_loaded = False
+
+    def register(
+        self,
+        name: str,
+        description: str,
+        parameters: dict,
+        options: Sequence[str] = (),
+        cached_by: Optional[str] = None,
+        mutates: bool = False,
+    ) -> Callable[[Callable[..., str]], Callable[..., str]]:
+        """Decorator registering a tool function under ``name``.
+
+        Args:
+            name: The name the model calls the tool by.
+            description: Description shown to the model.
+            parameters: JSON schema of the arguments object.
+            options: Session options the tool accepts as keyword arguments.
+            cached_by: Argument naming the file a read-only tool's result
+                depends on (see Tool).
+            mutates: Whether the tool may change the workspace.
+
+        Returns:
+            A decorator that registers the function and returns it unchanged.
+        """
+        def decorator(fn: Callable[..., str]) -> Callable[..., str]:
+            if name in self._tools:
+                raise ValueError(f"tool {name!r} is already registered")
+            self._tools[name] = Tool(
+                name, fn, description, parameters, options, cached_by, mutates
+            )
+            return fn
+        return decorator
+
+    def get(self, name: str) -> Optional[Tool]:
+        """Return the tool registered as ``name``, if any."""
+        return self._tools.get(name)
+
+    def names(self) -> List[str]:
+        """Return registered tool names in registration order."""
+        return list(self._tools)
+
+    def declaration(self, name: str):
+        """Return the function declaration of one tool."""
+        return self._tools[name].declaration
+
+    def declarations(self) -> List:
+        """Return the function declarations of every registered tool."""
+        return [tool.declaration for tool in self._tools.values()]
+
+    def dispatch(self, name: str, arguments: Optional[dict], context: ToolContext) -> str:
+        """Validate arguments and run a tool.
+
+        Args:
+            name: The tool name.
+            arguments: Arguments supplied by the model.
+            context: The session's tool context.
+
+        Returns:
+            The tool result, or an error message for the model. Errors
+            (plain-string results starting with "Error") and results a tool
+            flagged with ``mark_failed`` are reported by ``is_failure``.
+        """
+        tool = self._tools.get(name)
+        if tool is None:
+            return ToolFailure(f"Error: Unknown function '{name}'")
+        try:
+            kwargs = tool.validate(arguments or {})
+        except ToolArgumentError as exc:
+            return ToolFailure(f"Error: {exc}")
+        cache = context.result_cache
+        prefetcher = context.prefetcher
+        key = fingerprint = None
+        if cache is not None and tool.cached_by:
+            key, fingerprint = self._cache_entry(tool, kwargs, context.sandbox)
+            cached = cache.get(key, fingerprint)
+            if prefetcher is not None:
+                prefetcher.record_lookup(key, cached is not None)
+            if cached is not None:
+                if prefetcher is not None:
+                    prefetcher.schedule(name, kwargs, cached)
+                return cached
+
+        for option in tool.options:
+            if option in context.options:
+                kwargs[option] = context.options[option]
+        try:
+            result = tool.fn(context.sandbox, **kwargs)
+        except Exception as exc:
+            result = f"Error executing function: {exc}"
+        # Tools report errors as plain strings; payloads are output, whatever they say
+        if type(result) is str and result.startswith("Error"):
+            result = mark_failed(result)
+
+        if cache is not None:
+            if tool.mutates:
+                cache.clear()
+            elif key is not None and not is_failure(result):
+                cache.put(key, fingerprint, result)
+        if prefetcher is not None:
+            if tool.mutates:
+                prefetcher.cancel()
+            elif not is_failure(result):
+                prefetcher.schedule(name, kwargs, result)
+        return result
+
+    @staticmethod
+    def _cache_entry(
+        tool: Tool, kwargs: dict, sandbox: Sandbox
+    ) -> Tuple[str, Optional[Fingerprint]]:
+        """Return the result-cache key and file fingerprint of a cacheable call.
+
+        The path argument is normalized so that ``./a.py`` and ``a.py`` share
+        an entry.
+        """
+        path = kwargs.get(tool.cached_by) or ""
+        relative = sandbox.relative(path)
+        if relative is None:
+            return cache_key(tool.name, kwargs), None
+        key = cache_key(tool.name, {**kwargs, tool.cached_by: relative})
+        return key, file_fingerprint(sandbox.resolve(path))
+
+    def warm(self, name: str, arguments: dict, context: ToolContext) -> Optional[Tuple[str, int]]:
+        """Run a cacheable tool ahead of time and store its result.
+
+        Used by the prefetcher; results already cached, errors and tools
+        that are not cacheable are skipped.
+
+        Args:
+            name: The tool name.
+            arguments: Arguments as the model would pass them.
+            context: The session's tool context.
+
+        Returns:
+            The cache key and size of the stored result, or None.
+        """
+        tool = self._tools.get(name)
+        cache = context.result_cache
+        if tool is None or cache is None or not tool.cached_by:
+            return None
+        try:
+            kwargs = tool.validate(arguments)
+        except ToolArgumentError:
+            return None
+        key, fingerprint = self._cache_entry(tool, kwargs, context.sandbox)
+        if fingerprint is None or cache.peek(key, fingerprint) is not None:
+            return None
+        try:
+            result = tool.fn(context.sandbox, **kwargs)
+        except Exception:
+            return None
+        if result.startswith("Error"):
+            return None
+        cache.put(key, fingerprint, result)
+        return key, len(result)
+
+    def load_plugins(self, modules: Iterable[str] = ()) -> None:
+        """Import third-party tool modules so that their tools register.
+
+        Modules come from the ``codepilot.tools`` entry-point group, the
+        comma-separated ``CODEPILOT_TOOL_MODULES`` environment variable and
+        ``modules``. Entry points are only scanned once per process.
+
+        Args:
+            modules: Additional module names to import.
+        """
+        names = list(modules)
+        names += [m.strip() for m in os.environ.get("CODEPILOT_TOOL_MODULES", "").split(",")]
+        if not self._plugins_loaded:
+            from importlib import metadata
+
+            self._plugins_loaded = True
+            for entry_point in metadata.entry_points(group=ENTRY_POINT_GROUP):
+                try:
+                    entry_point.load()
+                except Exception as exc:
+                    logger.warning("Failed to load tool plugin %s: %s", entry_point.name, exc)
+        for module in filter(None, names):
+            try:
+                importlib.import_module(module)
+            except Exception as exc:
+                logger.warning("Failed to load tool module %s: %s", module, exc)
+
+
+registry = ToolRegistry()
+register_tool = registry.register
@@ -0,0 +1,115 @@
+"""
+Cache of read-only tool results.
+
+Results are keyed by tool name and arguments and stored together with a
+fingerprint (modification time and size) of the file they were read from,
+so an entry is only served while the file on disk is unchanged. The cache
+is bounded by the total size of the stored results and can be serialized
+into a session checkpoint, typed payloads included.
+"""
+
+import os
+import json
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from .config import RESULT_CACHE_MAX_CHARS
+from .payloads import dump_result, load_result
+
+Fingerprint = Tuple[int, int]
+
+
+def file_fingerprint(path: str) -> Optional[Fingerprint]:
+    """Return (mtime_ns, size) of ``path``, or None if it cannot be stat'ed."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def cache_key(tool_name: str, arguments: dict) -> str:
+    """Build the cache key for a tool call."""
+    return f"{tool_name}:{json.dumps(arguments, sort_keys=True)}"
+
+
+class ToolResultCache:
+    """Size-bounded LRU cache of tool results validated by file fingerprints."""
+
+    def __init__(self, max_chars: int = RESULT_CACHE_MAX_CHARS) -> None:
+        """Initialize the cache.
+
+        Args:
+            max_chars: Total result characters kept before evicting the
+                least recently used entries.
+        """
+        self.max_chars = max_chars
+        self._entries: "OrderedDict[str, Tuple[Fingerprint, str]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, fingerprint: Optional[Fingerprint]) -> Optional[str]:
+        """Return the cached result for ``key`` if its file is unchanged."""
+        result = self.peek(key, fingerprint)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def peek(self, key: str, fingerprint: Optional[Fingerprint]) -> Optional[str]:
+        """Like ``get`` but without counting a hit or miss."""
+        if fingerprint is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if tuple(entry[0]) != tuple(fingerprint):
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: str, fingerprint: Optional[Fingerprint], result: str) -> None:
+        """Store ``result`` for ``key``; results larger than the budget are skipped."""
+        if fingerprint is None or len(result) > self.max_chars:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (tuple(fingerprint), result)
+            self._size += len(result)
+            while self._size > self.max_chars:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        """Drop every entry (e.g. after a tool changed the workspace)."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def to_list(self) -> List[list]:
+        """Serialize entries, oldest first, as JSON-compatible lists."""
+        with self._lock:
+            return [
+                [key, list(fp), dump_result(result)] for key, (fp, result) in self._entries.items()
+            ]
+
+    @classmethod
+    def from_list(cls, entries: List[list], max_chars: int = RESULT_CACHE_MAX_CHARS):
+        """Rebuild a cache from ``to_list`` output."""
+        cache = cls(max_chars)
+        for key, fingerprint, result in entries:
+            cache.put(key, tuple(fingerprint), load_result(result))
+        return cache
@@ -2,45 +2,93 @@
 Safe Python file execution function for the AI agent.
 
 Executes Python files with subprocess isolation and timeout protection.
+Allow-listed entry points can optionally run in-process instead. Output
+too large to inline is kept in the blob store behind a preview.
 """
 
 import os
 import subprocess
-from typing import List, Optional
-from google.genai import types
+from typing import List, Optional, Union
+from .blob_store import BlobStore
+from .code_index import notify_changed
+from .config import BLOB_PREVIEW_CHARS, MAX_INLINE_RESULT_CHARS
+from .inprocess_runner import InProcessTimeout, run_in_process
+from .payloads import blob_or_inline
+from .registry import mark_failed, register_tool
+from .sandbox import Sandbox
 
 # Timeout for script execution in seconds
 EXECUTION_TIMEOUT_SECONDS = 30
 
 
-def _is_within_directory(base: str, target: str) -> bool:
-    """Check if target path is within base directory.
-    
+def _format_output(stdout: str, stderr: str, returncode: int, store: BlobStore) -> str:
+    """Format captured output the way the agent expects to see it.
+
     Args:
-        base: The base directory path.
-        target: The target path to check.
-        
+        stdout: Captured standard output.
+        stderr: Captured standard error.
+        returncode: The process exit code.
+        store: The session's blob store, for output too long to inline.
+
     Returns:
-        True if target is within base, False otherwise.
+        The formatted STDOUT/STDERR/exit code report, as a BlobPayload if it
+        is longer than MAX_INLINE_RESULT_CHARS, flagged as failed for a
+        non-zero exit code.
     """
-    base_abs = os.path.abspath(base)
-    target_abs = os.path.abspath(target)
-    try:
-        common = os.path.commonpath([base_abs, target_abs])
-    except ValueError:
-        return False
-    return common == base_abs
+    stdout = stdout.strip()
+    stderr = stderr.strip()
+
+    if not stdout and not stderr and returncode == 0:
+        return "No output produced."
+
+    parts = []
+    if stdout:
+        parts.append(f"STDOUT:\n{stdout}")
+    if stderr:
+        parts.append(f"STDERR:\n{stderr}")
+    if returncode != 0:
+        parts.append(f"Process exited with code {returncode}")
+    result = blob_or_inline("\n".join(parts), store, MAX_INLINE_RESULT_CHARS, BLOB_PREVIEW_CHARS)
+    return mark_failed(result) if returncode != 0 else result
 
 
+@register_tool(
+    "run_python_file",
+    description=(
+        "Executes a Python file with optional args, returning STDOUT/STDERR and exit code."
+    ),
+    parameters={
+        "type": "object",
+        "properties": {
+            "file_path": {
+                "type": "string",
+                "description": "Relative path of the Python file to execute.",
+            },
+            "args": {
+                "type": "array",
+                "description": "Optional list of string args to pass to the program.",
+                "items": {"type": "string"},
+            },
+        },
+        "required": ["file_path"],
+    },
+    options=("in_process",),
+    mutates=True,
+)
 def run_python_file(
-    working_directory: str, file_path: str, args: Optional[List[str]] = None
+    working_directory: Union[str, Sandbox],
+    file_path: str,
+    args: Optional[List[str]] = None,
+    in_process: bool = False,
 ) -> str:
     """Execute a Python file with optional arguments.
     
     Args:
-        working_directory: The base working directory.
+        working_directory: The base working directory (or the session's Sandbox).
         file_path: The path to the Python file, relative to working_directory.
         args: Optional list of command-line arguments.
+        in_process: Run allow-listed entry points in this interpreter,
+            falling back to a subprocess when that is not possible.
         
     Returns:
         The stdout/stderr output or error message.
@@ -49,8 +97,9 @@ def run_python_file(
         if args is None:
             args = []
 
-        full_path = os.path.join(working_directory, file_path)
-        if not _is_within_directory(working_directory, full_path):
+        sandbox = Sandbox.of(working_directory)
+        full_path = sandbox.resolve(file_path)
+        if full_path is None:
             return f'Error: Cannot execute "{file_path}" as it is outside the permitted working directory'
 
         if not os.path.exists(full_path):
@@ -59,14 +108,29 @@ def run_python_file(
         if not file_path.endswith(".py"):
             return f'Error: "{file_path}" is not a Python file.'
 
+        # The script may create or change modules
+        notify_changed(sandbox)
+
+        cwd = sandbox.execution_root()
+        store = BlobStore.for_sandbox(sandbox)
+        if in_process:
+            try:
+                captured = run_in_process(cwd, file_path, args)
+            except InProcessTimeout as exc:
+                # Not retried: the script must not run twice at once
+                return f"Error: {exc}"
+            if captured is not None:
+                return _format_output(*captured, store)
+
         # Execute using file_path relative to the working directory to avoid duplicating the path
         cmd = ["python", file_path, *args]
         try:
             completed = subprocess.run(
                 cmd,
-                cwd=working_directory,
+                cwd=cwd,
                 capture_output=True,
                 text=True,
+                errors="backslashreplace",
                 timeout=EXECUTION_TIMEOUT_SECONDS,
             )
         except subprocess.TimeoutExpired:
@@ -74,44 +138,6 @@ def run_python_file(
         except Exception as exc:
             return f"Error executing Python file: {exc}"
 
-        stdout = completed.stdout.strip()
-        stderr = completed.stderr.strip()
-
-        if not stdout and not stderr and completed.returncode == 0:
-            return "No output produced."
-
-        parts = []
-        if stdout:
-            parts.append(f"STDOUT:\n{stdout}")
-        if stderr:
-            parts.append(f"STDERR:\n{stderr}")
-        if completed.returncode != 0:
-            parts.append(f"Process exited with code {completed.returncode}")
-        return "\n".join(parts)
+        return _format_output(completed.stdout, completed.stderr, completed.returncode, store)
     except Exception as exc:
         return f"Error: {exc}"
-
-
-# Function schema for tools API
-schema_run_python_file = types.FunctionDeclaration(
-    name="run_python_file",
-    description=(
-        "Executes a Python file with optional args, returning STDOUT/STDERR and exit code."
-    ),
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "file_path": types.Schema(
-                type=types.Type.STRING,
-                description="Relative path of the Python file to execute.",
-            ),
-            "args": types.Schema(
-                type=types.Type.ARRAY,
-                description="Optional list of string args to pass to the program.",
-                items=types.Schema(type=types.Type.STRING),
-            ),
-        },
-    ),
-)
-
-
@@ -0,0 +1,130 @@
+"""
+Shared path sandboxing for the agent's tools.
+
+Every tool confines the paths it is given to the session's working
+directory. The directory is resolved once per session and reused for every
+check instead of being recomputed by each tool on each call. Tools go
+through the sandbox for every path they read, write, list or run in, so
+that a subclass (see ``overlay.OverlaySandbox``) can present a different
+view of the same directory.
+"""
+
+import os
+from typing import Container, Dict, Iterator, Optional, Tuple, Union
+
+
+def walk_files(top: str, skip_dirs: Container[str] = ()) -> Iterator[Tuple[str, str]]:
+    """Yield ``(relative_path, full_path)`` for every file under ``top``.
+
+    Relative paths use ``/`` separators. Symbolic links to directories are
+    not followed.
+
+    Args:
+        top: The directory to walk.
+        skip_dirs: Names of directories to skip at any depth.
+    """
+    for dirpath, dirnames, filenames in os.walk(top):
+        dirnames[:] = [d for d in dirnames if d not in skip_dirs]
+        for filename in filenames:
+            full_path = os.path.join(dirpath, filename)
+            yield os.path.relpath(full_path, top).replace(os.sep, "/"), full_path
+
+
+class Sandbox:
+    """A working directory that tool paths are confined to."""
+
+    def __init__(self, working_directory: str) -> None:
+        """Initialize the sandbox.
+
+        Args:
+            working_directory: The directory tools may operate in.
+        """
+        self.root = os.path.abspath(working_directory)
+        self._normalized_root = os.path.normcase(self.root)
+        self._normalized_prefix = os.path.join(self._normalized_root, "")
+        # Identifies the view of the files tools see (e.g. for per-view indexes)
+        self.key = self.root
+
+    @classmethod
+    def of(cls, working_directory: Union[str, "Sandbox"]) -> "Sandbox":
+        """Return ``working_directory`` as a Sandbox, reusing an existing one."""
+        if isinstance(working_directory, Sandbox):
+            return working_directory
+        return cls(working_directory)
+
+    def contains(self, full_path: str) -> bool:
+        """Check whether an absolute, normalized path lies inside the sandbox."""
+        normalized = os.path.normcase(full_path)
+        return normalized == self._normalized_root or normalized.startswith(
+            self._normalized_prefix
+        )
+
+    def _join(self, path: str) -> Optional[str]:
+        full_path = os.path.abspath(os.path.join(self.root, path))
+        return full_path if self.contains(full_path) else None
+
+    def resolve(self, path: str) -> Optional[str]:
+        """Resolve ``path`` relative to the sandbox root for reading.
+
+        Args:
+            path: A path relative to the working directory.
+
+        Returns:
+            The absolute path, or None if it escapes the working directory.
+        """
+        return self._join(path)
+
+    def resolve_for_write(self, path: str) -> Optional[str]:
+        """Resolve ``path`` relative to the sandbox root for writing.
+
+        Args:
+            path: A path relative to the working directory.
+
+        Returns:
+            The absolute path, or None if it escapes the working directory.
+        """
+        return self._join(path)
+
+    def relative(self, path: str) -> Optional[str]:
+        """Return ``path`` normalized relative to the root, with ``/`` separators.
+
+        Returns:
+            The relative path (``.`` for the root itself), or None if it
+            escapes the working directory.
+        """
+        full_path = self._join(path)
+        if full_path is None:
+            return None
+        return os.path.relpath(full_path, self.root).replace(os.sep, "/")
+
+    def listdir(self, path: str) -> Optional[Dict[str, str]]:
+        """List a directory.
+
+        Args:
+            path: A directory relative to the working directory.
+
+        Returns:
+            A mapping of entry name to the full path to read it at, or None
+            if ``path`` escapes the working directory or is not a directory.
+        """
+        full_path = self.resolve(path)
+        if full_path is None or not os.path.isdir(full_path):
+            return None
+        return {name: os.path.join(full_path, name) for name in os.listdir(full_path)}
+
+    def walk(self, skip_dirs: Container[str] = ()) -> Iterator[Tuple[str, str]]:
+        """Yield ``(relative_path, full_path)`` for every file in the sandbox."""
+        return walk_files(self.root, skip_dirs)
+
+    def execution_root(self) -> str:
+        """Return the directory scripts run in."""
+        return self.root
+
+    def __fspath__(self) -> str:
+        return self.root
+
+    def __str__(self) -> str:
+        return self.root
+
+    def __repr__(self) -> str:
+        return f"Sandbox({self.root!r})"
@@ -8,27 +8,44 @@ edit, and execute Python code within a sandboxed project workspace.
 import os
 import sys
 import logging
+import time
 import argparse
-from typing import Optional, Tuple
-
-from dotenv import load_dotenv
-from google import genai
-from google.genai import types
-from functions.get_files_info import schema_get_files_info, get_files_info
-from functions.get_file_content import schema_get_file_content, get_file_content
-from functions.write_file import schema_write_file, write_file
-from functions.run_python_file import schema_run_python_file, run_python_file
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union
+
+# The google.genai SDK and dotenv take most of a second to import, so they
+# are only imported once a model call is actually made.
+from functions import Sandbox, ToolContext, get_file_content, registry
+from functions.payloads import summarize, summarize_args, to_response
+from functions.prefetch import Prefetcher
+from functions.result_cache import ToolResultCache
+from agent.config import FAST_MODEL, MAX_ITERATIONS, STRONG_MODEL
+from agent.routing import ModelRouter
+
+if TYPE_CHECKING:
+    from google import genai
+
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = """
+You are a helpful AI coding agent.
+
+When a user asks a question or makes a request, make a function call plan. You can perform the following operations:
+
+- List files and directories
+- Read file contents
+- Find where Python symbols are defined and called, and outline Python files
+- Write or create files
+- Execute Python files
+- Read large or binary tool outputs stored as blobs
+
+All paths you provide should be relative to the working directory. You do not need to specify the working directory in your function calls as it is automatically injected for security reasons.
+""".strip()
+
 
 def get_env_api_key() -> Optional[str]:
     """Load and return the Gemini API key from environment."""
+    from dotenv import load_dotenv
+
     load_dotenv()
     api_key = os.environ.get("GEMINI_API_KEY")
     if not api_key:
@@ -41,7 +58,7 @@ def print_greeting() -> None:
     logger.info("CodePilot initialized successfully")
 
 
-def count_prompt_tokens(client: genai.Client, model: str, messages: list) -> Optional[int]:
+def count_prompt_tokens(client: "genai.Client", model: str, messages: list) -> Optional[int]:
     """Count the number of tokens in a prompt message list.
     
     Args:
@@ -62,7 +79,7 @@ def count_prompt_tokens(client: genai.Client, model: str, messages: list) -> Opt
         # Fallback to dict-like
         return ct.get("total_tokens") if isinstance(ct, dict) else None
     except Exception as exc:
-        logger.debug(f"Failed to count tokens: {exc}")
+        logger.debug("Failed to count tokens: %s", exc)
         return None
 
 
@@ -96,166 +113,486 @@ def extract_response_token_counts(response) -> Tuple[Optional[int], Optional[int
     return prompt_tokens, response_tokens
 
 
-def execute_function_call(function_name: str, function_args: dict, working_directory: str) -> str:
+def log_tool_call(function_name: str, function_args: dict) -> None:
+    """Log a tool call with its arguments capped in size (e.g. write_file content)."""
+    if logger.isEnabledFor(logging.INFO):
+        arguments = summarize_args(function_args)
+        logger.info(
+            "Executing function: %s(%s)",
+            function_name,
+            arguments,
+            extra={"event": "tool_call", "tool": function_name, "arguments": arguments},
+        )
+
+
+def log_tool_result(function_name: str, result: str) -> None:
+    """Log a one-line summary of a tool result."""
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Function result: %s",
+            summarize(result),
+            extra={"event": "tool_result", "tool": function_name, "chars": len(result)},
+        )
+
+
+def execute_function_call(
+    function_name: str,
+    function_args: dict,
+    working_directory: Union[str, ToolContext],
+    in_process: bool = False,
+) -> str:
     """Execute a function call from the model and return the result.
     
     Args:
         function_name: The name of the function to call.
         function_args: The arguments to pass to the function.
-        working_directory: The base working directory for sandboxing.
+        working_directory: The base working directory for sandboxing, or the
+            session's ToolContext (which already carries its options).
+        in_process: Run allow-listed Python entry points without a subprocess.
         
     Returns:
         The function result as a string.
     """
-    try:
-        if function_name == "get_files_info":
-            directory = function_args.get("directory", ".")
-            return get_files_info(working_directory, directory)
-        elif function_name == "get_file_content":
-            file_path = function_args.get("file_path")
-            if not file_path:
-                return "Error: file_path is required"
-            return get_file_content(working_directory, file_path)
-        elif function_name == "write_file":
-            file_path = function_args.get("file_path")
-            content = function_args.get("content")
-            if not file_path or content is None:
-                return "Error: file_path and content are required"
-            return write_file(working_directory, file_path, content)
-        elif function_name == "run_python_file":
-            file_path = function_args.get("file_path")
-            args = function_args.get("args", [])
-            if not file_path:
-                return "Error: file_path is required"
-            return run_python_file(working_directory, file_path, args)
-        else:
-            return f"Error: Unknown function '{function_name}'"
-    except Exception as exc:
-        return f"Error executing function: {exc}"
+    if isinstance(working_directory, ToolContext):
+        context = working_directory
+    else:
+        context = ToolContext(working_directory, in_process=in_process)
+    return registry.dispatch(function_name, function_args, context)
+
+
+def load_pinned_files(working_directory: Union[str, Sandbox], paths: List[str]) -> dict:
+    """Read files to pin into the cached prompt prefix.
+
+    Args:
+        working_directory: The base working directory for sandboxing (or
+            the session's Sandbox).
+        paths: File paths relative to the working directory.
+
+    Returns:
+        Mapping of path to content for every file that could be read.
+    """
+    pinned = {}
+    for path in paths:
+        content = get_file_content(working_directory, path)
+        if content.startswith("Error:"):
+            logger.warning("Not pinning %s: %s", path, content)
+            continue
+        pinned[path] = content
+    return pinned
+
+
+def build_prompt_prefix(
+    working_directory: Union[str, Sandbox],
+    pinned_files: Optional[List[str]] = None,
+    tool_modules: Optional[List[str]] = None,
+):
+    """Build the stable part of every request: system prompt, tools and pinned files.
+
+    Args:
+        working_directory: The base working directory for sandboxing (or
+            the session's Sandbox).
+        pinned_files: Repository files to include in the prefix.
+        tool_modules: Extra modules registering third-party tools.
 
+    Returns:
+        The session's PromptPrefix.
+    """
+    from google.genai import types
+    from agent.prompt_cache import PromptPrefix
+
+    registry.load_plugins(tool_modules or [])
+    available_functions = types.Tool(function_declarations=registry.declarations())
+    return PromptPrefix(
+        SYSTEM_PROMPT,
+        [available_functions],
+        load_pinned_files(working_directory, pinned_files or []),
+    )
 
-def generate_gemini_response(prompt: str, api_key: str, verbose: bool = False) -> str:
+
+def generate_gemini_response(
+    prompt: Optional[str],
+    api_key: str,
+    verbose: bool = False,
+    in_process: bool = False,
+    prompt_cache: bool = False,
+    pinned_files: Optional[List[str]] = None,
+    hedge: bool = False,
+    router: Optional[ModelRouter] = None,
+    tool_modules: Optional[List[str]] = None,
+    working_directory: Optional[str] = None,
+    rate_limiter=None,
+    telemetry: Optional[dict] = None,
+    max_iterations: int = MAX_ITERATIONS,
+    session_id: Optional[str] = None,
+    resume: bool = False,
+    prefetch: bool = True,
+    overlay: Optional[str] = None,
+) -> str:
     """Generate a response from the Gemini API for the given prompt.
     
     The agent can call various functions to inspect and modify files,
     as well as execute Python code within a sandboxed workspace.
     Implements an agentic loop that continues until the model stops
-    calling functions and returns a final text response.
+    calling functions and returns a final text response. With a
+    ``session_id`` the conversation and tool result cache are checkpointed
+    after every iteration so that the session can be resumed later. With
+    an ``overlay`` the tools work in a copy-on-write overlay of the working
+    directory that is merged, discarded or kept when the session completes.
     
     Args:
-        prompt: The user's prompt/request.
+        prompt: The user's prompt/request. When resuming it is appended as a
+            new user turn and may be omitted to just continue the session.
         api_key: The Gemini API key.
         verbose: Whether to print token counts and debug information.
+        in_process: Run allow-listed Python entry points without a subprocess.
+        prompt_cache: Serve the system prompt, tools and pinned files from the
+            model API's context cache instead of resending them every turn.
+        pinned_files: Repository files to include in the stable prefix.
+        hedge: Send a duplicate model request when a call exceeds p95 latency.
+        router: Picks the model for each turn; defaults to fast/strong routing.
+        tool_modules: Extra modules registering third-party tools.
+        working_directory: Sandbox root for the tools; defaults to the cwd.
+        rate_limiter: Limiter whose ``acquire()`` gates every model call, e.g.
+            a scheduler's SessionLimiter, which is also told the token
+            counts of every response.
+        telemetry: Optional dict filled with iterations, tool calls, token
+            counts and the models used.
+        max_iterations: Model turns allowed in this run; a resumed session
+            gets a fresh budget on top of the turns it already made.
+        session_id: Name under which the session is checkpointed.
+        resume: Continue the checkpointed session ``session_id``.
+        prefetch: Read likely next files in the background after directory
+            listings and file reads.
+        overlay: ``merge``, ``discard`` or ``keep`` to give the session an
+            overlay workspace and say what happens to it on completion. A
+            session stopped at its iteration cap always keeps its overlay
+            so that it can be resumed.
         
     Returns:
         The model's response text.
-    """
-    client = genai.Client(api_key=api_key)
-    working_directory = os.getcwd()
 
-    # Updated system prompt per README: instruct tool usage
-    system_prompt = (
-        """
-You are a helpful AI coding agent.
-
-When a user asks a question or makes a request, make a function call plan. You can perform the following operations:
+    Raises:
+        FileNotFoundError: If the session to resume has no checkpoint.
+        ValueError: If ``session_id`` is invalid, a completed session is
+            resumed without a new prompt, or ``overlay`` is not a known mode.
+    """
+    from google.genai import types
+    from agent.client import ResilientModelClient, get_client
+    from agent.prompt_cache import PromptCache, is_cache_miss
+    from agent import checkpoint as checkpoints
+
+    client = get_client(api_key)
+    model_client = ResilientModelClient(client, hedge=hedge, rate_limiter=rate_limiter)
+    stats = telemetry if telemetry is not None else {}
+    stats.update(iterations=0, tool_calls=0, prompt_tokens=0, response_tokens=0, models=[])
+
+    if resume:
+        state = checkpoints.SessionCheckpoint.load(session_id)
+        if state.status == checkpoints.STATUS_COMPLETED and not prompt:
+            raise ValueError(f"session {session_id} already completed; give a new prompt")
+        working_directory = working_directory or state.working_directory
+        state.overlay = overlay = overlay or state.overlay
+        messages = checkpoints.load_messages(state.messages)
+        result_cache = ToolResultCache.from_list(state.tool_cache)
+        stats.update(state.telemetry)
+        logger.info("Resuming session %s after %s iterations", session_id, state.iteration)
+    else:
+        if session_id:
+            # Fail before the first model call, not at the first checkpoint
+            checkpoints.checkpoint_path(session_id)
+        working_directory = working_directory or os.getcwd()
+        messages = []
+        result_cache = ToolResultCache()
+        state = checkpoints.SessionCheckpoint(
+            session_id, prompt, working_directory, overlay=overlay
+        )
+    if prompt:
+        messages.append(types.Content(role="user", parts=[types.Part(text=prompt)]))
+
+    def save_checkpoint(status: str, output: Optional[str] = None) -> None:
+        if not session_id:
+            return
+        state.iteration = iteration
+        state.status = status
+        state.output = output
+        state.messages = checkpoints.dump_messages(messages)
+        state.tool_cache = result_cache.to_list()
+        state.telemetry = stats
+        state.save()
 
-- List files and directories
-- Read file contents
-- Write or create files
-- Execute Python files
+    if verbose:
+        logger.info("User prompt: %s", prompt)
+
+    sandbox = working_directory
+    if overlay:
+        from functions.overlay import OverlaySandbox
+
+        if overlay not in ("merge", "discard", "keep"):
+            raise ValueError(f"unknown overlay mode {overlay!r}")
+        sandbox = OverlaySandbox(working_directory, session_id or checkpoints.new_session_id())
+        logger.info("Session overlay at %s", sandbox.upper)
+
+    def finish_overlay(completed: bool) -> None:
+        if not overlay:
+            return
+        if completed and overlay == "merge":
+            stats["overlay_merged"] = sandbox.merge()
+        elif completed and overlay == "discard":
+            sandbox.discard()
+        else:
+            logger.info("Overlay kept at %s", sandbox.upper)
 
-All paths you provide should be relative to the working directory. You do not need to specify the working directory in your function calls as it is automatically injected for security reasons.
-"""
-    ).strip()
+    router = router or ModelRouter()
+    tool_context = ToolContext(sandbox, result_cache=result_cache, in_process=in_process)
+    prefetcher = tool_context.prefetcher = (
+        Prefetcher(registry, tool_context) if prefetch else None
+    )
 
-    # Build messages per README
-    messages = [
-        types.Content(role="user", parts=[types.Part(text=prompt)]),
-    ]
+    def stop_prefetching() -> None:
+        if prefetcher is not None:
+            prefetcher.stop()
+            stats["prefetch"] = prefetcher.metrics()
+            if verbose:
+                logger.info("Prefetch: %s", stats["prefetch"])
 
-    if verbose:
-        logger.info(f"User prompt: {prompt}")
-
-    model = "models/gemini-2.0-flash-001"
-    available_functions = types.Tool(
-        function_declarations=[
-            schema_get_files_info,
-            schema_get_file_content,
-            schema_write_file,
-            schema_run_python_file,
-        ]
-    )
+    prefix = build_prompt_prefix(sandbox, pinned_files, tool_modules)
+    cache = PromptCache(client) if prompt_cache or pinned_files else None
+    cache_names: dict = {}
 
     # Agentic loop: continue until model stops calling functions
-    max_iterations = 10
-    iteration = 0
-    
-    while iteration < max_iterations:
-        iteration += 1
-        
-        response = client.models.generate_content(
-            model=model,
-            contents=messages,
-            config=types.GenerateContentConfig(
-                system_instruction=system_prompt,
-                tools=[available_functions],
-            ),
-        )
+    iteration = state.iteration
+    last_iteration = iteration + max_iterations
+
+    try:
+        while iteration < last_iteration:
+            iteration += 1
+            model = router.choose(iteration)
+            if cache and model not in cache_names:
+                cache_names[model] = cache.get_or_create(model, prefix)
+            cache_name = cache_names.get(model)
+
+            started = time.monotonic()
+            try:
+                response = model_client.generate_content(
+                    model=model,
+                    contents=prefix.request_contents(cache_name, messages),
+                    config=prefix.generate_config(cache_name),
+                )
+            except Exception as exc:
+                if not cache_name or not is_cache_miss(exc):
+                    raise
+                # The handle expired or was deleted server-side; retry with the full prefix
+                logger.warning("Cached prompt rejected, resending full prefix: %s", exc)
+                cache.invalidate(model, prefix)
+                cache_name = cache_names[model] = None
+                response = model_client.generate_content(
+                    model=model,
+                    contents=prefix.request_contents(cache_name, messages),
+                    config=prefix.generate_config(cache_name),
+                )
 
-        if verbose:
-            # Prefer usage info from response; otherwise compute prompt tokens directly
             prompt_tokens, response_tokens = extract_response_token_counts(response)
-            if prompt_tokens is None:
-                prompt_tokens = count_prompt_tokens(client, model, messages)
-            if prompt_tokens is not None:
-                logger.info(f"Prompt tokens: {prompt_tokens}")
-            if response_tokens is not None:
-                logger.info(f"Response tokens: {response_tokens}")
-
-        # Check if model issued function calls
-        function_calls_made = False
-        try:
-            calls = getattr(response, "function_calls", []) or []
-            if calls:
-                function_calls_made = True
-                # Add assistant's response to messages
-                messages.append(response)
+            if hasattr(rate_limiter, "record"):
+                rate_limiter.record(prompt_tokens, response_tokens)
+                stats["scheduler"] = rate_limiter.metrics()
+            latency = time.monotonic() - started
+            router.record_response(model, latency, prompt_tokens, response_tokens)
+            stats["iterations"] = iteration
+            stats["prompt_tokens"] += prompt_tokens or 0
+            stats["response_tokens"] += response_tokens or 0
+            stats["models"].append(model)
+
+            if verbose:
+                # Prefer usage info from response; otherwise compute prompt tokens directly
+                if prompt_tokens is None:
+                    prompt_tokens = count_prompt_tokens(client, model, messages)
+                if prompt_tokens is not None:
+                    logger.info("Prompt tokens: %s", prompt_tokens)
+                if response_tokens is not None:
+                    logger.info("Response tokens: %s", response_tokens)
+                cached_tokens = getattr(
+                    getattr(response, "usage_metadata", None), "cached_content_token_count", None
+                )
+                if cached_tokens:
+                    logger.info("Cached prompt tokens: %s", cached_tokens)
+
+            # Check if model issued function calls
+            function_calls_made = False
+            try:
+                calls = getattr(response, "function_calls", []) or []
+                if calls:
+                    function_calls_made = True
+                    # Add assistant's response to messages
+                    messages.append(response.candidates[0].content)
                 
-                # Process each function call
-                tool_results = []
-                for part in calls:
-                    function_name = part.name
-                    function_args = dict(part.args) if hasattr(part, "args") else {}
+                    # Process each function call
+                    stats["tool_calls"] += len(calls)
+                    tool_results = []
+                    for part in calls:
+                        function_name = part.name
+                        function_args = dict(part.args) if hasattr(part, "args") else {}
                     
-                    logger.info(f"Executing function: {function_name}({function_args})")
+                        log_tool_call(function_name, function_args)
                     
-                    # Execute the function
-                    result = execute_function_call(function_name, function_args, working_directory)
-                    logger.info(f"Function result: {result[:200]}...")  # Log first 200 chars
+                        # Execute the function
+                        result = registry.dispatch(function_name, function_args, tool_context)
+                        log_tool_result(function_name, result)
+                        router.record_tool_result(function_name, result)
                     
-                    tool_results.append(
-                        types.Part(
-                            function_response=types.FunctionResponse(
-                                name=function_name,
-                                response={"result": result}
+                        tool_results.append(
+                            types.Part(
+                                function_response=types.FunctionResponse(
+                                    name=function_name,
+                                    response=to_response(result),
+                                )
                             )
                         )
-                    )
                 
-                # Add tool results to messages
-                if tool_results:
-                    messages.append(types.Content(role="user", parts=tool_results))
-        except Exception as exc:
-            logger.debug(f"Error processing function calls: {exc}")
+                    # Add tool results to messages
+                    if tool_results:
+                        messages.append(types.Content(role="user", parts=tool_results))
+            except Exception as exc:
+                logger.debug("Error processing function calls: %s", exc)
+
+            # If no function calls were made, return the text response
+            if not function_calls_made:
+                output = getattr(response, "text", getattr(response, "output_text", str(response)))
+                if response.candidates and response.candidates[0].content:
+                    messages.append(response.candidates[0].content)
+                stop_prefetching()
+                finish_overlay(completed=True)
+                save_checkpoint(checkpoints.STATUS_COMPLETED, output)
+                return output
+
+            save_checkpoint(checkpoints.STATUS_RUNNING)
+
+        # Max iterations reached
+        logger.warning("Max iterations (%s) reached in agentic loop", max_iterations)
+        stop_prefetching()
+        finish_overlay(completed=False)
+        save_checkpoint(checkpoints.STATUS_MAX_ITERATIONS)
+        if session_id:
+            logger.info("Continue with --resume %s --max-iterations N", session_id)
+        return getattr(response, "text", getattr(response, "output_text", str(response)))
+    except BaseException:
+        # A failed model call or tool must not leave reader threads running, nor
+        # the overlay and checkpoint half-finished
+        stop_prefetching()
+        finish_overlay(completed=False)
+        save_checkpoint(checkpoints.STATUS_FAILED)
+        raise
+    finally:
+        # Hedging threads are per client; the latency history outlives it
+        model_client.close()
+
+
+def session_options(args: argparse.Namespace) -> dict:
+    """Translate CLI arguments into generate_gemini_response keyword arguments."""
+    return {
+        "verbose": args.verbose,
+        "in_process": args.in_process,
+        "prompt_cache": args.prompt_cache,
+        "pinned_files": args.pin,
+        "hedge": args.hedge,
+        "router": ModelRouter(
+            fast_model=args.model,
+            strong_model=args.strong_model or None,
+            cost_budget=args.cost_budget,
+            latency_budget=args.latency_budget,
+        ),
+        "tool_modules": args.tool_module,
+        "max_iterations": args.max_iterations,
+        "prefetch": not args.no_prefetch,
+        "overlay": args.overlay,
+    }
+
+
+def log_sample_rates(values: List[str]) -> dict:
+    """Parse ``--log-sample EVENT=N`` values on top of the default sampling rates.
+
+    Raises:
+        ValueError: If a value is not of the form EVENT=N with N >= 1.
+    """
+    from agent.config import LOG_SAMPLE_EVERY
+
+    rates = dict(LOG_SAMPLE_EVERY)
+    for value in values:
+        event, _, every = value.partition("=")
+        if not event or not every.isdigit() or int(every) < 1:
+            raise ValueError(f"invalid --log-sample {value!r}; expected EVENT=N with N >= 1")
+        rates[event] = int(every)
+    return rates
+
+
+def scheduler_limits(args: argparse.Namespace) -> dict:
+    """Translate CLI arguments into ModelScheduler.session keyword arguments."""
+    limits = {
+        "priority": args.priority,
+        "requests_per_minute": args.session_rpm,
+        "tokens_per_minute": args.session_tpm,
+        "token_budget": args.token_budget,
+    }
+    return {name: value for name, value in limits.items() if value}
+
+
+def build_rate_limiter(args: argparse.Namespace, session_id: str):
+    """Return the session's SessionLimiter, or None if no limits were given."""
+    limits = scheduler_limits(args)
+    if not (args.rpm or args.tpm or limits):
+        return None
+    from agent.config import SCHEDULER_STATE_PATH
+    from agent.scheduler import ModelScheduler
+
+    # Global limits are shared with every other local process through a state file
+    state_path = SCHEDULER_STATE_PATH if args.rpm or args.tpm else None
+    scheduler = ModelScheduler(args.rpm, args.tpm, state_path=state_path)
+    return scheduler.session(session_id, **limits)
+
+
+def run_fleet_cli(args: argparse.Namespace) -> None:
+    """Run a --fleet jobs file and report aggregated results."""
+    import json
+    from agent.fleet import load_jobs, run_fleet
 
-        # If no function calls were made, return the text response
-        if not function_calls_made:
-            return getattr(response, "text", getattr(response, "output_text", str(response)))
+    api_key = get_env_api_key()
+    if not api_key:
+        logger.error("GEMINI_API_KEY is not set. Create a .env with GEMINI_API_KEY=...")
+        sys.exit(1)
+    try:
+        jobs = load_jobs(args.fleet)
+    except (OSError, ValueError) as exc:
+        logger.error("Invalid jobs file %s: %s", args.fleet, exc)
+        sys.exit(1)
 
-    # Max iterations reached
-    logger.warning(f"Max iterations ({max_iterations}) reached in agentic loop")
-    return getattr(response, "text", getattr(response, "output_text", str(response)))
+    options = session_options(args)
+    if args.prompt_cache and not args.pin:
+        # Every workspace shares the same prefix: create its cache handle once
+        # here so that workers reuse it instead of racing to create their own.
+        from agent.client import get_client
+        from agent.prompt_cache import PromptCache
+
+        PromptCache(get_client(api_key)).get_or_create(
+            args.model, build_prompt_prefix(os.getcwd(), tool_modules=args.tool_module)
+        )
+
+    logger.info("Running %s jobs", len(jobs))
+    report = run_fleet(
+        jobs,
+        generate_gemini_response,
+        api_key,
+        workers=args.workers,
+        requests_per_minute=args.rpm,
+        options=options,
+        tokens_per_minute=args.tpm,
+        session_limits=scheduler_limits(args),
+    )
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        logger.info("Fleet report written to %s", args.report)
+    print(json.dumps(report["summary"], indent=2))
+    if report["summary"]["failed"]:
+        sys.exit(1)
 
 
 def main() -> None:
@@ -272,26 +609,168 @@ def main() -> None:
     parser.add_argument(
         "--list-models", action="store_true", help="List available models"
     )
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="Run allow-listed Python entry points in-process instead of a subprocess",
+    )
+    parser.add_argument(
+        "--prompt-cache",
+        action="store_true",
+        help="Cache the system prompt and tool declarations with the model API",
+    )
+    parser.add_argument(
+        "--pin",
+        action="append",
+        default=[],
+        metavar="FILE",
+        help="Pin a repository file into the cached prompt prefix (repeatable)",
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Send a duplicate model request when a call runs past p95 latency",
+    )
+    parser.add_argument(
+        "--model", default=FAST_MODEL, help="Fast model used for ordinary tool-dispatch turns"
+    )
+    parser.add_argument(
+        "--strong-model",
+        default=STRONG_MODEL,
+        help="Model to escalate to after repeated tool errors ('' disables escalation)",
+    )
+    parser.add_argument(
+        "--cost-budget", type=float, help="Session cost budget in USD for escalations"
+    )
+    parser.add_argument(
+        "--latency-budget",
+        type=float,
+        help="Seconds per turn; slower models are not escalated to",
+    )
+    parser.add_argument(
+        "--tool-module",
+        action="append",
+        default=[],
+        metavar="MODULE",
+        help="Import a module that registers additional tools (repeatable)",
+    )
+    parser.add_argument(
+        "--no-prefetch",
+        action="store_true",
+        help="Do not read likely next files in the background",
+    )
+    parser.add_argument(
+        "--overlay",
+        choices=("merge", "discard", "keep"),
+        help=(
+            "Work in a copy-on-write overlay of the working directory and merge, "
+            "discard or keep it when the session completes"
+        ),
+    )
+    parser.add_argument(
+        "--max-iterations",
+        type=int,
+        default=MAX_ITERATIONS,
+        help=f"Model turns allowed in this run (default: {MAX_ITERATIONS})",
+    )
+    parser.add_argument(
+        "--session",
+        metavar="ID",
+        help="Checkpoint the session under ID (default: a generated id)",
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="ID",
+        help="Continue a checkpointed session; the prompt, if given, is a new turn",
+    )
+    parser.add_argument(
+        "--fleet",
+        metavar="JOBS",
+        help="Run a JSON/JSONL file of {workspace, prompt} jobs across a process pool",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Worker processes for --fleet (default: CPU count)"
+    )
+    parser.add_argument(
+        "--rpm",
+        type=float,
+        help="Model requests per minute shared by all local sessions and --fleet workers",
+    )
+    parser.add_argument(
+        "--tpm",
+        type=float,
+        help="Model tokens per minute shared by all local sessions and --fleet workers",
+    )
+    parser.add_argument("--session-rpm", type=float, help="Model requests per minute per session")
+    parser.add_argument("--session-tpm", type=float, help="Model tokens per minute per session")
+    parser.add_argument("--token-budget", type=int, help="Total tokens a session may use")
+    parser.add_argument(
+        "--priority",
+        type=int,
+        default=0,
+        help="Queue priority when waiting for model quota (lower goes first)",
+    )
+    parser.add_argument(
+        "--report", metavar="PATH", help="Write the --fleet results report to PATH as JSON"
+    )
+    parser.add_argument(
+        "--log-format",
+        choices=("text", "json"),
+        default="text",
+        help="Write log records as text lines or as JSON objects (default: text)",
+    )
+    parser.add_argument(
+        "--log-sample",
+        action="append",
+        default=[],
+        metavar="EVENT=N",
+        help=(
+            "Keep one in N INFO records of an event, e.g. tool_call=10, tool_result=10 "
+            "or a logger name (repeatable)"
+        ),
+    )
     args = parser.parse_args()
 
+    from agent.logs import configure_logging
+
+    try:
+        sample_every = log_sample_rates(args.log_sample)
+    except ValueError as exc:
+        parser.error(str(exc))
+    # Checked now rather than at the first checkpoint, after a paid model call
+    from agent.checkpoint import checkpoint_path
+
+    for session_id in filter(None, (args.session, args.resume)):
+        try:
+            checkpoint_path(session_id)
+        except ValueError as exc:
+            parser.error(str(exc))
+    configure_logging(json_format=args.log_format == "json", sample_every=sample_every)
+
     if args.list_models:
         api_key = get_env_api_key()
         if not api_key:
             logger.error("GEMINI_API_KEY is not set. Create a .env with GEMINI_API_KEY=...")
             sys.exit(1)
         try:
-            client = genai.Client(api_key=api_key)
+            from agent.client import get_client
+
+            client = get_client(api_key)
             models = list(client.models.list())
             for m in models:
                 model_name = getattr(m, "name", getattr(m, "id", str(m)))
                 print(model_name)
         except Exception as exc:
-            logger.error(f"Failed to list models: {exc}")
+            logger.error("Failed to list models: %s", exc)
             sys.exit(1)
         return
 
+    if args.fleet:
+        run_fleet_cli(args)
+        return
+
     # If no prompt, show greeting (setup verification)
-    if not args.prompt:
+    if not args.prompt and not args.resume:
         print_greeting()
         return
 
@@ -301,12 +780,27 @@ def main() -> None:
         logger.error("GEMINI_API_KEY is not set. Create a .env with GEMINI_API_KEY=...")
         sys.exit(1)
 
+    if args.resume:
+        session_id = args.resume
+    else:
+        from agent.checkpoint import new_session_id
+
+        session_id = args.session or new_session_id()
+        logger.info("Session %s", session_id)
+
     try:
         logger.info("Generating Gemini response...")
-        output = generate_gemini_response(prompt, api_key, verbose=args.verbose)
+        output = generate_gemini_response(
+            prompt,
+            api_key,
+            session_id=session_id,
+            resume=bool(args.resume),
+            rate_limiter=build_rate_limiter(args, session_id),
+            **session_options(args),
+        )
         print(output)
     except Exception as exc:  # noqa: BLE001 - top-level boundary
-        logger.error(f"Gemini request failed: {exc}")
+        logger.error("Gemini request failed: %s", exc)
         sys.exit(1)
 
 
@@ -4,13 +4,722 @@ Test runner for CodePilot functionality.
 Tests file operations and code execution.
 """
 
+import os
+import sys
+import json
 import logging
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from functions.write_file import write_file
 from functions.get_file_content import get_file_content
 from functions.run_python_file import run_python_file
+from functions.registry import ToolContext, ToolRegistry
 
 logger = logging.getLogger(__name__)
 
+# Cumulative import time allowed for `import main` (what `main.py --help` pays)
+STARTUP_IMPORT_BUDGET_MS = 150
+# Modules that must not be imported until a model call is made
+LAZY_MODULES = ("google.genai", "dotenv")
+
+
+class FakeModelHandler(BaseHTTPRequestHandler):
+    """Fake Gemini endpoint: answers 503 for the first request, then succeeds."""
+
+    requests_seen = 0
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        FakeModelHandler.requests_seen += 1
+        if FakeModelHandler.requests_seen == 1:
+            body = {"error": {"code": 503, "message": "overloaded", "status": "UNAVAILABLE"}}
+            self.send_response(503)
+            self.send_header("Retry-After", "0")
+        else:
+            body = {"candidates": [{"content": {"role": "model", "parts": [{"text": "ok"}]}}]}
+            self.send_response(200)
+        payload = json.dumps(body).encode("utf-8")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class FakeAgentHandler(BaseHTTPRequestHandler):
+    """Fake Gemini endpoint: asks to read main.py twice, then answers."""
+
+    requests_seen = 0
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        FakeAgentHandler.requests_seen += 1
+        if FakeAgentHandler.requests_seen <= 2:
+            call = {"name": "get_file_content", "args": {"file_path": "main.py"}}
+            part = {"functionCall": call}
+        else:
+            part = {"text": f"done after {FakeAgentHandler.requests_seen} model calls"}
+        body = {"candidates": [{"content": {"role": "model", "parts": [part]}}]}
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class FakeFailingHandler(BaseHTTPRequestHandler):
+    """Fake Gemini endpoint: asks to list the directory, then rejects the request."""
+
+    requests_seen = 0
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        FakeFailingHandler.requests_seen += 1
+        if FakeFailingHandler.requests_seen == 1:
+            part = {"functionCall": {"name": "get_files_info", "args": {}}}
+            body = {"candidates": [{"content": {"role": "model", "parts": [part]}}]}
+            self.send_response(200)
+        else:
+            body = {"error": {"code": 400, "message": "bad request", "status": "INVALID_ARGUMENT"}}
+            self.send_response(400)
+        payload = json.dumps(body).encode("utf-8")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def run_failed_session() -> str:
+    """Let a model call fail mid-session and check what the session leaves behind."""
+    from agent.checkpoint import SessionCheckpoint
+
+    script = (
+        "import threading, main\n"
+        "try:\n"
+        "    main.generate_gemini_response('List files', 'test-key', session_id='../escape')\n"
+        "except ValueError as exc:\n"
+        "    print('rejected', exc)\n"
+        "try:\n"
+        "    main.generate_gemini_response(\n"
+        "        'List files', 'test-key', working_directory='calculator',\n"
+        "        session_id='fail-test', overlay='merge',\n"
+        "    )\n"
+        "except Exception as exc:\n"
+        "    print('raised', type(exc).__name__)\n"
+        "print('prefetch threads', sum(t.name == 'prefetch' for t in threading.enumerate()))\n"
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeFailingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with tempfile.TemporaryDirectory() as state_dir:
+            env = dict(
+                os.environ,
+                CODEPILOT_STATE_DIR=state_dir,
+                CODEPILOT_MODEL_BASE_URL=f"http://127.0.0.1:{server.server_port}",
+            )
+            run = subprocess.run(
+                [sys.executable, "-c", script],
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+            state = SessionCheckpoint.load("fail-test", os.path.join(state_dir, "sessions"))
+            overlay_kept = os.path.isdir(os.path.join(state_dir, "overlays", "fail-test"))
+            return (
+                f"{run.stdout.strip()}\n"
+                f"model requests: {FakeFailingHandler.requests_seen}\n"
+                f"checkpoint status {state.status}, iteration {state.iteration}, "
+                f"overlay kept: {overlay_kept}"
+            )
+    finally:
+        server.shutdown()
+
+
+def run_session_resume() -> str:
+    """Stop a CLI session at its iteration cap, then resume it with a larger budget."""
+    from agent.checkpoint import SessionCheckpoint
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeAgentHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with tempfile.TemporaryDirectory() as state_dir:
+            env = dict(
+                os.environ,
+                GEMINI_API_KEY="test-key",
+                CODEPILOT_STATE_DIR=state_dir,
+                CODEPILOT_MODEL_BASE_URL=f"http://127.0.0.1:{server.server_port}",
+            )
+            main_py = os.path.abspath("main.py")
+            commands = [
+                [main_py, "Read main.py", "--session", "resume-test", "--max-iterations", "1"],
+                [main_py, "--resume", "resume-test", "--max-iterations", "2"],
+            ]
+            lines = []
+            for command in commands:
+                run = subprocess.run(
+                    [sys.executable, *command],
+                    cwd="calculator",
+                    env=env,
+                    capture_output=True,
+                    text=True,
+                )
+                state = SessionCheckpoint.load(
+                    "resume-test", os.path.join(state_dir, "sessions")
+                )
+                lines.append(
+                    f"exit {run.returncode}, status {state.status}, "
+                    f"iteration {state.iteration}, {len(state.messages)} messages, "
+                    f"{len(state.tool_cache)} cached tool results"
+                )
+            lines.append(run.stdout.strip())
+            return "\n".join(lines)
+    finally:
+        server.shutdown()
+
+
+def run_typed_payloads() -> str:
+    """Read a text file in slices and a binary file through its blob reference."""
+    from functions import blob_store, read_blob
+    from functions.result_cache import ToolResultCache
+
+    saved_blob_dir = blob_store.BLOB_DIR
+    with tempfile.TemporaryDirectory() as workspace:
+        blob_store.BLOB_DIR = os.path.join(workspace, ".blobs")
+        try:
+            with open(os.path.join(workspace, "notes.txt"), "w", encoding="utf-8") as f:
+                f.write("naïve café\n" * 3)
+            with open(os.path.join(workspace, "image.png"), "wb") as f:
+                f.write(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR")
+
+            first = get_file_content(workspace, "notes.txt", limit=6)
+            second = get_file_content(workspace, "notes.txt", offset=first.fields["next_offset"])
+            binary = get_file_content(workspace, "image.png")
+            store = blob_store.BlobStore.for_sandbox(workspace)
+            blob_inode = os.stat(store.path(binary.fields["blob"])).st_ino
+            again = get_file_content(workspace, "image.png")
+            lines = [
+                json.dumps(first.to_response(), ensure_ascii=False),
+                json.dumps(second.to_response(), ensure_ascii=False),
+                str(binary),
+                read_blob(workspace, binary.fields["blob"]),
+                "second read reused the blob: "
+                f"{os.stat(store.path(again.fields['blob'])).st_ino == blob_inode}",
+                f"other workspace: {read_blob(os.path.dirname(workspace), binary.fields['blob'])}",
+            ]
+
+            cache = ToolResultCache()
+            cache.put("read", (1, 2), first)
+            restored = ToolResultCache.from_list(json.loads(json.dumps(cache.to_list())))
+            restored_first = restored.peek("read", (1, 2))
+            lines.append(
+                f"checkpointed payload: {type(restored_first).__name__}, same response: "
+                f"{restored_first.to_response() == first.to_response()}"
+            )
+            lines.append(f"blobs collected over a 0-byte cap: {store.collect(max_bytes=0)}")
+        finally:
+            blob_store.BLOB_DIR = saved_blob_dir
+    return "\n".join(lines)
+
+
+def run_code_index() -> str:
+    """Look up a symbol and outline a module through a freshly built code index."""
+    from functions import Sandbox, code_index, find_symbol, outline_file
+
+    saved_index_dir = code_index.CODE_INDEX_DIR
+    with tempfile.TemporaryDirectory() as index_dir:
+        code_index.CODE_INDEX_DIR = index_dir
+        try:
+            results = [
+                find_symbol("calculator", "Calculator.evaluate_postfix"),
+                outline_file("calculator", "pkg/render.py"),
+            ]
+
+            with tempfile.TemporaryDirectory() as workspace:
+                with open(os.path.join(workspace, "util.py"), "w", encoding="utf-8") as f:
+                    f.write("def old():\n    pass\n")
+                index = code_index.get_index(Sandbox(workspace))
+                find_symbol(workspace, "old")
+                # Edited behind the agent's back, then looked up after the rescan interval
+                with open(os.path.join(workspace, "util.py"), "a", encoding="utf-8") as f:
+                    f.write("\ndef edited_outside():\n    pass\n")
+                index._scanned_at -= code_index.CODE_INDEX_RESCAN_SECONDS
+                results.append(find_symbol(workspace, "edited_outside"))
+
+                saves = []
+                saved_save = index.save
+                index.save = lambda: saves.append(1) or saved_save()
+                for n in range(5):
+                    write_file(workspace, f"mod{n}.py", f"def f{n}():\n    pass\n")
+                written = len(saves)
+                code_index.flush_indexes()
+                results.append(f"index saves for 5 writes: {written}, after flush: {len(saves)}")
+
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                in_worker = pool.submit(code_index.CodeIndex._pool_size, 100, 8).result()
+            main_pool = code_index.CodeIndex._pool_size(100, 8)
+            results.append(f"pool size for 100 modules: {main_pool}, in a worker: {in_worker}")
+        finally:
+            code_index.CODE_INDEX_DIR = saved_index_dir
+            code_index._indexes.clear()
+    return "\n".join(results)
+
+
+def run_prefetch() -> str:
+    """List a directory, let the prefetcher warm the cache, then read a file from it."""
+    import time
+    from functions import registry
+    from functions.prefetch import Prefetcher
+    from functions.result_cache import ToolResultCache
+
+    context = ToolContext("calculator", result_cache=ToolResultCache())
+    context.prefetcher = Prefetcher(registry, context)
+    registry.dispatch("get_files_info", {}, context)
+    deadline = time.monotonic() + 2
+    while context.prefetcher.metrics()["prefetched"] < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    registry.dispatch("get_file_content", {"file_path": "main.py"}, context)
+    metrics = context.prefetcher.metrics()
+    context.prefetcher.stop()
+    readers = [thread for thread in threading.enumerate() if thread.name == "prefetch"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, data in (("notes.txt", b"hello\n"), ("image.png", b"\x89PNG\r\n\x00\x00")):
+            with open(os.path.join(tmp, name), "wb") as f:
+                f.write(data)
+        candidates = Prefetcher(registry, ToolContext(tmp))._small_files(".")
+    return (
+        f"main.py served from prefetch: {metrics['prefetch_hits'] == 1}, "
+        f"cache hit rate {metrics['cache_hit_rate']}\n"
+        f"reader threads left after stop: {len(readers)}\n"
+        f"prefetch candidates: {candidates}"
+    )
+
+
+def run_scheduler_budget() -> str:
+    """Stop a session at its token budget, refund failed calls and admit hedged duplicates."""
+    import time
+    from types import SimpleNamespace
+    from agent.client import ResilientModelClient
+    from agent.scheduler import ModelScheduler, TokenBudgetExceeded
+
+    scheduler = ModelScheduler(requests_per_minute=600, tokens_per_minute=100000)
+    limiter = scheduler.session("budget-test", token_budget=10000)
+    calls = 0
+    try:
+        while True:
+            limiter.acquire()
+            calls += 1
+            limiter.record(800, 200)
+    except TokenBudgetExceeded as exc:
+        lines = [f"{calls} calls admitted, then: {exc}"]
+
+    def fail(**kwargs):
+        raise ValueError("bad request")
+
+    limiter = scheduler.session("refund-test", token_budget=10000)
+    client = ResilientModelClient(
+        SimpleNamespace(models=SimpleNamespace(generate_content=fail)), rate_limiter=limiter
+    )
+    try:
+        client.generate_content(model="m", contents=[])
+    except ValueError:
+        pass
+    lines.append(f"after a failed call: {limiter.metrics()['tokens']} tokens charged")
+
+    def slow_first(**kwargs):
+        slow_first.calls += 1
+        time.sleep(0.2 if slow_first.calls == 1 else 0)
+        return slow_first.calls
+
+    # Earlier sessions, each with its own client, build the model's latency history
+    fast_api = SimpleNamespace(models=SimpleNamespace(generate_content=lambda **kwargs: 0))
+    for _ in range(20):
+        session_client = ResilientModelClient(fast_api, hedge=True)
+        session_client.generate_content(model="hedge-model", contents=[])
+        session_client.close()
+
+    slow_first.calls = 0
+    limiter = scheduler.session("hedge-test")
+    client = ResilientModelClient(
+        SimpleNamespace(models=SimpleNamespace(generate_content=slow_first)),
+        hedge=True,
+        rate_limiter=limiter,
+    )
+    winner = client.generate_content(model="hedge-model", contents=[])
+    client.close()
+    limiter.record(800, 200)
+    time.sleep(0.3)
+    metrics = limiter.metrics()
+    hedge_threads = [thread for thread in threading.enumerate() if thread.name.startswith("hedge")]
+    lines.append(
+        f"hedged call won by request {winner}: {metrics['requests']} requests admitted, "
+        f"{metrics['tokens']} tokens charged\n"
+        f"hedge threads left after close: {len(hedge_threads)}"
+    )
+    return "\n".join(lines)
+
+
+def check_startup_budget() -> str:
+    """Measure startup imports with -X importtime and compare with the budget.
+
+    Raises:
+        AssertionError: If --help imports a lazy module, or importing main
+            takes longer than STARTUP_IMPORT_BUDGET_MS.
+    """
+    help_run = subprocess.run(
+        [sys.executable, "-X", "importtime", "main.py", "--help"],
+        capture_output=True,
+        text=True,
+    )
+    eager = sorted(
+        {
+            line.rsplit("|", 1)[-1].strip()
+            for line in help_run.stderr.splitlines()
+            if line.rsplit("|", 1)[-1].strip().startswith(LAZY_MODULES)
+        }
+    )
+    assert not eager, f"--help imported {', '.join(eager)}"
+
+    import_run = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        capture_output=True,
+        text=True,
+    )
+    for line in import_run.stderr.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == "main":
+            elapsed_ms = int(fields[1]) / 1000
+            budget = STARTUP_IMPORT_BUDGET_MS
+            report = f"main imports in {elapsed_ms:.1f} ms (budget {budget} ms)"
+            assert elapsed_ms <= budget, report
+            return f"OK: {report}"
+    raise AssertionError("could not measure import time of main")
+
+
+def run_overlay_workspace() -> str:
+    """Write and run a script in an overlay, check the original is untouched, then merge."""
+    import time
+    from functions import get_files_info
+    from functions.overlay import OverlaySandbox
+
+    with tempfile.TemporaryDirectory() as workspace, tempfile.TemporaryDirectory() as overlays:
+        os.makedirs(os.path.join(workspace, ".git"))
+        for name, content in (("old.txt", "old"), ("a.py", "print('hi')"), (".git/HEAD", "ref")):
+            with open(os.path.join(workspace, name), "w", encoding="utf-8") as f:
+                f.write(content)
+        started = time.perf_counter()
+        sandbox = OverlaySandbox(workspace, "overlay-test", overlays)
+        created_ms = (time.perf_counter() - started) * 1000
+        # Replaces a.py with same-sized content that keeps the original mtime
+        script = (
+            "import os, shutil\n"
+            "os.remove('old.txt')\n"
+            "open('new.txt', 'w').write('new')\n"
+            "open('b.tmp', 'w').write(\"print('ho')\")\n"
+            "stat = os.stat('a.py')\n"
+            "os.utime('b.tmp', ns=(stat.st_atime_ns, stat.st_mtime_ns))\n"
+            "shutil.copy2('b.tmp', 'a.py')\n"
+            "os.remove('b.tmp')\n"
+        )
+        lines = [
+            f"created in under 50 ms: {created_ms < 50}",
+            write_file(sandbox, "tool.py", script),
+            f"listed: {sorted(line.split(':')[0] for line in get_files_info(sandbox).splitlines())}",
+            run_python_file(sandbox, "tool.py") or "(no output)",
+            f"overlay sees old.txt: {os.path.exists(sandbox.resolve('old.txt'))}",
+            f"overlay sees .git/HEAD: {get_file_content(sandbox, '.git/HEAD') == 'ref'}",
+            f"original before merge: {sorted(os.listdir(workspace))}",
+        ]
+        # A file restored into the original with an old mtime must survive the merge
+        restored = os.path.join(workspace, "restored.txt")
+        with open(restored, "w", encoding="utf-8") as f:
+            f.write("restored")
+        os.utime(restored, ns=(0, 0))
+        lines += [
+            f"merged: {sandbox.merge()}",
+            f"original after merge: {sorted(os.listdir(workspace))}",
+            f"a.py: {open(os.path.join(workspace, 'a.py'), encoding='utf-8').read()}",
+            f"overlay removed: {not os.path.exists(sandbox.path)}",
+        ]
+        # Files edited both through an overlay and directly in the original keep the
+        # original's version, whether the overlay wrote them before or after materializing
+        for name, content in (("notes.txt", "v1"), ("c.py", "print(1)")):
+            with open(os.path.join(workspace, name), "w", encoding="utf-8") as f:
+                f.write(content)
+        sandbox = OverlaySandbox(workspace, "conflict-test", overlays)
+        write_file(sandbox, "notes.txt", "from the overlay")
+        write_file(sandbox, "keep.txt", "kept")
+        write_file(sandbox, "edit.py", "open('c.py', 'w').write('print(2)')")
+        run_python_file(sandbox, "edit.py")
+        for name, content in (("notes.txt", "edited meanwhile"), ("c.py", "print('meanwhile')")):
+            with open(os.path.join(workspace, name), "w", encoding="utf-8") as f:
+                f.write(content)
+        merged = sandbox.merge()
+        kept = [
+            open(os.path.join(workspace, name), encoding="utf-8").read()
+            for name in ("notes.txt", "c.py")
+        ]
+        lines += [f"merged with conflicts: {merged}", f"originals kept: {kept}"]
+        # Without reflinks, a tree over the copy limit is refused before anything is copied
+        from functions import overlay
+
+        sandbox = OverlaySandbox(workspace, "too-large", overlays)
+        write_file(sandbox, "run.py", "print('ran')")
+        saved_limit = overlay.OVERLAY_MAX_COPY_BYTES
+        overlay.OVERLAY_MAX_COPY_BYTES = 10
+        overlay._no_reflink_devices.add(os.stat(workspace).st_dev)
+        try:
+            refused = run_python_file(sandbox, "run.py")
+        finally:
+            overlay.OVERLAY_MAX_COPY_BYTES = saved_limit
+            overlay._no_reflink_devices.discard(os.stat(workspace).st_dev)
+        lines += [
+            f"over the copy limit: {refused.split(' because ')[0]}",
+            f"upper after refusal: {os.listdir(sandbox.upper)}",
+            f"materialized: {sandbox.materialized}",
+        ]
+        sandbox.discard()
+    return "\n".join(lines)
+
+
+def _log_to_file(path: str) -> None:
+    """Pool initializer: send the worker's logs to ``path`` off-thread."""
+    from agent.logs import configure_logging
+
+    configure_logging(stream=open(path, "a", encoding="utf-8"))
+
+
+def _chatty_session(prompt: str, api_key: str, **kwargs) -> str:
+    """Stand-in agent session that only logs."""
+    for index in range(500):
+        logger.info("record %s", index)
+    return "done"
+
+
+def run_structured_logging() -> str:
+    """Log sampled tool calls as JSON through the background writer."""
+    import io
+    from agent.logs import configure_logging, stop_logging
+    from main import log_tool_call, log_tool_result
+
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    stream = io.StringIO()
+    configure_logging(json_format=True, sample_every={"tool_result": 2}, stream=stream)
+    try:
+        for index in range(4):
+            log_tool_call("write_file", {"file_path": f"f{index}.py", "content": "x" * 100000})
+            log_tool_result("write_file", f"Successfully wrote to f{index}.py")
+    finally:
+        stop_logging()
+        root.handlers[:] = saved_handlers
+        root.setLevel(saved_level)
+    entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+    events = [entry["event"] for entry in entries]
+    longest = max(len(line) for line in stream.getvalue().splitlines())
+
+    from concurrent.futures import ProcessPoolExecutor
+    from agent import fleet
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, "worker.log")
+        job = {"id": "1", "workspace": tmp, "prompt": "log"}
+        with ProcessPoolExecutor(1, initializer=_log_to_file, initargs=(log_path,)) as pool:
+            pool.submit(fleet._run_job, _chatty_session, job, "key", {}).result()
+        with open(log_path, "r", encoding="utf-8") as f:
+            worker_records = sum("record " in line for line in f)
+    return (
+        f"{events.count('tool_call')} tool_call and {events.count('tool_result')} tool_result "
+        f"records, longest line {longest} chars\n"
+        f"{entries[0]['arguments']['content'][-20:]}\n"
+        f"fleet worker records written before exit: {worker_records} of 500"
+    )
+
+
+def run_inprocess_isolation() -> str:
+    """Capture an in-process script's logging, then time one out and wait for it."""
+    import io
+    import time
+    from agent.logs import configure_logging, stop_logging
+    from functions import inprocess_runner
+
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    agent_log = io.StringIO()
+    configure_logging(stream=agent_log)
+    try:
+        failed = run_python_file(".", "calculator/main.py", ["3 / 0"], in_process=True)
+    finally:
+        stop_logging()
+        root.handlers[:] = saved_handlers
+        root.setLevel(saved_level)
+    results = [
+        f"script log on its stderr: {'ERROR:__main__:Calculation error' in failed}, "
+        f"in the agent log: {'Calculation error' in agent_log.getvalue()}"
+    ]
+
+    saved_entry_points = inprocess_runner.INPROCESS_ENTRY_POINTS
+    inprocess_runner.INPROCESS_ENTRY_POINTS = ("slow.py",)
+    saved_cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "slow.py"), "w", encoding="utf-8") as f:
+                f.write("import time\n\ndef main():\n    time.sleep(0.5)\n    print('done')\n")
+            # main() would run in the agent's cwd, not in tmp
+            elsewhere = inprocess_runner.run_in_process(tmp, "slow.py", [])
+            results.append(f"in-process path from another directory: {elsewhere}")
+            os.chdir(tmp)
+            try:
+                inprocess_runner.run_in_process(tmp, "slow.py", [], timeout=0.1)
+            except inprocess_runner.InProcessTimeout as exc:
+                results.append(f"timed out: {exc}")
+            while_running = inprocess_runner.run_in_process(tmp, "slow.py", [], timeout=0.1)
+            results.append(f"in-process path while it runs: {while_running}")
+            deadline = time.monotonic() + 2
+            while inprocess_runner._abandoned.is_set() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            results.append(f"after it ends: {inprocess_runner.run_in_process(tmp, 'slow.py', [])}")
+            os.chdir(saved_cwd)
+    finally:
+        os.chdir(saved_cwd)
+        inprocess_runner.INPROCESS_ENTRY_POINTS = saved_entry_points
+    return "\n".join(results)
+
+
+def run_prompt_cache_index() -> str:
+    """Tell cache misses from other failures and store index entries concurrently."""
+    from google.genai import errors
+    from agent.prompt_cache import PromptCache, is_cache_miss
+
+    expired = errors.ClientError(
+        403, {"error": {"message": "CachedContent not found (or permission denied)"}}
+    )
+    quota = errors.ClientError(429, {"error": {"message": "Resource has been exhausted"}})
+    results = [
+        f"expired cache is a miss: {is_cache_miss(expired)}, "
+        f"quota error is a miss: {is_cache_miss(quota)}"
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = PromptCache(None, index_path=os.path.join(tmp, "prompt_cache.json"))
+        writers = [
+            threading.Thread(
+                target=cache._store, args=(f"key{n}", {"name": f"c{n}", "expire_time": 2e9})
+            )
+            for n in range(20)
+        ]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+        results.append(f"entries after 20 concurrent stores: {len(cache._load_index())}")
+    return "\n".join(results)
+
+
+def run_model_routing() -> str:
+    """Escalate on real tool failures only, de-escalate on success, respect the budget."""
+    from functions import is_failure, registry
+    from agent.config import FAST_MODEL, STRONG_MODEL
+    from agent.routing import ModelRouter
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "log.txt"), "w", encoding="utf-8") as f:
+            f.write("Error: build failed\nProcess exited with code 1\n")
+        with open(os.path.join(tmp, "fail.py"), "w", encoding="utf-8") as f:
+            f.write("raise SystemExit(3)\n")
+        context = ToolContext(tmp)
+        results = {
+            "file mentioning errors": registry.dispatch(
+                "get_file_content", {"file_path": "log.txt"}, context
+            ),
+            "symbol not found": registry.dispatch("find_symbol", {"name": "missing"}, context),
+            "script exit code 3": registry.dispatch(
+                "run_python_file", {"file_path": "fail.py"}, context
+            ),
+            "unknown file": registry.dispatch(
+                "get_file_content", {"file_path": "nope.txt"}, context
+            ),
+        }
+
+    def route(router: ModelRouter, names) -> str:
+        for name in names:
+            router.record_tool_result("tool", results[name])
+        return "strong" if router.choose(1) == STRONG_MODEL else "fast"
+
+    lines = [f"{name} fails: {is_failure(result)}" for name, result in results.items()]
+    router = ModelRouter(FAST_MODEL, STRONG_MODEL, error_threshold=2)
+    lines += [
+        f"after benign results: {route(router, ['file mentioning errors', 'symbol not found'])}",
+        f"after one failure: {route(router, ['script exit code 3'])}",
+        f"after two failures: {route(router, ['unknown file'])}",
+        f"after a success: {route(router, ['file mentioning errors'])}",
+    ]
+
+    budgeted = ModelRouter(FAST_MODEL, STRONG_MODEL, error_threshold=2, cost_budget=0.01)
+    budgeted.record_response(STRONG_MODEL, 1.0, 10000, 1000)
+    lines.append(
+        f"two failures with ${budgeted.spent:.4f} of a $0.01 budget spent: "
+        f"{route(budgeted, ['script exit code 3', 'unknown file'])}"
+    )
+    return "\n".join(lines)
+
+
+def run_registry_dispatch() -> str:
+    """Register a third-party tool on a fresh registry and dispatch to it."""
+    tools = ToolRegistry()
+
+    @tools.register(
+        "count_lines",
+        description="Counts the lines of a file.",
+        parameters={
+            "type": "object",
+            "properties": {"file_path": {"type": "string"}},
+            "required": ["file_path"],
+        },
+    )
+    def count_lines(sandbox, file_path: str) -> str:
+        full_path = sandbox.resolve(file_path)
+        if full_path is None:
+            return f'Error: Cannot read "{file_path}" as it is outside the permitted working directory'
+        with open(full_path, "r", encoding="utf-8") as f:
+            return str(sum(1 for _ in f))
+
+    context = ToolContext("calculator")
+    results = [
+        tools.dispatch("count_lines", {"file_path": "main.py"}, context),
+        tools.dispatch("count_lines", {}, context),
+        tools.dispatch("count_lines", {"file_path": "../main.py"}, context),
+    ]
+    return "\n".join(results)
+
+
+def run_fake_model_request() -> str:
+    """Send one request through the resilient client to a local fake server."""
+    from agent.client import ResilientModelClient, get_client
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeModelHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = get_client("test-key", base_url=f"http://127.0.0.1:{server.server_port}")
+        response = ResilientModelClient(client).generate_content(
+            model="models/fake", contents="ping"
+        )
+        return f"{response.text} after {FakeModelHandler.requests_seen} requests"
+    finally:
+        server.shutdown()
+
 
 def main() -> None:
     """Run tests on function toolkit."""
@@ -37,11 +746,72 @@ def main() -> None:
         print("\n5. Attempting to access nonexistent file (should fail):")
         result5 = run_python_file("calculator", "nonexistent.py")
         print(result5)
-        
+
+        print("\n6. Running calculator in-process with expression '3 + 5':")
+        result6 = run_python_file(".", "calculator/main.py", ["3 + 5"], in_process=True)
+        print(result6)
+
+        print("\n7. Retrying a transient 503 from a local fake model server:")
+        result7 = run_fake_model_request()
+        print(result7)
+
+        print("\n8. Checking CLI startup import budget:")
+        result8 = check_startup_budget()
+        print(result8)
+
+        print("\n9. Dispatching a third-party tool through the registry:")
+        result9 = run_registry_dispatch()
+        print(result9)
+
+        print("\n10. Resuming a checkpointed session past its iteration cap:")
+        result10 = run_session_resume()
+        print(result10)
+
+        print("\n11. Reading typed text, binary and blob payloads:")
+        result11 = run_typed_payloads()
+        print(result11)
+
+        print("\n12. Looking up symbols in the code index:")
+        result12 = run_code_index()
+        print(result12)
+
+        print("\n13. Prefetching sibling files after a directory listing:")
+        result13 = run_prefetch()
+        print(result13)
+
+        print("\n14. Enforcing a session token budget in the scheduler:")
+        result14 = run_scheduler_budget()
+        print(result14)
+
+        print("\n15. Working in a copy-on-write overlay and merging it:")
+        result15 = run_overlay_workspace()
+        print(result15)
+
+        print("\n16. Writing sampled, size-capped JSON logs off-thread:")
+        result16 = run_structured_logging()
+        print(result16)
+
+        print("\n17. Isolating in-process runs (logging and timeouts):")
+        result17 = run_inprocess_isolation()
+        print(result17)
+
+        print("\n18. Falling back from rejected prompt caches only:")
+        result18 = run_prompt_cache_index()
+        print(result18)
+
+        print("\n19. Routing turns between the fast and strong models:")
+        result19 = run_model_routing()
+        print(result19)
+
+        print("\n20. Cleaning up after a session whose model call fails:")
+        result20 = run_failed_session()
+        print(result20)
+
         print("\n✅ All tests completed successfully!")
     except Exception as exc:
         logger.error(f"Test execution failed: {exc}")
         print(f"❌ Test failed: {exc}")
+        sys.exit(1)
 
 
 if __name__ == "__main__":